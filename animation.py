@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Конвертация анимированных WebP в APNG или последовательность PNG кадров
+
+Кадры декодируются и записываются по одному, поэтому потребление памяти
+пропорционально размеру одного кадра, а не всей анимации.
+"""
+
+import io
+import os
+import time
+import struct
+
+from atomic_files import atomic_output
+from image_ops import prepare_image
+from png_chunks import PNG_SIGNATURE, make_chunk, iter_chunks
+from png_presets import png_save_options
+from profiling import NULL_PROFILER
+from resize import resize_image
+
+ANIMATION_MODES = ('apng', 'frames', 'first')
+DEFAULT_ANIMATION_MODE = 'apng'
+
+# Кадры WebP приходят из libwebp уже собранными на полном холсте,
+# поэтому каждый кадр APNG целиком заменяет предыдущий
+APNG_DISPOSE_OP_NONE = 0
+APNG_BLEND_OP_SOURCE = 0
+
+
+def is_animated(img):
+    """Проверяет, содержит ли изображение больше одного кадра"""
+    return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+
+
+class APNGWriter:
+    """
+    Потоковая запись APNG: каждый кадр сжимается и сразу пишется в файл
+
+    Args:
+        fp: Файл, открытый на запись в двоичном режиме
+        num_frames (int): Количество кадров (записывается в заголовок acTL)
+        loop (int): Количество повторов, 0 - бесконечно
+        png_options (dict, optional): Параметры сжатия PNG для каждого кадра
+    """
+
+    def __init__(self, fp, num_frames, loop=0, png_options=None):
+        self.fp = fp
+        self.num_frames = num_frames
+        self.loop = loop
+        self.png_options = png_options if png_options is not None else png_save_options()
+        self.sequence = 0
+        self.frames_written = 0
+        self.header = None
+
+    def add_frame(self, img, duration_ms):
+        """
+        Добавляет кадр
+
+        Args:
+            img (PIL.Image.Image): Кадр; режим и размер должны совпадать с первым кадром
+            duration_ms (int): Длительность кадра в миллисекундах
+        """
+        buffer = io.BytesIO()
+        img.save(buffer, 'PNG', **self.png_options)
+        chunks = list(iter_chunks(buffer.getbuffer()))
+        header = next(bytes(data) for tag, data in chunks if tag == b'IHDR')
+
+        if self.header is None:
+            self.header = header
+            self.fp.write(PNG_SIGNATURE)
+            self.fp.write(make_chunk(b'IHDR', header))
+            # Палитра и прочие служебные чанки первого кадра должны идти до acTL/IDAT
+            for tag, data in chunks:
+                if tag not in (b'IHDR', b'IDAT', b'IEND'):
+                    self.fp.write(make_chunk(tag, bytes(data)))
+            self.fp.write(make_chunk(b'acTL', struct.pack('>II', self.num_frames, self.loop)))
+        elif header != self.header:
+            raise ValueError("Кадры анимации различаются по размеру или цветовому режиму")
+
+        width, height = img.size
+        self.fp.write(make_chunk(b'fcTL', struct.pack(
+            '>IIIIIHHBB', self.sequence, width, height, 0, 0,
+            max(0, int(duration_ms)), 1000, APNG_DISPOSE_OP_NONE, APNG_BLEND_OP_SOURCE)))
+        self.sequence += 1
+
+        for tag, data in chunks:
+            if tag != b'IDAT':
+                continue
+            if self.frames_written == 0:
+                # Первый кадр одновременно является изображением по умолчанию
+                self.fp.write(make_chunk(b'IDAT', bytes(data)))
+            else:
+                self.fp.write(make_chunk(b'fdAT', struct.pack('>I', self.sequence) + bytes(data)))
+                self.sequence += 1
+        self.frames_written += 1
+
+    def close(self):
+        """Завершает файл чанком IEND"""
+        self.fp.write(make_chunk(b'IEND', b''))
+
+
+def animation_outputs(output_path, mode, frame_count):
+    """Выходные файлы, записанные save_animation"""
+    if mode == 'frames':
+        base_name = os.path.splitext(output_path)[0]
+        return [f"{base_name}_{index:04d}.png" for index in range(frame_count)]
+    return [output_path]
+
+
+def iter_frames(img, keep_alpha, background, profiler, size=None):
+    """Перебирает кадры по одному, приводя их к единому режиму и размеру size (см. resize.py)"""
+    mode = None
+    for index in range(img.n_frames):
+        with profiler.stage('decode'):
+            img.seek(index)
+            img.load()
+        frame = img
+        if size is not None:
+            with profiler.stage('resize'):
+                frame = resize_image(img, size)
+        with profiler.stage('convert'):
+            frame = prepare_image(frame, keep_alpha, background)
+            if mode is None:
+                mode = frame.mode
+            elif frame.mode != mode:
+                frame = frame.convert(mode)
+        yield frame, img.info.get('duration', 0)
+
+
+def save_animation(img, output_path, mode=DEFAULT_ANIMATION_MODE, png_options=None,
+                   keep_alpha=False, background=None, profiler=NULL_PROFILER, size=None):
+    """
+    Сохраняет анимированное изображение покадрово
+
+    Args:
+        img (PIL.Image.Image): Открытое анимированное изображение
+        output_path (str): Путь к выходному файлу. В режиме frames кадры
+            сохраняются рядом как name_0000.png, name_0001.png, ...
+        mode (str): apng - один файл APNG, frames - отдельные PNG кадры
+        png_options (dict, optional): Параметры сжатия PNG
+        keep_alpha (bool): Сохранить прозрачность
+        background (tuple, optional): Цвет фона для удаления прозрачности
+        profiler (profiling.StageProfiler, optional): Замер времени по этапам
+        size (str, optional): Уменьшить кадры до размера WxH или Fx (см. resize.py)
+
+    Returns:
+        tuple: (количество кадров, секунды на всю анимацию)
+    """
+    if png_options is None:
+        png_options = png_save_options()
+
+    started = time.perf_counter()
+    frames = iter_frames(img, keep_alpha, background, profiler, size)
+
+    if mode == 'frames':
+        base_name = os.path.splitext(output_path)[0]
+        count = 0
+        for count, (frame, _) in enumerate(frames, 1):
+            with profiler.stage('encode'), atomic_output(f"{base_name}_{count - 1:04d}.png") as temp_path:
+                frame.save(temp_path, 'PNG', **png_options)
+        return count, time.perf_counter() - started
+
+    with atomic_output(output_path) as temp_path, open(temp_path, 'wb') as f:
+        writer = APNGWriter(f, img.n_frames, img.info.get('loop', 0), png_options)
+        for frame, duration in frames:
+            with profiler.stage('encode'):
+                writer.add_frame(frame, duration)
+        writer.close()
+    return writer.frames_written, time.perf_counter() - started
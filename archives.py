@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Конвертация WebP внутри zip и tar архивов без распаковки на диск
+
+Элементы декодируются прямо из архива, а PNG пишутся прямо в выходной
+архив (zip или tar) или в папку. Zip допускает произвольный доступ, поэтому
+рабочие процессы сами открывают архив и читают свои элементы параллельно,
+а через канал пула передается только имя элемента. Tar читается
+последовательно в основном процессе (в том числе из канала), а элементы
+передаются в пул уже прочитанными.
+
+Результаты пишутся в порядке исходного архива; одновременно в работе не
+больше max_pending элементов и не больше buffer_bytes исходных данных.
+Элементы, не являющиеся WebP, переносятся в результат без изменений.
+"""
+
+import io
+import os
+import time
+import collections
+
+from atomic_files import atomic_output
+from batch import FileResult
+from discovery import is_webp_name
+from io_pipeline import convert_buffer, DEFAULT_IO_BUFFER_BYTES
+
+ZIP_EXTENSIONS = ('.zip',)
+# Расширение tar архива -> сжатие при записи
+TAR_EXTENSIONS = {
+    '.tar': '',
+    '.tar.gz': 'gz',
+    '.tgz': 'gz',
+    '.tar.bz2': 'bz2',
+    '.tbz2': 'bz2',
+    '.tar.xz': 'xz',
+    '.txz': 'xz',
+}
+# Самая ранняя дата, которую можно записать в zip
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def archive_format(path):
+    """
+    Определяет формат архива по расширению
+
+    Returns:
+        str: zip, tar или None, если путь не похож на архив
+    """
+    name = path.lower()
+    if name.endswith(ZIP_EXTENSIONS):
+        return 'zip'
+    if name.endswith(tuple(TAR_EXTENSIONS)):
+        return 'tar'
+    return None
+
+
+def default_output_path(archive_path):
+    """Выходной архив рядом с исходным: photos.zip -> photos_png.zip"""
+    name = archive_path.lower()
+    for extension in sorted(ZIP_EXTENSIONS + tuple(TAR_EXTENSIONS), key=len, reverse=True):
+        if name.endswith(extension):
+            base = archive_path[:-len(extension)]
+            return f"{base}_png{archive_path[-len(extension):]}"
+    return f"{archive_path}_png"
+
+
+def safe_member_path(name):
+    """
+    Относительный путь элемента для записи в папку
+
+    Raises:
+        ValueError: Абсолютный путь или выход за пределы папки через '..'
+    """
+    parts = name.replace('\\', '/').split('/')
+    if name.startswith(('/', '\\')) or (parts and ':' in parts[0]) or '..' in parts:
+        raise ValueError(f"Небезопасный путь элемента архива: {name}")
+    return os.path.join(*[part for part in parts if part not in ('', '.')])
+
+
+class ArchiveMember:
+    """
+    Элемент архива
+
+    Attributes:
+        name (str): Путь внутри архива
+        size (int): Размер несжатых данных
+        mtime (float): Время изменения
+        mode (int): Права доступа
+        is_dir (bool): Элемент является папкой
+        is_file (bool): Элемент является обычным файлом
+        source: Исходный TarInfo или ZipInfo (для переноса без изменений)
+    """
+
+    __slots__ = ('name', 'size', 'mtime', 'mode', 'is_dir', 'is_file', 'source')
+
+    def __init__(self, name, size=0, mtime=0.0, mode=0o644, is_dir=False, is_file=True, source=None):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.mode = mode
+        self.is_dir = is_dir
+        self.is_file = is_file
+        self.source = source
+
+    @property
+    def is_webp(self):
+        return self.is_file and is_webp_name(self.name)
+
+
+# Открытые в рабочем процессе zip архивы: каждый процесс открывает архив один раз
+_open_zips = {}
+
+
+def convert_zip_member(archive_path, name, **convert_options):
+    """
+    Читает элемент zip архива и конвертирует его в памяти
+
+    Выполняется в рабочем процессе: архив открывается в самом процессе,
+    поэтому элементы читаются параллельно без передачи данных через канал пула.
+
+    Returns:
+        tuple: (список (имя, байты PNG), словарь {этап: секунды})
+    """
+    import zipfile
+
+    archive = _open_zips.get(archive_path)
+    if archive is None:
+        archive = _open_zips[archive_path] = zipfile.ZipFile(archive_path)
+    started = time.perf_counter()
+    data = archive.read(name)
+    read_seconds = time.perf_counter() - started
+    outputs, timings = convert_buffer(name, data, **convert_options)
+    return outputs, dict(timings, read=read_seconds)
+
+
+class ZipReader:
+    """
+    Чтение zip архива с произвольным доступом
+
+    Args:
+        path (str): Путь к zip архиву
+    """
+
+    format = 'zip'
+
+    def __init__(self, path):
+        import zipfile
+
+        self.path = os.path.abspath(path)
+        self._archive = zipfile.ZipFile(self.path)
+
+    def __iter__(self):
+        for info in self._archive.infolist():
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            mode = (info.external_attr >> 16) & 0o7777 or (0o755 if info.is_dir() else 0o644)
+            yield ArchiveMember(info.filename, info.file_size, mtime, mode,
+                                is_dir=info.is_dir(), is_file=not info.is_dir(), source=info)
+
+    def read(self, member):
+        return self._archive.read(member.source)
+
+    def task(self, member):
+        """Функция и аргументы для конвертации элемента в рабочем процессе"""
+        return convert_zip_member, (self.path, member.name)
+
+    def close(self):
+        self._archive.close()
+        archive = _open_zips.pop(self.path, None)  # Открыт при конвертации в текущем процессе
+        if archive is not None:
+            archive.close()
+
+
+class TarReader:
+    """
+    Последовательное чтение tar архива (в том числе сжатого и из канала)
+
+    Args:
+        fileobj: Двоичный поток с tar архивом; перемотка не нужна
+        owned (bool): Закрыть fileobj вместе с архивом
+    """
+
+    format = 'tar'
+
+    def __init__(self, fileobj, owned=False):
+        import tarfile
+
+        self._fileobj = fileobj if owned else None
+        try:
+            self._archive = tarfile.open(fileobj=fileobj, mode='r|*')
+        except BaseException:
+            self.close_fileobj()
+            raise
+        self._data = None
+
+    def __iter__(self):
+        for info in self._archive:
+            # В потоковом режиме данные элемента доступны только до перехода к следующему
+            self._data = self._archive.extractfile(info).read() if info.isfile() else None
+            yield ArchiveMember(info.name, info.size, info.mtime, info.mode,
+                                is_dir=info.isdir(), is_file=info.isfile(), source=info)
+
+    def read(self, member):
+        return self._data
+
+    def task(self, member):
+        return convert_buffer, (member.name, self._data)
+
+    def close_fileobj(self):
+        if self._fileobj is not None:
+            self._fileobj.close()
+            self._fileobj = None
+
+    def close(self):
+        self._archive.close()
+        self.close_fileobj()
+
+
+class TarWriter:
+    """
+    Потоковая запись tar архива
+
+    Args:
+        fileobj: Двоичный поток для записи
+        compression (str): '', 'gz', 'bz2' или 'xz'
+    """
+
+    def __init__(self, fileobj, compression=''):
+        import tarfile
+
+        self._tarfile = tarfile
+        self._archive = tarfile.open(fileobj=fileobj, mode=f'w|{compression}', format=tarfile.PAX_FORMAT)
+
+    def add(self, name, data, member):
+        """Добавляет файл name с данными data и временем и правами исходного элемента"""
+        info = self._tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = member.mtime
+        info.mode = member.mode
+        source = member.source
+        if isinstance(source, self._tarfile.TarInfo):
+            info.uid, info.gid = source.uid, source.gid
+            info.uname, info.gname = source.uname, source.gname
+        self._archive.addfile(info, io.BytesIO(data))
+        return name
+
+    def copy(self, member, data):
+        """Переносит элемент, не являющийся WebP, без изменений"""
+        if isinstance(member.source, self._tarfile.TarInfo):
+            self._archive.addfile(member.source, io.BytesIO(data) if data is not None else None)
+        elif member.is_dir:
+            info = self._tarfile.TarInfo(member.name.rstrip('/'))
+            info.type = self._tarfile.DIRTYPE
+            info.mtime, info.mode = member.mtime, member.mode
+            self._archive.addfile(info)
+        else:
+            self.add(member.name, data, member)
+
+    def close(self):
+        self._archive.close()
+
+
+class ZipWriter:
+    """
+    Запись zip архива; PNG уже сжат, поэтому хранится без повторного сжатия
+
+    Args:
+        fileobj: Двоичный поток для записи (перемотка не обязательна)
+    """
+
+    def __init__(self, fileobj):
+        import zipfile
+
+        self._zipfile = zipfile
+        self._archive = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED)
+
+    def _info(self, name, member):
+        date_time = max(time.localtime(member.mtime)[:6], ZIP_EPOCH)
+        info = self._zipfile.ZipInfo(name, date_time)
+        info.external_attr = (member.mode & 0o7777) << 16
+        return info
+
+    def add(self, name, data, member):
+        self._archive.writestr(self._info(name, member), data, compress_type=self._zipfile.ZIP_STORED)
+        return name
+
+    def copy(self, member, data):
+        if member.is_dir:
+            name = member.name.rstrip('/') + '/'
+            self._archive.writestr(self._info(name, member), b'')
+        elif member.is_file:
+            compress_type = getattr(member.source, 'compress_type', self._zipfile.ZIP_DEFLATED)
+            self._archive.writestr(self._info(member.name, member), data, compress_type=compress_type)
+        # Ссылки и специальные файлы tar в zip не переносятся
+
+    def close(self):
+        self._archive.close()
+
+
+class DirectoryWriter:
+    """
+    Запись результата в папку с сохранением структуры архива
+
+    Args:
+        root (str): Папка назначения (создается при необходимости)
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.join(self.root, safe_member_path(name))
+        os.makedirs(os.path.dirname(path) or self.root, exist_ok=True)
+        return path
+
+    def add(self, name, data, member):
+        path = self._path(name)
+        with atomic_output(path) as temp_path, open(temp_path, 'wb') as f:
+            f.write(data)
+        os.utime(path, (member.mtime, member.mtime))
+        return path
+
+    def copy(self, member, data):
+        if member.is_dir:
+            os.makedirs(os.path.join(self.root, safe_member_path(member.name)), exist_ok=True)
+        elif member.is_file:
+            self.add(member.name, data, member)
+
+    def close(self):
+        pass
+
+
+def open_reader(path, fileobj=None):
+    """
+    Открывает архив для чтения
+
+    Args:
+        path (str): Путь к архиву (формат определяется по расширению, иначе tar)
+        fileobj: Уже открытый поток; zip требует произвольного доступа, поэтому
+            поток всегда читается как tar
+    """
+    if fileobj is not None:
+        return TarReader(fileobj)
+    if archive_format(path) == 'zip':
+        return ZipReader(path)
+    return TarReader(open(path, 'rb'), owned=True)
+
+
+def open_writer(path, output_format, fileobj=None):
+    """
+    Создает получателя результата
+
+    Args:
+        path (str): Путь к выходному архиву или папке
+        output_format (str): zip, tar или dir
+        fileobj: Поток для записи архива (для dir не используется)
+    """
+    if output_format == 'dir':
+        return DirectoryWriter(path)
+    if output_format == 'zip':
+        return ZipWriter(fileobj)
+    name = path.lower()
+    compression = next((compression for extension, compression in TAR_EXTENSIONS.items()
+                        if name.endswith(extension)), '')
+    return TarWriter(fileobj, compression)
+
+
+def _run_now(func, *args, **kwargs):
+    """Выполняет func в текущем процессе и возвращает завершенный Future"""
+    from concurrent.futures import Future
+
+    future = Future()
+    try:
+        future.set_result(func(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def convert_members(reader, writer, jobs=None, max_pending=None,
+                    buffer_bytes=DEFAULT_IO_BUFFER_BYTES, **convert_options):
+    """
+    Конвертирует WebP элементы архива reader и записывает результат в writer
+
+    Args:
+        reader: ZipReader или TarReader
+        writer: ZipWriter, TarWriter или DirectoryWriter
+        jobs (int, optional): Количество процессов (по умолчанию число ядер CPU).
+            При jobs=1 элементы конвертируются в текущем процессе
+        max_pending (int, optional): Сколько элементов одновременно в работе
+            (по умолчанию jobs * PENDING_PER_JOB)
+        buffer_bytes (int): Лимит объема исходных данных элементов в работе
+        **convert_options: Параметры convert_buffer (png_options, keep_alpha, sizes и т.д.)
+
+    Yields:
+        batch.FileResult: Результат по каждому WebP элементу в порядке архива;
+            outputs содержит записанные элементы (или пути в папке)
+    """
+    from parallel import default_jobs, PENDING_PER_JOB
+
+    if jobs is None:
+        jobs = default_jobs()
+    if max_pending is None:
+        max_pending = max(1, jobs) * PENDING_PER_JOB
+    # Запись полосами (banded_png) идет прямо в файл на диске, здесь изображение остается в памяти
+    convert_options = dict(convert_options, low_memory_pixels=None)
+
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    # Элементы в порядке архива: (элемент, future результата или None, данные, размер)
+    pending = collections.deque()
+    pending_bytes = 0
+
+    def emit():
+        nonlocal pending_bytes
+        member, future, data, size = pending.popleft()
+        pending_bytes -= size
+        if future is None:
+            writer.copy(member, data)
+            return None
+        record = FileResult(member.name, input_bytes=member.size)
+        try:
+            outputs, timings = future.result()
+            for name, png_data in outputs:
+                record.outputs.append(writer.add(name, png_data, member))
+                record.output_bytes += len(png_data)
+        except Exception as e:
+            record.error = str(e)
+            return record
+        record.status = 'converted'
+        record.timings = timings
+        record.seconds = sum(timings.values())
+        return record
+
+    try:
+        for member in reader:
+            future = data = None
+            if member.is_webp:
+                func, args = reader.task(member)
+                if executor is not None:
+                    future = executor.submit(func, *args, **convert_options)
+                else:
+                    future = _run_now(func, *args, **convert_options)
+                size = member.size
+            else:
+                data = reader.read(member) if member.is_file else None
+                size = len(data) if data is not None else 0
+            pending.append((member, future, data, size))
+            pending_bytes += size
+
+            # Ограничение памяти: дописываем самые старые элементы, пока в работе слишком много
+            while pending and (len(pending) > max_pending or pending_bytes > buffer_bytes):
+                record = emit()
+                if record is not None:
+                    yield record
+        while pending:
+            record = emit()
+            if record is not None:
+                yield record
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def convert_archive(input_path, output_path=None, jobs=None, stdout=None, stdin=None,
+                    buffer_bytes=DEFAULT_IO_BUFFER_BYTES, **convert_options):
+    """
+    Конвертирует архив WebP в архив PNG или папку
+
+    Args:
+        input_path (str): Путь к zip или tar архиву, '-' - tar архив из stdin
+        output_path (str, optional): Выходной архив (.zip, .tar, .tar.gz, ...), папка
+            или '-' (stdout, в формате входного архива). По умолчанию архив рядом
+            с исходным (photos.zip -> photos_png.zip)
+        jobs (int, optional): Количество процессов
+        stdout: Двоичный поток для '-' (по умолчанию sys.stdout.buffer)
+        stdin: Двоичный поток для '-' (по умолчанию sys.stdin.buffer)
+        buffer_bytes (int): Лимит объема исходных данных элементов в работе
+        **convert_options: Параметры convert_buffer
+
+    Yields:
+        batch.FileResult: Результат по каждому WebP элементу в порядке архива
+    """
+    import sys
+
+    if input_path == '-':
+        reader = open_reader(input_path, stdin if stdin is not None else sys.stdin.buffer)
+    else:
+        reader = open_reader(input_path)
+    if output_path is None:
+        output_path = default_output_path(input_path)
+    try:
+        if output_path == '-':
+            output_format = reader.format
+        else:
+            output_format = archive_format(output_path) or 'dir'
+
+        if output_format == 'dir':
+            writer = open_writer(output_path, 'dir')
+            try:
+                yield from convert_members(reader, writer, jobs, buffer_bytes=buffer_bytes, **convert_options)
+            finally:
+                writer.close()
+        elif output_path == '-':
+            target = stdout if stdout is not None else sys.stdout.buffer
+            writer = open_writer(output_path, output_format, target)
+            yield from convert_members(reader, writer, jobs, buffer_bytes=buffer_bytes, **convert_options)
+            writer.close()
+            target.flush()
+        else:
+            # Архив публикуется под итоговым именем только после полной записи
+            with atomic_output(output_path) as temp_path, open(temp_path, 'wb') as f:
+                writer = open_writer(output_path, output_format, f)
+                yield from convert_members(reader, writer, jobs, buffer_bytes=buffer_bytes, **convert_options)
+                writer.close()
+    finally:
+        reader.close()
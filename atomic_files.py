@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Атомарная запись выходных файлов
+
+Файл пишется под временным именем и переименовывается в итоговое только
+после успешной записи, поэтому при сбое под итоговым именем не остается
+обрезанного PNG.
+"""
+
+import os
+import contextlib
+
+TEMP_SUFFIX = '.tmp'
+
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """
+    Контекст, выдающий временный путь для записи и публикующий его как path
+
+    При исключении временный файл удаляется, а существующий path не изменяется.
+
+    Yields:
+        str: Временный путь рядом с path
+    """
+    temp_path = path + TEMP_SUFFIX
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fsync_file(path):
+    """Сбрасывает содержимое файла на диск"""
+    # В Windows FlushFileBuffers требует доступа на запись
+    fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Запись PNG полосами строк для очень больших изображений
+
+Обычный путь держит в памяти одновременно декодированное изображение,
+полноразмерный холст для удаления прозрачности и буферы кодировщика.
+Здесь изображение обрабатывается полосами по band_rows строк: каждая полоса
+подготавливается, фильтруется Pillow и дожимается общим потоком zlib, так что
+сверх декодированного изображения расходуется память только на одну полосу.
+"""
+
+import io
+import zlib
+
+from atomic_files import atomic_output
+from image_ops import prepare_image
+from png_chunks import PNG_SIGNATURE, make_chunk, iter_chunks
+from png_presets import png_save_options
+
+# Порог в пикселях, начиная с которого низкопамятный режим включается автоматически
+DEFAULT_LOW_MEMORY_PIXELS = 40_000_000
+DEFAULT_BAND_ROWS = 256
+IDAT_CHUNK_SIZE = 1024 * 1024
+
+
+def use_low_memory(img, low_memory_pixels=DEFAULT_LOW_MEMORY_PIXELS):
+    """
+    Решает, записывать ли изображение полосами
+
+    Args:
+        img (PIL.Image.Image): Изображение
+        low_memory_pixels (int, optional): Порог площади в пикселях;
+            0 - всегда, None - никогда
+
+    Returns:
+        bool: True если нужен низкопамятный режим
+    """
+    if low_memory_pixels is None:
+        return False
+    width, height = img.size
+    return width * height >= low_memory_pixels
+
+
+def _zlib_compressor(png_options):
+    level = png_options.get('compress_level', 9 if png_options.get('optimize') else 6)
+    strategy = png_options.get('compress_type', zlib.Z_DEFAULT_STRATEGY)
+    if level < 0:
+        level = 6
+    if strategy < 0:
+        strategy = zlib.Z_DEFAULT_STRATEGY
+    return zlib.compressobj(level, zlib.DEFLATED, 15, 9, strategy)
+
+
+def _filtered_rows(band):
+    """
+    Кодирует полосу средствами Pillow без сжатия и возвращает
+    отфильтрованные строки вместе с байтом фильтра и служебные чанки
+    """
+    buffer = io.BytesIO()
+    band.save(buffer, 'PNG', compress_level=0)
+    header = None
+    extra_chunks = []
+    compressed = []
+    for tag, data in iter_chunks(buffer.getbuffer()):
+        if tag == b'IHDR':
+            header = bytes(data)
+        elif tag == b'IDAT':
+            compressed.append(bytes(data))
+        elif tag != b'IEND':
+            extra_chunks.append((tag, bytes(data)))
+    return header, extra_chunks, zlib.decompress(b''.join(compressed))
+
+
+def save_png_banded(img, output_path, png_options=None, keep_alpha=False, background=None,
+                    band_rows=DEFAULT_BAND_ROWS):
+    """
+    Сохраняет изображение в PNG полосами строк
+
+    Каждая полоса вырезается с одной дополнительной строкой сверху: фильтры PNG
+    (Up, Average, Paeth) ссылаются на предыдущую строку, поэтому первая строка
+    полосы кодируется относительно настоящей предыдущей строки изображения и
+    затем отбрасывается.
+
+    Args:
+        img (PIL.Image.Image): Декодированное изображение
+        output_path (str): Путь для выходного файла
+        png_options (dict, optional): Параметры сжатия (см. png_presets.png_save_options)
+        keep_alpha (bool): Сохранить прозрачность
+        background (tuple, optional): Цвет фона для удаления прозрачности
+        band_rows (int): Количество строк в полосе
+    """
+    if png_options is None:
+        png_options = png_save_options()
+
+    width, height = img.size
+    compressor = _zlib_compressor(png_options)
+    pending = []
+    pending_size = 0
+
+    with atomic_output(output_path) as temp_path, open(temp_path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        for top in range(0, height, band_rows):
+            bottom = min(height, top + band_rows)
+            overlap = 1 if top > 0 else 0
+            band = prepare_image(img.crop((0, top - overlap, width, bottom)), keep_alpha, background)
+            header, extra_chunks, rows = _filtered_rows(band)
+            del band
+
+            if top == 0:
+                # Заголовок итогового файла: высота всего изображения вместо высоты полосы
+                f.write(make_chunk(b'IHDR', header[:4] + height.to_bytes(4, 'big') + header[8:]))
+                for tag, data in extra_chunks:
+                    f.write(make_chunk(tag, data))
+
+            stride = len(rows) // (bottom - top + overlap)
+            data = compressor.compress(memoryview(rows)[overlap * stride:])
+            del rows
+            if data:
+                pending.append(data)
+                pending_size += len(data)
+            if pending_size >= IDAT_CHUNK_SIZE:
+                f.write(make_chunk(b'IDAT', b''.join(pending)))
+                pending, pending_size = [], 0
+
+        pending.append(compressor.flush())
+        f.write(make_chunk(b'IDAT', b''.join(pending)))
+        f.write(make_chunk(b'IEND', b''))
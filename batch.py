@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пакетная конвертация как API: записи о результатах вместо печати по файлу
+
+convert_batch() конвертирует набор файлов и возвращает на каждый файл запись
+FileResult: статус, время этапов, размеры входа и выхода, текст ошибки.
+BatchReport собирает записи пакета, показывает однострочный прогресс со
+скоростью и оставшимся временем (--quiet) и формирует итог в JSON (--json).
+
+Пример:
+    from batch import convert_batch
+
+    for result in convert_batch('photos/', jobs=4, keep_alpha=True):
+        if not result.ok:
+            print(result.path, result.error)
+"""
+
+import os
+import sys
+import time
+
+STATUSES = ('converted', 'duplicate', 'skipped', 'failed')
+# Строка прогресса перерисовывается не чаще, чем раз в PROGRESS_INTERVAL секунд
+PROGRESS_INTERVAL = 0.25
+
+
+class FileResult:
+    """
+    Результат обработки одного файла
+
+    Записи передаются из рабочих процессов и копятся на весь пакет, поэтому
+    объявлены через __slots__: без словаря атрибутов они заметно компактнее.
+
+    Attributes:
+        path (str): Путь к исходному файлу
+        status (str): converted, duplicate (создан из дубликата), skipped
+            (уже сконвертирован) или failed
+        outputs (list): Созданные выходные файлы
+        input_bytes (int): Размер исходного файла
+        output_bytes (int): Суммарный размер выходных файлов
+        seconds (float): Время обработки файла
+        timings (dict): Время по этапам {этап: секунды}
+        error (str): Текст ошибки или предупреждения, None если их не было
+        saved_bytes (int): На сколько байт PNG меньше обычного сжатия (--smallest)
+    """
+
+    __slots__ = ('path', 'status', 'outputs', 'input_bytes', 'output_bytes', 'seconds', 'timings', 'error',
+                 'saved_bytes')
+
+    def __init__(self, path, status='failed', outputs=None, input_bytes=0, output_bytes=0,
+                 seconds=0.0, timings=None, error=None, saved_bytes=0):
+        self.path = path
+        self.status = status
+        self.outputs = outputs if outputs is not None else []
+        self.input_bytes = input_bytes
+        self.output_bytes = output_bytes
+        self.seconds = seconds
+        self.timings = timings if timings is not None else {}
+        self.error = error
+        self.saved_bytes = saved_bytes
+
+    @property
+    def ok(self):
+        """True если файл не завершился ошибкой"""
+        return self.status != 'failed'
+
+    def to_dict(self):
+        """Запись в виде словаря для JSON"""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"FileResult({self.path!r}, {self.status!r})"
+
+
+def output_size(outputs):
+    """Суммарный размер существующих выходных файлов"""
+    total = 0
+    for output in outputs:
+        try:
+            total += os.path.getsize(output)
+        except OSError:
+            pass
+    return total
+
+
+def convert_file(convert_func, path, **kwargs):
+    """
+    Конвертирует файл без печати и возвращает запись о результате
+
+    Объявлена на уровне модуля, чтобы её можно было передать в пул процессов
+    через functools.partial(convert_file, convert_webp_to_png).
+
+    Args:
+        convert_func (callable): convert_webp_to_png одного из конвертеров
+        path (str): Путь к WebP файлу
+        **kwargs: Параметры convert_func
+
+    Returns:
+        FileResult: Результат конвертации
+    """
+    from profiling import StageProfiler
+
+    record = FileResult(path)
+    try:
+        record.input_bytes = os.path.getsize(path)
+    except OSError:
+        pass
+    kwargs.setdefault('quiet', True)
+    profiler = StageProfiler()
+    started = time.perf_counter()
+    if convert_func(path, profiler=profiler, result=record, **kwargs):
+        record.status = 'converted'
+    record.seconds = time.perf_counter() - started
+    record.timings = profiler.timings
+    record.output_bytes = output_size(record.outputs)
+    return record
+
+
+def as_record(path, result):
+    """Приводит результат рабочей функции к FileResult (при падении процесса пула приходит исключение)"""
+    if isinstance(result, FileResult):
+        return result
+    if isinstance(result, Exception):
+        return FileResult(path, error=f"Ошибка в рабочем процессе: {result}")
+    return FileResult(path, 'converted' if result else 'failed',
+                      error=None if result else 'рабочий процесс завершился с ошибкой')
+
+
+def convert_batch(paths, jobs=None, convert_func=None, **kwargs):
+    """
+    Конвертирует файлы в пуле процессов и возвращает записи о результатах
+
+    Args:
+        paths (iterable or str): Пути к WebP файлам или директория (обходится рекурсивно)
+        jobs (int, optional): Количество процессов (по умолчанию число ядер CPU)
+        convert_func (callable, optional): Функция конвертации
+            (по умолчанию conversion.convert_webp_to_png)
+        **kwargs: Параметры convert_func (delete_original, png_options, keep_alpha, sizes и т.д.)
+
+    Yields:
+        FileResult: Результаты в порядке завершения
+    """
+    from functools import partial
+    from parallel import run_conversions
+
+    if convert_func is None:
+        from conversion import convert_webp_to_png as convert_func
+    if isinstance(paths, str):
+        from discovery import iter_webp_files
+
+        paths = iter_webp_files(paths)
+    for path, result in run_conversions(partial(convert_file, convert_func), paths, jobs, **kwargs):
+        yield as_record(path, result)
+
+
+def format_duration(seconds):
+    """Форматирует длительность как Ч:ММ:СС"""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class BatchReport:
+    """
+    Итоги пакета по записям FileResult и однострочный прогресс
+
+    Прогресс перерисовывается не чаще PROGRESS_INTERVAL и только если stream
+    является терминалом, поэтому на пакете из сотен тысяч файлов вывод не
+    становится узким местом. Ошибки печатаются отдельными строками над прогрессом.
+
+    Args:
+        progress (bool): Показывать строку прогресса
+        stream: Поток для прогресса и ошибок (по умолчанию sys.stderr)
+        keep_records (bool): Хранить записи всех файлов (для JSON с подробностями)
+    """
+
+    def __init__(self, progress=True, stream=None, keep_records=False):
+        self.stream = stream if stream is not None else sys.stderr
+        self.progress = progress and self.stream.isatty()
+        self.keep_records = keep_records
+        self.clear()
+
+    def clear(self):
+        """Сбрасывает накопленные результаты перед повторным запуском пакета"""
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.records = [] if self.keep_records else None
+        self.failures = []
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.saved_bytes = 0
+        self.stages = {}
+        self.found = 0
+        self.scan_complete = False
+        self.started = time.perf_counter()
+        self._last_draw = 0.0
+        self._line_width = 0
+
+    def track(self, files):
+        """Считает поданные на конвертацию файлы, чтобы оценивать оставшееся время"""
+        for path in files:
+            self.found += 1
+            yield path
+        self.scan_complete = True
+
+    def add(self, record):
+        """Учитывает результат файла"""
+        self.counts[record.status] += 1
+        self.input_bytes += record.input_bytes
+        self.output_bytes += record.output_bytes
+        self.saved_bytes += record.saved_bytes
+        for stage, seconds in record.timings.items():
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.records is not None:
+            self.records.append(record)
+        if not record.ok:
+            self.failures.append(record)
+            self.message(f"❌ Ошибка при конвертации {record.path}: {record.error or 'неизвестная ошибка'}")
+        self._draw()
+
+    def skipped(self, count):
+        """Учитывает файлы, пропущенные без конвертации (кэш)"""
+        self.counts['skipped'] += count
+
+    @property
+    def processed(self):
+        """Сколько поданных на конвертацию файлов уже обработано"""
+        return self.counts['converted'] + self.counts['failed'] + self.counts['skipped']
+
+    def message(self, text):
+        """Печатает строку, не разрывая строку прогресса"""
+        if self.progress and self._line_width:
+            self.stream.write('\r' + ' ' * self._line_width + '\r')
+            self._line_width = 0
+        self.stream.write(text + '\n')
+        self._draw(force=True)
+
+    def progress_line(self):
+        """Текст строки прогресса: обработано, скорость и оставшееся время"""
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        processed = self.processed
+        rate = processed / elapsed
+        if self.scan_complete and self.found:
+            line = f"[{processed}/{self.found}] {processed / self.found:.0%}"
+        else:
+            line = f"[{processed}/{self.found}+]"
+        line += f" {rate:.1f} файл/с, {self.input_bytes / elapsed / 1e6:.1f} МБ/с"
+        if self.counts['failed']:
+            line += f", ошибок {self.counts['failed']}"
+        if self.scan_complete and rate > 0:
+            line += f", осталось {format_duration((self.found - processed) / rate)}"
+        return line
+
+    def _draw(self, force=False):
+        if not self.progress:
+            return
+        now = time.perf_counter()
+        if not force and now - self._last_draw < PROGRESS_INTERVAL:
+            return
+        self._last_draw = now
+        line = self.progress_line()
+        self.stream.write('\r' + line.ljust(self._line_width))
+        self.stream.flush()
+        self._line_width = len(line)
+
+    def close(self):
+        """Дорисовывает итоговую строку прогресса"""
+        if self.progress:
+            self._draw(force=True)
+            self.stream.write('\n')
+            self.stream.flush()
+            self._line_width = 0
+
+    def summary(self):
+        """
+        Итоги пакета
+
+        Returns:
+            dict: Количество файлов по статусам, байты, время, этапы и ошибки
+        """
+        elapsed = time.perf_counter() - self.started
+        summary = {
+            'files': dict(self.counts, total=sum(self.counts.values())),
+            'input_bytes': self.input_bytes,
+            'output_bytes': self.output_bytes,
+            'saved_bytes': self.saved_bytes,
+            'seconds': round(elapsed, 3),
+            'files_per_second': round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+            'stages': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            'failures': [{'path': record.path, 'error': record.error} for record in self.failures],
+        }
+        if self.records is not None:
+            summary['results'] = [record.to_dict() for record in self.records]
+        return summary
+
+    def to_json(self):
+        """Итоги пакета в JSON"""
+        import json
+
+        return json.dumps(self.summary(), ensure_ascii=False, indent=2)
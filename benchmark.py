@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк конвертера WebP в PNG на синтетическом наборе изображений
+
+Примеры:
+  python benchmark.py corpus bench_corpus --count 40 --max-megapixels 24
+  python benchmark.py run bench_corpus --png-speed fastest smallest --jobs 1 4
+  python benchmark.py run bench_corpus --format png jpeg webp tiff --jobs 4
+  python benchmark.py run bench_corpus --json results.json
+  python benchmark.py alpha --size 8000x8000
+  python benchmark.py startup --budget-ms 25
+"""
+
+import os
+import sys
+import math
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import contextlib
+
+from PIL import Image, ImageDraw
+
+import conversion
+from png_presets import PNG_PRESETS
+from encoders import ENCODERS, DEFAULT_FORMAT, get_encoder
+from parallel import default_jobs
+from image_ops import prepare_image
+
+CORPUS_MANIFEST = 'corpus.json'
+MODES = ('RGB', 'RGBA', 'LA', 'P')
+
+
+def _render(rng, size, mode):
+    """Рисует детерминированное изображение: фрактал, градиент и фигуры"""
+    width, height = size
+    x0 = rng.uniform(-2.2, -0.5)
+    y0 = rng.uniform(-1.2, 0.0)
+    span = rng.uniform(0.3, 2.0)
+    base = Image.effect_mandelbrot(size, (x0, y0, x0 + span, y0 + span * height / width), 64)
+    gradient = Image.linear_gradient('L').resize(size)
+    img = Image.merge('RGB', (base, gradient, Image.eval(base, lambda v: 255 - v)))
+
+    draw = ImageDraw.Draw(img)
+    for _ in range(rng.randint(5, 30)):
+        left, top = rng.randrange(width), rng.randrange(height)
+        box = [left, top, left + rng.randint(1, width // 2 + 1), top + rng.randint(1, height // 2 + 1)]
+        draw.ellipse(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+
+    if mode in ('RGBA', 'LA'):
+        img.putalpha(Image.radial_gradient('L').resize(size))
+        if mode == 'LA':
+            img = img.convert('LA')
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.Palette.ADAPTIVE, colors=rng.choice((16, 64, 256)))
+    return img
+
+
+def generate_corpus(directory, count=20, seed=0, max_megapixels=4.0, animated_share=0.1):
+    """
+    Создает воспроизводимый набор WebP файлов разных размеров, режимов и типов сжатия
+
+    Args:
+        directory (str): Папка для набора (создается при необходимости)
+        count (int): Количество файлов
+        seed (int): Зерно генератора случайных чисел
+        max_megapixels (float): Максимальный размер изображения в мегапикселях
+        animated_share (float): Доля анимированных файлов
+
+    Returns:
+        list: Описания созданных файлов (также сохраняются в corpus.json)
+    """
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    entries = []
+
+    for index in range(count):
+        # Логарифмическое распределение площади: много мелких файлов и немного крупных
+        megapixels = min(max_megapixels, 0.01 * (max_megapixels / 0.01) ** rng.random())
+        aspect = rng.uniform(0.5, 2.0)
+        width = max(8, int((megapixels * 1e6 * aspect) ** 0.5))
+        height = max(8, int(megapixels * 1e6 / width))
+        mode = rng.choice(MODES)
+        lossless = rng.random() < 0.3
+        animated = rng.random() < animated_share
+        if animated:
+            # Кадры анимации держим небольшими, чтобы набор генерировался быстро
+            width, height = min(width, 640), min(height, 480)
+
+        name = f"{index:04d}_{mode}_{'lossless' if lossless else 'lossy'}{'_anim' if animated else ''}.webp"
+        path = os.path.join(directory, name)
+        img = _render(rng, (width, height), mode)
+        options = {'lossless': lossless, 'quality': rng.choice((75, 85, 95))}
+        frames = 1
+        if animated:
+            frames = rng.randint(3, 12)
+            extra = [img.rotate(rng.uniform(-30, 30)) for _ in range(frames - 1)]
+            img.save(path, 'WEBP', save_all=True, append_images=extra,
+                     duration=rng.choice((40, 80, 100)), loop=0, **options)
+        else:
+            img.save(path, 'WEBP', **options)
+
+        entries.append({
+            'name': name, 'width': width, 'height': height, 'mode': mode,
+            'lossless': lossless, 'frames': frames, 'bytes': os.path.getsize(path),
+        })
+
+    with open(os.path.join(directory, CORPUS_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump({'seed': seed, 'max_megapixels': max_megapixels, 'files': entries}, f, indent=2)
+    return entries
+
+
+def peak_rss_bytes():
+    """Пиковое потребление памяти текущим процессом и дочерними процессами"""
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    # На Linux ru_maxrss в килобайтах, на macOS - в байтах
+    scale = 1 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * scale
+
+
+def percentile(values, fraction):
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+@contextlib.contextmanager
+def _silenced():
+    """Подавляет построчный вывод конвертера во время замеров"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def _corpus_files(directory):
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.lower().endswith('.webp'))
+
+
+def _remove_outputs(directory, extension='.png'):
+    for name in os.listdir(directory):
+        if name.lower().endswith(extension):
+            os.remove(os.path.join(directory, name))
+
+
+def corpus_megapixels(files):
+    """Мегапиксели всех кадров по заголовкам файлов (для калибровки оценки --scan)"""
+    from webp_header import read_webp_header
+
+    megapixels = 0.0
+    for path in files:
+        header = read_webp_header(path, with_frames=True)
+        megapixels += header.pixels * header.frames / 1e6
+    return megapixels
+
+
+def benchmark_files(files, png_options, output_format=DEFAULT_FORMAT):
+    """
+    Замеряет convert_webp_to_png по отдельности для каждого файла
+
+    Args:
+        files (list): WebP файлы набора
+        png_options (dict): Параметры сохранения выходного формата
+        output_format (str): Выходной формат из encoders.ENCODERS
+
+    Returns:
+        dict: Метрики прогона
+    """
+    latencies = []
+    input_bytes = output_bytes = 0
+    failures = 0
+    with tempfile.TemporaryDirectory() as output_dir:
+        started = time.perf_counter()
+        for path in files:
+            output_path = os.path.join(output_dir, 'out' + get_encoder(output_format).extension)
+            file_started = time.perf_counter()
+            with _silenced():
+                ok = conversion.convert_webp_to_png(path, output_path, png_options=png_options,
+                                                    output_format=output_format)
+            latencies.append(time.perf_counter() - file_started)
+            input_bytes += os.path.getsize(path)
+            failures += not ok
+            if ok and os.path.exists(output_path):
+                # Анимация в APNG пишется одним файлом, кадры (--animation frames) не замеряются
+                output_bytes += os.path.getsize(output_path)
+        elapsed = time.perf_counter() - started
+
+    megapixels = corpus_megapixels(files)
+    return {
+        'files': len(files),
+        'failures': failures,
+        'seconds': elapsed,
+        'megapixels': megapixels,
+        'files_per_sec': len(files) / elapsed if elapsed else None,
+        'mb_per_sec': input_bytes / 1e6 / elapsed if elapsed else None,
+        'megapixels_per_sec': megapixels / elapsed if elapsed else None,
+        'output_bytes': output_bytes,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+    }
+
+
+def benchmark_directory(directory, png_options, jobs, output_format=DEFAULT_FORMAT):
+    """
+    Замеряет process_directory на всем наборе
+
+    Returns:
+        dict: Метрики прогона
+    """
+    extension = get_encoder(output_format).extension
+    files = _corpus_files(directory)
+    input_bytes = sum(os.path.getsize(path) for path in files)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # WebP рядом с исходником получил бы то же имя, поэтому пишется в отдельную папку
+        output_dir = temp_dir if extension == '.webp' else None
+        if output_dir is None:
+            _remove_outputs(directory, extension)
+        started = time.perf_counter()
+        with _silenced():
+            success_count, total_count = conversion.process_directory(
+                directory, jobs=jobs, png_options=png_options, output_format=output_format,
+                output_dir=output_dir)
+        elapsed = time.perf_counter() - started
+        if output_dir is None:
+            _remove_outputs(directory, extension)
+
+    megapixels = corpus_megapixels(files)
+    return {
+        'files': total_count,
+        'failures': total_count - success_count,
+        'seconds': elapsed,
+        'megapixels': megapixels,
+        'files_per_sec': total_count / elapsed if elapsed else None,
+        'mb_per_sec': input_bytes / 1e6 / elapsed if elapsed else None,
+        'megapixels_per_sec': megapixels / elapsed if elapsed else None,
+    }
+
+
+def run_benchmark(directory, speeds=('smallest',), jobs_list=(1,), formats=(DEFAULT_FORMAT,)):
+    """
+    Прогоняет матрицу настроек (формат, пресет, число процессов) и собирает результаты
+
+    Returns:
+        dict: Результаты в машиночитаемом виде
+    """
+    files = _corpus_files(directory)
+    results = {
+        'corpus': os.path.abspath(directory),
+        'python': sys.version.split()[0],
+        'pillow': Image.__version__,
+        'cpu_count': os.cpu_count(),
+        'convert': [],
+        'process_directory': [],
+    }
+
+    for output_format in formats:
+        encoder = get_encoder(output_format)
+        for speed in speeds:
+            options = encoder.save_options(speed)
+            metrics = benchmark_files(files, options, output_format)
+            results['convert'].append(dict(metrics, format=output_format, png_speed=speed))
+            for jobs in jobs_list:
+                metrics = benchmark_directory(directory, options, jobs, output_format)
+                results['process_directory'].append(dict(metrics, format=output_format,
+                                                         png_speed=speed, jobs=jobs))
+
+    results['peak_rss_bytes'] = peak_rss_bytes()
+    return results
+
+
+def _legacy_flatten(img):
+    """Прежний способ удаления прозрачности через img.split() - для сравнения"""
+    background = Image.new('RGB', img.size, (255, 255, 255))
+    background.paste(img, mask=img.split()[-1])
+    return background
+
+
+ALPHA_METHODS = {
+    'split': _legacy_flatten,
+    'flatten': lambda img: prepare_image(img),
+    'keep_alpha': lambda img: prepare_image(img, keep_alpha=True),
+}
+
+
+def _measure_alpha_method(method, size):
+    """Выполняется в отдельном процессе, чтобы пик памяти не зависел от других замеров"""
+    # Без крупных временных копий, чтобы они не попали в исходный пик памяти
+    band = Image.radial_gradient('L').resize(size)
+    img = Image.merge('RGBA', (band, band, band, band))
+    del band
+    rss_before = peak_rss_bytes()
+    started = time.perf_counter()
+    ALPHA_METHODS[method](img)
+    elapsed = time.perf_counter() - started
+    rss_after = peak_rss_bytes()
+    extra = rss_after - rss_before if rss_before is not None else None
+    return elapsed, extra
+
+
+def benchmark_alpha(size=(4000, 4000), repeats=3):
+    """
+    Сравнивает удаление прозрачности через split(), однопроходное наложение и --keep-alpha
+
+    Каждый способ замеряется в свежем процессе: время и прирост пикового RSS.
+
+    Returns:
+        dict: Результаты по каждому способу
+    """
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+    results = {'size': list(size), 'methods': {}}
+    for method in ALPHA_METHODS:
+        runs = []
+        for _ in range(repeats):
+            with context.Pool(1) as pool:
+                runs.append(pool.apply(_measure_alpha_method, (method, size)))
+        times = [elapsed for elapsed, _ in runs]
+        extras = [extra for _, extra in runs if extra is not None]
+        results['methods'][method] = {
+            'seconds_min': min(times),
+            'peak_rss_extra_bytes': max(extras) if extras else None,
+        }
+    return results
+
+
+ENTRY_POINTS = ('webp2png', 'webp_to_png_converter')
+# Бюджет на импорт точки входа: запуск для одного файла не должен тратить
+# заметное время до начала конвертации
+DEFAULT_STARTUP_BUDGET_MS = 25.0
+# Модули, которые не должны загружаться при импорте точек входа
+# (движок conversion подгружается только при конвертации)
+LAZY_MODULES = ('PIL', 'argparse', 'subprocess', 'pathlib', 'json', 'hashlib', 'conversion')
+
+
+def parse_importtime(output):
+    """
+    Разбирает вывод python -X importtime
+
+    Returns:
+        list: Кортежи (модуль, собственное время мкс, накопленное время мкс, глубина)
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure_startup(module, repeats=5):
+    """
+    Замеряет импорт модуля в свежем интерпретаторе через -X importtime
+
+    Returns:
+        dict: Лучшее время импорта, самые медленные вложенные импорты и
+            список загруженных модулей из LAZY_MODULES
+    """
+    import subprocess
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    best = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                   cwd=script_dir, capture_output=True, text=True, check=True)
+        wall = time.perf_counter() - started
+
+        entries = parse_importtime(completed.stderr)
+        # Импорты модуля идут в выводе перед ним самим, после предыдущего импорта верхнего уровня
+        end = next(i for i, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+        start = max((i + 1 for i in range(end) if entries[i][3] == 0), default=0)
+        own = entries[start:end + 1]
+        run = {
+            'import_ms': own[-1][2] / 1000,
+            'wall_ms': wall * 1000,
+            'slowest': [{'module': name, 'self_ms': self_us / 1000}
+                        for name, self_us, _, _ in sorted(own, key=lambda e: -e[1])[:5]],
+            'loaded': sorted({name.split('.')[0] for name, *_ in own} & set(LAZY_MODULES)),
+        }
+        if best is None or run['import_ms'] < best['import_ms']:
+            best = run
+    return dict(best, module=module)
+
+
+def benchmark_startup(modules=ENTRY_POINTS, repeats=5, budget_ms=DEFAULT_STARTUP_BUDGET_MS):
+    """
+    Проверяет время запуска точек входа против бюджета
+
+    Returns:
+        dict: Результаты по каждому модулю и признак укладывания в бюджет
+    """
+    results = {'budget_ms': budget_ms, 'modules': []}
+    for module in modules:
+        metrics = measure_startup(module, repeats)
+        metrics['within_budget'] = metrics['import_ms'] <= budget_ms and not metrics['loaded']
+        results['modules'].append(metrics)
+    results['within_budget'] = all(m['within_budget'] for m in results['modules'])
+    return results
+
+
+def _emit(results, json_path):
+    output = json.dumps(results, indent=2)
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            f.write(output)
+        print(f"[INFO] Результаты сохранены в {json_path}")
+    else:
+        print(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк конвертера WebP в PNG')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    corpus_parser = subparsers.add_parser('corpus', help='Создать синтетический набор WebP файлов')
+    corpus_parser.add_argument('directory', help='Папка для набора')
+    corpus_parser.add_argument('--count', type=int, default=20, help='Количество файлов')
+    corpus_parser.add_argument('--seed', type=int, default=0, help='Зерно генератора')
+    corpus_parser.add_argument('--max-megapixels', type=float, default=4.0,
+                               help='Максимальный размер изображения в мегапикселях')
+    corpus_parser.add_argument('--animated-share', type=float, default=0.1,
+                               help='Доля анимированных файлов')
+
+    run_parser = subparsers.add_parser('run', help='Запустить бенчмарк на наборе')
+    run_parser.add_argument('directory', help='Папка с набором WebP файлов')
+    run_parser.add_argument('--png-speed', nargs='+', choices=sorted(PNG_PRESETS), default=['smallest'],
+                            help='Пресеты сжатия для сравнения (одинаковые имена у всех форматов)')
+    run_parser.add_argument('--format', nargs='+', choices=sorted(ENCODERS), default=[DEFAULT_FORMAT],
+                            help='Выходные форматы для сравнения (по умолчанию png)')
+    run_parser.add_argument('--jobs', nargs='+', type=int, default=[1, default_jobs()],
+                            help='Количество процессов для process_directory')
+    run_parser.add_argument('--json', help='Сохранить результаты в JSON файл (по умолчанию вывод в stdout)')
+
+    alpha_parser = subparsers.add_parser('alpha', help='Сравнить способы обработки прозрачности')
+    alpha_parser.add_argument('--size', default='4000x4000', help='Размер тестового RGBA изображения WxH')
+    alpha_parser.add_argument('--repeats', type=int, default=3, help='Количество повторов')
+    alpha_parser.add_argument('--json', help='Сохранить результаты в JSON файл (по умолчанию вывод в stdout)')
+
+    startup_parser = subparsers.add_parser('startup', help='Замерить время запуска точек входа (-X importtime)')
+    startup_parser.add_argument('--repeats', type=int, default=5, help='Количество повторов')
+    startup_parser.add_argument('--budget-ms', type=float, default=DEFAULT_STARTUP_BUDGET_MS,
+                                help='Бюджет на импорт точки входа, мс (по умолчанию %(default)g)')
+    startup_parser.add_argument('--json', help='Сохранить результаты в JSON файл (по умолчанию вывод в stdout)')
+
+    args = parser.parse_args()
+
+    if args.command == 'corpus':
+        entries = generate_corpus(args.directory, args.count, args.seed,
+                                  args.max_megapixels, args.animated_share)
+        total_bytes = sum(entry['bytes'] for entry in entries)
+        print(f"[INFO] Создано {len(entries)} файлов ({total_bytes / 1e6:.1f} МБ) в {args.directory}")
+        return 0
+
+    if args.command == 'alpha':
+        width, height = (int(v) for v in args.size.lower().split('x'))
+        _emit(benchmark_alpha((width, height), args.repeats), args.json)
+        return 0
+
+    if args.command == 'startup':
+        results = benchmark_startup(ENTRY_POINTS, args.repeats, args.budget_ms)
+        _emit(results, args.json)
+        return 0 if results['within_budget'] else 1
+
+    if not os.path.isdir(args.directory):
+        print(f"❌ Ошибка: {args.directory} не является директорией")
+        return 1
+
+    # Копия набора, чтобы прогоны process_directory не трогали исходную папку
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_copy = os.path.join(work_dir, 'corpus')
+        shutil.copytree(args.directory, corpus_copy)
+        results = run_benchmark(corpus_copy, args.png_speed, sorted(set(args.jobs)), args.format)
+    results['corpus'] = os.path.abspath(args.directory)
+
+    _emit(results, args.json)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общий движок конвертации для обеих точек входа (webp2png.py, webp_to_png_converter.py)
+
+Здесь конвертация одного файла, обработка и отслеживание папки, а также
+конвертация потоков, архивов, опись и передача сервису. Точки входа
+различаются только разбором аргументов, сообщениями итога и тем, что делать
+при отсутствии Pillow.
+"""
+
+import os
+import sys
+# Pillow и модули пакетной обработки импортируются по мере надобности,
+# чтобы конвертация одного файла запускалась быстро
+from discovery import iter_webp_files
+from encoders import DEFAULT_FORMAT, get_encoder
+from animation import DEFAULT_ANIMATION_MODE, is_animated, save_animation, animation_outputs
+from banded_png import DEFAULT_LOW_MEMORY_PIXELS, use_low_memory, save_png_banded
+from resize import sized_output_paths, primary_output_path, resize_image
+from profiling import NULL_PROFILER
+
+def convert_webp_to_png(input_path, output_path=None, delete_original=False, png_options=None,
+                        profiler=NULL_PROFILER, keep_alpha=False, background=None,
+                        animation=DEFAULT_ANIMATION_MODE, low_memory_pixels=DEFAULT_LOW_MEMORY_PIXELS,
+                        sizes=None, smallest=None, output_format=DEFAULT_FORMAT, quiet=False, result=None):
+    """
+    Конвертирует WebP файл в PNG
+    
+    Args:
+        input_path (str): Путь к входному WebP файлу
+        output_path (str, optional): Путь для выходного PNG файла
+        delete_original (bool): Удалить исходный файл после конвертации
+        png_options (dict, optional): Параметры сохранения выходного формата (см. encoders.save_options)
+        profiler (profiling.StageProfiler, optional): Замер времени по этапам конвертации
+        keep_alpha (bool): Сохранить прозрачность вместо наложения на фон
+        background (tuple, optional): Цвет фона (R, G, B) для изображений с прозрачностью
+        animation (str): Анимированные WebP: apng - в APNG, frames - в отдельные PNG кадры,
+            first - только первый кадр
+        low_memory_pixels (int, optional): Начиная с этой площади в пикселях PNG пишется
+            полосами строк для ограничения памяти (0 - всегда, None - никогда)
+        sizes (list, optional): Уменьшить до размеров WxH или Fx (см. resize.py); несколько
+            размеров сохраняются из одного декодирования как name_WxH.png
+        smallest (dict, optional): Перебирать способы кодирования и сохранять наименьший PNG
+            (см. png_search.search_options); анимации и запись полосами не перебираются
+        output_format (str): Выходной формат из encoders.ENCODERS (png, jpeg, webp, tiff);
+            APNG, запись полосами и smallest есть только у PNG, из анимации в другие
+            форматы сохраняется первый кадр
+        quiet (bool): Ничего не печатать; ошибка сохраняется в result
+        result (batch.FileResult, optional): Заполняется списком выходных файлов и текстом ошибки
+    
+    Returns:
+        bool: True если конвертация успешна, False в противном случае
+    """
+    outputs = result.outputs if result is not None else []
+    try:
+        from PIL import Image
+        
+        encoder = get_encoder(output_format)
+        # APNG, запись полосами и перебор кодирования существуют только для PNG
+        is_png = encoder.name == "png"
+        # Определяем путь для выходного файла
+        if output_path is None:
+            output_path = encoder.output_path(input_path)
+        if os.path.abspath(output_path) == os.path.abspath(input_path):
+            raise ValueError("выходной файл совпадает с исходным, укажите --output или --output-dir")
+        
+        # Открываем WebP изображение (читается только заголовок)
+        with profiler.stage("open"):
+            source = Image.open(input_path)
+        with source as img:
+            with profiler.stage("decode"):
+                img.load()
+            
+            if animation != "first" and is_png and is_animated(img):
+                # Анимация конвертируется покадрово в APNG или отдельные PNG;
+                # для каждого размера кадры декодируются заново, а не хранятся в памяти
+                for sized_path, size in sized_output_paths(output_path, sizes):
+                    frame_count, elapsed = save_animation(img, sized_path, animation, png_options,
+                                                          keep_alpha, background, profiler, size)
+                    outputs.extend(animation_outputs(sized_path, animation, frame_count))
+                    if not quiet:
+                        print(f"✅ Конвертирована анимация: {input_path} → {sized_path} "
+                              f"({frame_count} кадров, {frame_count / max(elapsed, 1e-9):.1f} кадров/с)")
+            else:
+                # Все размеры получаются из одного декодированного изображения
+                digest = None
+                for sized_path, size in sized_output_paths(output_path, sizes):
+                    sized = img
+                    if size is not None:
+                        with profiler.stage("resize"):
+                            sized = resize_image(img, size)
+                    
+                    if is_png and use_low_memory(sized, low_memory_pixels):
+                        # Большое изображение пишется полосами строк без полноразмерных копий
+                        with profiler.stage("encode"):
+                            save_png_banded(sized, sized_path, png_options, keep_alpha, background)
+                        outputs.append(sized_path)
+                        if not quiet:
+                            print(f"✅ Конвертирован (экономия памяти): {input_path} → {sized_path}")
+                        continue
+                    
+                    with profiler.stage("convert"):
+                        # Сохраняем прозрачность или накладываем на фон (по умолчанию белый)
+                        sized = encoder.prepare(sized, keep_alpha, background)
+                    
+                    if smallest is not None and is_png:
+                        # Перебор способов кодирования; рецепт кэшируется по хэшу содержимого
+                        import png_search
+                        from conversion_cache import file_hash
+                        
+                        if digest is None:
+                            with profiler.stage("hash"):
+                                digest = file_hash(input_path)
+                        key = png_search.search_key(digest, png_options, size, keep_alpha, background)
+                        recipe, cached = png_search.save_smallest(sized, sized_path, png_options,
+                                                                  smallest, key, profiler)
+                        if result is not None:
+                            result.saved_bytes += png_search.saved_bytes(recipe)
+                        outputs.append(sized_path)
+                        if not quiet:
+                            print(f"✅ Конвертирован: {input_path} → {sized_path} "
+                                  f"({png_search.describe(recipe, cached)})")
+                        continue
+                    
+                    # Сохраняем в выходном формате
+                    encoder.save(sized, sized_path, png_options, profiler)
+                    outputs.append(sized_path)
+                    
+                    if not quiet:
+                        print(f"✅ Конвертирован: {input_path} → {sized_path}")
+            
+            # Удаляем исходный файл если требуется
+            if delete_original:
+                try:
+                    with profiler.stage("delete"):
+                        os.remove(input_path)
+                    if not quiet:
+                        print(f"🗑️ Удален исходный файл: {input_path}")
+                except OSError as e:
+                    if result is not None:
+                        result.error = f"Не удалось удалить исходный файл: {e}"
+                    if not quiet:
+                        print(f"⚠️ Предупреждение: Не удалось удалить исходный файл: {e}")
+            
+            return True
+            
+    except ImportError:
+        if result is not None:
+            result.error = "Библиотека Pillow не установлена"
+        if not quiet:
+            print("❌ Ошибка: Библиотека Pillow не установлена")
+        return False
+    except Exception as e:
+        if result is not None:
+            result.error = str(e)
+        if not quiet:
+            print(f"❌ Ошибка при конвертации {input_path}: {e}")
+        return False
+
+
+def check_directory_options(directory_path, use_cache=False, dedup=None, overlap_io=False,
+                            distributed=False, journal=False, resume=False, memory_budget=None,
+                            auto_jobs=False, smallest=None, output_dir=None, staging_dir=None,
+                            output_format=DEFAULT_FORMAT, **_):
+    """
+    Проверяет директорию и совместимость параметров process_directory
+    
+    Остальные параметры process_directory принимаются и не проверяются, поэтому
+    сюда можно передать те же параметры, что и в process_directory.
+    
+    Returns:
+        bool: True если конвертацию можно начинать; иначе печатает ошибку
+    """
+    if not os.path.isdir(directory_path):
+        print(f"❌ Ошибка: {directory_path} не является директорией")
+        return False
+    
+    if distributed and (use_cache or dedup or overlap_io):
+        # Кэш и дедупликация опираются на общее состояние всего пакета,
+        # а конвейер пишет результат сам, минуя публикацию через ссылку
+        print("❌ Ошибка: распределенный режим несовместим с --cache, --dedup и --overlap-io")
+        return False
+    
+    if (journal or resume) and (use_cache or dedup or distributed):
+        # Журнал сам отслеживает обработанные файлы и удаляет исходники,
+        # поэтому не сочетается с другими способами пропуска и удаления
+        print("❌ Ошибка: журнал (--journal, --resume) несовместим с --cache, --dedup и --distributed")
+        return False
+    
+    if overlap_io and (memory_budget or auto_jobs):
+        # Конвейер ограничивает память объемом прочитанных данных (--io-buffer)
+        print("❌ Ошибка: --memory-limit и --auto-jobs несовместимы с --overlap-io")
+        return False
+    
+    if output_dir and (distributed or journal or resume):
+        # Аренда и журнал проверяют и публикуют результат рядом с исходником
+        print("❌ Ошибка: --output-dir несовместим с --distributed и --journal")
+        return False
+    if staging_dir and not output_dir:
+        print("❌ Ошибка: --staging-dir используется только вместе с --output-dir")
+        return False
+    
+    encoder = get_encoder(output_format)
+    if encoder.name != "png" and (distributed or journal or resume or smallest is not None):
+        # Аренда публикует, а журнал проверяет именно PNG; перебор кодирования есть только у PNG
+        print(f"❌ Ошибка: --distributed, --journal и --smallest несовместимы с --format {encoder.name}")
+        return False
+    if encoder.extension == ".webp" and not output_dir:
+        # Выходной файл рядом с исходником получил бы то же имя
+        print("❌ Ошибка: --format webp перезаписал бы исходные файлы, укажите --output-dir")
+        return False
+    return True
+
+
+def process_directory(directory_path, delete_original=False, jobs=None,
+                      use_cache=False, cache_hash=False, rebuild_cache=False,
+                      png_options=None, profile=None, keep_alpha=False, background=None,
+                      animation=DEFAULT_ANIMATION_MODE, low_memory_pixels=DEFAULT_LOW_MEMORY_PIXELS,
+                      dedup=None, overlap_io=False, io_threads=None, io_buffer_bytes=None,
+                      distributed=False, node_id=None, lease_ttl=None,
+                      journal=False, resume=False, sizes=None, report=None,
+                      memory_budget=None, auto_jobs=False, smallest=None,
+                      output_dir=None, staging_dir=None, output_format=DEFAULT_FORMAT):
+    """
+    Обрабатывает все WebP файлы в указанной директории
+    
+    Args:
+        directory_path (str): Путь к директории
+        delete_original (bool): Удалить исходные файлы после конвертации
+        jobs (int, optional): Количество параллельных процессов (по умолчанию число ядер CPU)
+        use_cache (bool): Пропускать файлы, не изменившиеся с прошлого запуска
+        cache_hash (bool): Сверять содержимое файлов по хэшу
+        rebuild_cache (bool): Сбросить кэш и сконвертировать все файлы заново
+        png_options (dict, optional): Параметры сохранения выходного формата (см. encoders.save_options)
+        profile (profiling.BatchProfile, optional): Сбор замеров времени по этапам для каждого файла
+        keep_alpha (bool): Сохранить прозрачность вместо наложения на фон
+        background (tuple, optional): Цвет фона (R, G, B) для изображений с прозрачностью
+        dedup (str, optional): Конвертировать одинаковые по содержимому файлы один раз,
+            а остальным выходным файлам создать жесткие ссылки (link) или копии (copy)
+        overlap_io (bool): Читать и записывать файлы в отдельных потоках параллельно
+            с декодированием и кодированием (для сетевых дисков), см. io_pipeline
+        io_threads (int, optional): Количество потоков чтения и записи для overlap_io
+        io_buffer_bytes (int, optional): Лимит объема данных в конвейере overlap_io
+        distributed (bool): Несколько узлов обрабатывают одно дерево на общем диске,
+            разбирая файлы через аренду (см. distributed.py)
+        node_id (str, optional): Идентификатор узла для distributed
+        lease_ttl (float, optional): Через сколько секунд аренда упавшего узла считается брошенной
+        journal (bool): Вести журнал состояний файлов, чтобы прерванный запуск можно было продолжить
+            (см. journal.py); исходники удаляются только после проверки записанного PNG
+        resume (bool): Продолжить прерванный запуск по журналу (включает journal)
+        sizes (list, optional): Уменьшить до размеров WxH или Fx (см. resize.py)
+        report (batch.BatchReport, optional): Собирать результаты по файлам вместо печати
+            строки на каждый файл (--quiet, --json)
+        memory_budget (int, optional): Не запускать файлы, если оценка памяти для файлов
+            в работе превысит столько байт (см. scheduling.py)
+        auto_jobs (bool): Подбирать число одновременно конвертируемых файлов (не больше jobs)
+            по замеренной скорости
+        smallest (dict, optional): Перебирать способы кодирования и сохранять наименьший PNG
+            (см. png_search.py); в итоге печатается, сколько байт сэкономлено
+        output_dir (str, optional): Писать PNG в другую директорию, повторяя структуру
+            папок исходного дерева (см. output_tree.py)
+        staging_dir (str, optional): Писать PNG сначала в эту директорию (быстрый локальный
+            диск), а в output_dir переносить в фоне
+        output_format (str): Выходной формат из encoders.ENCODERS (по умолчанию png)
+    
+    Returns:
+        tuple: (количество успешных конвертаций, общее количество файлов) или None,
+            если путь не является директорией или параметры несовместимы
+    """
+    if not check_directory_options(directory_path, use_cache=use_cache, dedup=dedup,
+                                   overlap_io=overlap_io, distributed=distributed,
+                                   journal=journal, resume=resume, memory_budget=memory_budget,
+                                   auto_jobs=auto_jobs, smallest=smallest, output_dir=output_dir,
+                                   staging_dir=staging_dir, output_format=output_format):
+        return None
+    
+    from functools import partial
+    from parallel import run_conversions, default_jobs
+    from batch import FileResult, as_record, convert_file, output_size
+    
+    journal = journal or resume
+    encoder = get_encoder(output_format)
+    
+    if png_options is None:
+        png_options = encoder.save_options()
+    
+    tree = None
+    mover = None
+    if output_dir:
+        from output_tree import OutputTree, BackgroundMover
+        
+        tree = OutputTree(directory_path, output_dir, staging_dir, encoder.extension)
+        directories = tree.create_skeleton()
+        print(f"📂 Выходное дерево: {output_dir} (директорий создано заранее: {directories})")
+        if staging_dir:
+            mover = BackgroundMover(tree)
+    
+    def primary_output(path):
+        if tree is None:
+            return primary_output_path(path, sizes, encoder.extension)
+        return sized_output_paths(tree.final_path(path), sizes)[0][0]
+    
+    cache = None
+    if use_cache:
+        from conversion_cache import ConversionCache
+        
+        settings = dict(png_options, format=encoder.name, keep_alpha=keep_alpha,
+                        background=background, animation=animation, sizes=sizes)
+        if smallest is not None:
+            # Без --smallest ключ не добавляется, чтобы не сбрасывать прежние кэши
+            settings["smallest"] = True
+        cache = ConversionCache(directory_path, settings,
+                                use_hash=cache_hash, invalidate=rebuild_cache)
+    
+    total_count = 0
+    
+    def pending_files():
+        nonlocal total_count
+        for webp_file in iter_webp_files(directory_path, tree.roots if tree is not None else ()):  # Рекурсивный поиск
+            total_count += 1
+            if cache is None or not cache.is_current(webp_file):
+                yield webp_file
+    
+    files = pending_files()
+    deduplicator = None
+    if dedup:
+        from dedup import Deduplicator
+        
+        # Для поиска дубликатов нужен полный список файлов до начала конвертации
+        deduplicator = Deduplicator(files, dedup, sizes,
+                                    tree.output_path if tree is not None else encoder.output_path)
+        files = deduplicator.unique
+    
+    scheduler = None
+    if (memory_budget or auto_jobs) and (jobs or default_jobs()) <= 1:
+        # Файлы конвертируются по одному в текущем процессе: допускать и подстраивать нечего
+        print("ℹ️ --memory-limit и --auto-jobs не действуют при одном процессе (--jobs 1)")
+    elif memory_budget or auto_jobs:
+        from scheduling import AdaptiveScheduler
+        
+        # Порядок задается до аренды и журнала: узел арендует файлы в порядке запуска
+        scheduler = AdaptiveScheduler(jobs or default_jobs(), memory_budget, auto_jobs)
+        files = scheduler.order(files)
+    
+    leases = None
+    if distributed:
+        from distributed import LeaseManager, DEFAULT_LEASE_TTL
+        
+        leases = LeaseManager(directory_path, node_id, lease_ttl or DEFAULT_LEASE_TTL)
+        files = leases.iter_claimed(files, delete_original, sizes=sizes)
+    
+    job_journal = None
+    # При переносе в фоне исходник удаляется после переноса его PNG
+    worker_delete = delete_original and mover is None
+    if journal:
+        from journal import Journal
+        
+        settings = dict(png_options, keep_alpha=keep_alpha, background=background,
+                        animation=animation, sizes=sizes)
+        if smallest is not None:
+            settings["smallest"] = True
+        job_journal = Journal(directory_path, settings, resume=resume, sizes=sizes)
+        if job_journal.settings_changed:
+            # Готовые файлы прерванного запуска сконвертированы с прежними параметрами,
+            # продолжение смешало бы в одном дереве результаты разных настроек
+            job_journal.close()
+            print("❌ Ошибка: параметры конвертации отличаются от прерванного запуска: "
+                  "продолжите с прежними параметрами или начните заново с --journal")
+            return None
+        job_journal.recover(delete_original)
+        if job_journal.scanned:
+            # Обход дерева завершился в прошлом запуске: список файлов берется из журнала
+            files = job_journal.iter_unfinished()
+            if scheduler is not None:
+                files = scheduler.order(files)
+        else:
+            files = job_journal.iter_discovered(files)
+        # Исходники удаляет журнал после проверки результата, а не процесс конвертации
+        worker_delete = False
+    
+    success_count = 0
+    saved_bytes = output_bytes = 0
+    # С отчетом (--quiet, --json) рабочие процессы ничего не печатают:
+    # ошибки и прогресс выводит BatchReport по записям о результатах
+    quiet = report is not None
+    convert_options = dict(png_options=png_options, keep_alpha=keep_alpha, background=background,
+                           animation=animation, low_memory_pixels=low_memory_pixels, sizes=sizes,
+                           smallest=smallest, output_format=output_format)
+    if report is not None:
+        files = report.track(files)
+    if overlap_io:
+        from io_pipeline import run_pipeline, DEFAULT_IO_THREADS, DEFAULT_IO_BUFFER_BYTES
+        
+        results = run_pipeline(files, jobs, io_threads or DEFAULT_IO_THREADS,
+                               io_buffer_bytes or DEFAULT_IO_BUFFER_BYTES,
+                               worker_delete, with_records=True, quiet=quiet,
+                               output_path_for=tree.output_path if tree is not None else None,
+                               **convert_options)
+    else:
+        convert_func = partial(convert_file, convert_webp_to_png)
+        if tree is not None:
+            from output_tree import convert_mirrored
+            
+            convert_func = partial(convert_mirrored, convert_func=convert_func, tree=tree)
+        if leases is not None:
+            from distributed import convert_claimed
+            
+            convert_func = partial(convert_claimed, convert_func=convert_func, node_id=leases.node_id)
+            leases.start()
+        results = run_conversions(convert_func, files, jobs, scheduler=scheduler,
+                                  delete_original=worker_delete, quiet=quiet, **convert_options)
+    
+    def finish_moves():
+        # Результаты переноса забираются в основном потоке: кэш не рассчитан на потоки
+        nonlocal success_count
+        for source, moved, error in mover.drain():
+            if error is not None:
+                success_count -= 1
+                error = f"Не удалось перенести PNG для {source}: {error}"
+                if report is not None:
+                    report.message(f"❌ {error}")
+                else:
+                    print(f"❌ {error}")
+            elif cache is not None:
+                cache.record(source, primary_output(source))
+    
+    for webp_file, record in results:
+        if isinstance(record, Exception) and not quiet:
+            # Рабочий процесс упал и не напечатал ошибку сам
+            print(f"❌ Ошибка в рабочем процессе для {webp_file}: {record}")
+        record = as_record(webp_file, record)
+        if leases is not None:
+            leases.release(webp_file)
+        if profile is not None:
+            profile.add(webp_file, record.timings)
+        if job_journal is not None:
+            job_journal.record("converted" if record.ok else "failed", webp_file)
+            if record.ok and not job_journal.finish_converted(webp_file, delete_original):
+                record.status = "failed"
+                record.error = "Выходной PNG поврежден, файл будет сконвертирован заново при --resume"
+                if not quiet:
+                    print(f"❌ {record.error}: {webp_file}")
+        if report is not None:
+            report.add(record)
+        success = record.ok
+        if success:
+            if overlap_io and not quiet:
+                # Конвейер не вызывает convert_webp_to_png, поэтому результат печатается здесь
+                print(f"✅ Конвертирован: {webp_file}")
+            success_count += 1
+            saved_bytes += record.saved_bytes
+            output_bytes += record.output_bytes
+            if cache is not None and mover is None:
+                cache.record(webp_file, primary_output(webp_file))
+        duplicates = deduplicator.duplicates_of(webp_file) if deduplicator is not None else []
+        for duplicate in duplicates:
+            if not success:
+                error = f"конвертация {webp_file} не удалась"
+                if report is not None:
+                    report.add(FileResult(duplicate, error=f"Дубликат не создан: {error}"))
+                else:
+                    print(f"❌ Дубликат не создан, {error}: {duplicate}")
+                continue
+            try:
+                outputs = deduplicator.materialize(webp_file, duplicate, record.seconds)
+                if mover is not None:
+                    # Кэш и удаление исходника - после переноса
+                    mover.submit(duplicate, outputs, delete_original)
+                else:
+                    if cache is not None:
+                        cache.record(duplicate, primary_output(duplicate))
+                    if delete_original:
+                        os.remove(duplicate)
+            except OSError as e:
+                if report is not None:
+                    report.add(FileResult(duplicate, error=f"Не удалось создать выходной файл для дубликата: {e}"))
+                else:
+                    print(f"❌ Не удалось создать выходной файл для дубликата {duplicate}: {e}")
+                continue
+            success_count += 1
+            if report is not None:
+                report.add(FileResult(duplicate, "duplicate", outputs, output_bytes=output_size(outputs)))
+            else:
+                print(f"🔗 Дубликат {webp_file}: {duplicate} → {', '.join(outputs)}")
+        if mover is not None:
+            if success:
+                # Дубликаты уже созданы из этих PNG, теперь их можно переносить
+                mover.submit(webp_file, record.outputs, delete_original)
+            finish_moves()
+    
+    if mover is not None:
+        mover.close()
+        finish_moves()
+    
+    if report is not None:
+        report.close()
+    
+    if leases is not None:
+        leases.close()
+    
+    if job_journal is not None:
+        # Итог считается по всему журналу, включая файлы, обработанные до прерывания
+        counts = job_journal.counts()
+        total_count = len(job_journal.states)
+        success_count = counts['verified'] + counts['deleted']
+        job_journal.close(finished=success_count == total_count)
+    
+    if total_count == 0:
+        print(f"ℹ️ В директории {directory_path} не найдено WebP файлов")
+        return 0, 0
+    
+    print(f"📁 Найдено {total_count} WebP файлов в {directory_path}")
+    
+    if leases is not None:
+        # Результат считается по файлам этого узла, остальные обработаны другими узлами
+        total_count = leases.claimed
+        print(f"🌐 {leases.report()}")
+    
+    if job_journal is not None:
+        print(f"📝 {job_journal.report()}")
+    
+    if cache is not None:
+        cache.save()
+        success_count += cache.hits
+        if report is not None:
+            report.skipped(cache.hits)
+        print(f"💾 {cache.report()}")
+    
+    if scheduler is not None:
+        print(f"⚙️ {scheduler.summary()}")
+    
+    if deduplicator is not None:
+        print(f"🔗 {deduplicator.report()}")
+    
+    if mover is not None:
+        print(f"🚚 {mover.report()}")
+    
+    if smallest is not None and not overlap_io:
+        # Конвейер кодирует в памяти через convert_buffer и экономию не учитывает
+        from png_search import saved_report
+        
+        print(f"📉 {saved_report(saved_bytes, output_bytes)}")
+    
+    return success_count, total_count
+
+
+def watch_directory(directory_path, delete_original=False, jobs=None, debounce=None,
+                    poll_interval=None, polling=False, stop_event=None, report=None,
+                    directory_options=None, **convert_options):
+    """
+    Конвертирует папку, а затем отслеживает ее и конвертирует новые WebP файлы по мере появления
+    
+    Уже лежащие файлы обрабатываются process_directory, новые - по событиям
+    inotify или опросом директорий (см. watch.py). Работает до Ctrl+C или stop_event.
+    
+    Args:
+        directory_path (str): Путь к директории
+        delete_original (bool): Удалить исходные файлы после конвертации
+        jobs (int, optional): Количество параллельных процессов (по умолчанию число ядер CPU)
+        debounce (float, optional): Сколько секунд файл должен оставаться неизменным перед конвертацией
+        poll_interval (float, optional): Период опроса, если inotify недоступен
+        polling (bool): Всегда отслеживать опросом (сетевые диски)
+        stop_event (threading.Event, optional): Остановить отслеживание
+        report (batch.BatchReport, optional): Учитывать результаты в отчете вместо печати по файлу
+        directory_options (dict, optional): Параметры process_directory для уже лежащих файлов
+        **convert_options: Параметры convert_webp_to_png (png_options, keep_alpha, sizes и т.д.)
+    
+    Returns:
+        tuple: (успешно конвертировано, всего файлов) за все время отслеживания
+            или None, как у process_directory
+    """
+    from functools import partial
+    from batch import as_record, convert_file
+    from watch import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, open_watcher, iter_arrivals
+    
+    directory_options = directory_options or {}
+    if not check_directory_options(directory_path, **directory_options, **convert_options):
+        return None
+    
+    quiet = report is not None
+    # Наблюдатель открывается до обработки уже лежащих файлов, чтобы не пропустить появившиеся за это время
+    watcher = open_watcher(directory_path, poll_interval or DEFAULT_POLL_INTERVAL, polling)
+    result = process_directory(directory_path, delete_original, jobs, report=report,
+                               **directory_options, **convert_options)
+    if result is None:
+        watcher.close()
+        return None
+    success_count, total_count = result
+    print(f"👀 Отслеживание {directory_path} ({watcher.name}), остановка - Ctrl+C")
+    
+    arrivals = iter_arrivals(watcher, partial(convert_file, convert_webp_to_png), jobs,
+                             debounce if debounce is not None else DEFAULT_DEBOUNCE, stop_event,
+                             delete_original=delete_original, quiet=quiet, **convert_options)
+    try:
+        for webp_file, record in arrivals:
+            record = as_record(webp_file, record)
+            total_count += 1
+            success_count += record.ok
+            if report is not None:
+                report.found += 1
+                report.add(record)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        arrivals.close()
+    if report is not None:
+        report.close()
+    print(f"⏹️ Отслеживание остановлено: конвертировано {success_count} из {total_count} файлов")
+    return success_count, total_count
+
+
+def convert_via_service(args, convert_options, report=None):
+    """
+    Передает путь запущенному сервису конвертации (converter_service.py)
+    
+    Args:
+        report (batch.BatchReport, optional): Учитывать результаты в отчете вместо печати по файлу
+    
+    Returns:
+        tuple: (количество успешных конвертаций, общее количество файлов)
+            или None, если сервис не запущен
+    """
+    from converter_service import submit, unsupported_flags
+    
+    unsupported = unsupported_flags(args)
+    if unsupported:
+        # Сервис пишет результат рядом с исходником и не знает о режимах папки
+        print(f"ℹ️ Сервис конвертации не поддерживает {', '.join(unsupported)}, конвертация в текущем процессе")
+        return None
+    options = dict(convert_options, delete_original=args.delete, quiet=report is not None)
+    
+    def on_result(path, ok):
+        if report is not None:
+            from batch import FileResult
+            
+            report.add(FileResult(path, "converted" if ok else "failed",
+                                  error=None if ok else "Ошибка в сервисе конвертации"))
+        elif ok:
+            print(f"✅ Конвертирован сервисом: {path}")
+        else:
+            print(f"❌ Ошибка при конвертации {path}")
+    
+    try:
+        result = submit([args.input], options, on_result=on_result)
+    except RuntimeError as e:
+        print(f"ℹ️ Сервис конвертации отклонил запрос ({e}), конвертация в текущем процессе")
+        return None
+    if result is None:
+        print("ℹ️ Сервис конвертации не запущен, конвертация в текущем процессе")
+    return result
+
+
+def convert_stream_input(args, convert_options, report=None):
+    """
+    Конвертирует без временных файлов: '-' - stdin/stdout, zip и tar архивы
+    (--tar - tar архив из stdin) в архив PNG или папку
+    
+    Args:
+        report (batch.BatchReport, optional): Учитывать результаты в отчете вместо печати по файлу
+    
+    Returns:
+        int: Код возврата
+    """
+    import time
+    import contextlib
+    from batch import FileResult
+    from archives import archive_format, default_output_path, convert_archive
+    from streams import STDIO_PATH, STDIN_NAME, is_stdio, open_input, open_output, convert_stream
+    
+    is_archive = args.tar or archive_format(args.input) is not None
+    output = args.output
+    if output is None:
+        # Архив из файла по умолчанию пишется рядом: photos.zip -> photos_png.zip
+        output = default_output_path(args.input) if is_archive and not args.tar else STDIO_PATH
+    if is_stdio(output) and sys.stdout.isatty():
+        print("❌ Ошибка: PNG не выводится в терминал: перенаправьте stdout в файл или канал")
+        return 1
+    if not is_stdio(args.input) and not os.path.isfile(args.input):
+        print(f"❌ Ошибка: Файл {args.input} не найден")
+        return 1
+    
+    name = STDIN_NAME if is_stdio(args.input) else args.input
+    stdout = sys.stdout.buffer
+    success = True
+    with contextlib.ExitStack() as stack:
+        if is_stdio(output):
+            # stdout занят данными, все сообщения идут в stderr
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        try:
+            if is_archive:
+                records = convert_archive(args.input, output, args.jobs, stdout=stdout,
+                                          buffer_bytes=args.io_buffer * 1024 * 1024, **convert_options)
+            else:
+                with open_input(args.input) as source, open_output(output, stdout) as target:
+                    started = time.perf_counter()
+                    data = source.read()
+                    png_data, timings = convert_stream(data, name, **convert_options)
+                    target.write(png_data)
+                records = [FileResult(name, 'converted', [output], len(data), len(png_data),
+                                      time.perf_counter() - started, timings)]
+            for record in records:
+                if report is not None:
+                    report.found += 1
+                    report.add(record)
+                elif record.ok:
+                    print(f"✅ Конвертирован: {record.path} → {', '.join(record.outputs)}")
+                else:
+                    print(f"❌ Ошибка при конвертации {record.path}: {record.error}")
+                success = success and record.ok
+        except Exception as e:
+            print(f"❌ Ошибка при конвертации {name}: {e}")
+            return 1
+        finally:
+            if report is not None:
+                report.close()
+    
+    if success and args.delete and not is_stdio(args.input):
+        try:
+            os.remove(args.input)
+        except OSError as e:
+            print(f"⚠️ Предупреждение: Не удалось удалить исходный файл: {e}")
+    return 0 if success else 1
+
+
+def scan_input(args):
+    """
+    Составляет опись WebP файлов без конвертации (--scan)
+    
+    Returns:
+        int: Код возврата
+    """
+    import json
+    from inventory import Calibration, load_calibration, scan_paths, scan_tree
+    from parallel import default_jobs
+    
+    jobs = args.jobs or default_jobs()
+    calibration = Calibration.default(args.png_speed)
+    if args.calibration:
+        try:
+            calibration = load_calibration(args.calibration, args.png_speed, jobs, args.format)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"❌ Ошибка: Не удалось загрузить калибровку {args.calibration}: {e}")
+            return 1
+    
+    if os.path.isdir(args.input):
+        inventory = scan_tree(args.input)
+    elif os.path.isfile(args.input):
+        inventory = scan_paths([args.input])
+    else:
+        print(f"❌ Ошибка: Путь {args.input} не существует")
+        return 1
+    
+    if args.json:
+        print(json.dumps(inventory.to_dict(calibration, jobs), ensure_ascii=False, indent=2))
+        return 0
+    for path, error in inventory.corrupt:
+        print(f"❌ Поврежден {path}: {error}")
+    for path in inventory.misnamed:
+        print(f"⚠️ WebP с другим расширением (не будет найден при конвертации папки): {path}")
+    for line in inventory.report_lines(calibration, jobs):
+        print(f"📋 {line}")
+    return 0
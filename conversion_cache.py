@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Инкрементальный кэш конвертации: пропуск неизмененных файлов при повторных запусках
+"""
+
+import os
+import json
+import hashlib
+
+CACHE_FILENAME = '.webp2png-cache.json'
+CACHE_VERSION = 1
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """Вычисляет хэш содержимого файла, читая его блоками"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """
+    Манифест уже сконвертированных файлов, хранящийся в корне директории
+
+    Запись считается актуальной, если у исходного файла совпадают размер, время
+    изменения и параметры конвертации, а выходной файл существует и не изменился.
+    При use_hash=True файл с измененным временем, но тем же размером, сверяется
+    по хэшу содержимого.
+    """
+
+    def __init__(self, directory, settings=None, use_hash=False, invalidate=False):
+        """
+        Args:
+            directory (str): Корневая директория обработки
+            settings (dict, optional): Параметры конвертации, входящие в ключ кэша
+            use_hash (bool): Сверять содержимое по хэшу
+            invalidate (bool): Игнорировать сохраненный манифест и построить его заново
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, CACHE_FILENAME)
+        self.settings = json.dumps(settings or {}, sort_keys=True)
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.entries = {} if invalidate else self._load()
+        self._seen = set()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != CACHE_VERSION:
+            return {}
+        return data.get('entries', {})
+
+    def _key(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, '/')
+
+    def is_current(self, path):
+        """
+        Проверяет, можно ли пропустить конвертацию файла
+
+        Args:
+            path (str): Путь к исходному WebP файлу
+
+        Returns:
+            bool: True если выходной файл актуален
+        """
+        key = self._key(path)
+        self._seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None or entry.get('settings') != self.settings:
+            self.misses += 1
+            return False
+
+        try:
+            source_stat = os.stat(path)
+            output_stat = os.stat(os.path.join(self.directory, entry['output']))
+        except OSError:
+            self.misses += 1
+            return False
+
+        current = (source_stat.st_size == entry['size']
+                   and output_stat.st_size == entry['output_size'])
+        if current and source_stat.st_mtime_ns != entry['mtime_ns']:
+            current = self.use_hash and entry.get('hash') == file_hash(path)
+            if current:
+                entry['mtime_ns'] = source_stat.st_mtime_ns
+
+        if current:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return current
+
+    def record(self, path, output_path):
+        """
+        Запоминает успешно сконвертированный файл
+
+        Args:
+            path (str): Путь к исходному WebP файлу
+            output_path (str): Путь к созданному выходному файлу
+        """
+        key = self._key(path)
+        self._seen.add(key)
+        try:
+            source_stat = os.stat(path)
+            output_size = os.path.getsize(output_path)
+        except OSError:
+            # Исходный файл удален (--delete) или выходной не создан - запоминать нечего
+            self.entries.pop(key, None)
+            return
+
+        entry = {
+            'size': source_stat.st_size,
+            'mtime_ns': source_stat.st_mtime_ns,
+            'output': self._key(output_path),
+            'output_size': output_size,
+            'settings': self.settings,
+        }
+        if self.use_hash:
+            entry['hash'] = file_hash(path)
+        self.entries[key] = entry
+
+    def save(self):
+        """Сохраняет манифест атомарно, отбрасывая записи об исчезнувших файлах"""
+        entries = {key: entry for key, entry in self.entries.items() if key in self._seen}
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': CACHE_VERSION, 'entries': entries}, f)
+        os.replace(temp_path, self.path)
+
+    def report(self):
+        """Возвращает строку со статистикой попаданий в кэш"""
+        return f"Кэш: {self.hits} пропущено без изменений, {self.misses} к конвертации"
@@ -60,32 +60,8 @@ if not exist "%script_path%" (
     exit /b 1
 )
 
-python --version >nul 2>&1
-if errorlevel 1 (
-    echo ❌ Ошибка: Python не установлен или не добавлен в PATH
-    echo Установите Python с сайта https://python.org
-    if "%auto_close%"=="true" (
-        timeout /t 5 >nul
-    ) else (
-        pause
-    )
-    exit /b 1
-)
-
-python -c "import PIL" >nul 2>&1
-if errorlevel 1 (
-    echo ⚠️  Устанавливаем библиотеку Pillow...
-    pip install Pillow
-    if errorlevel 1 (
-        echo ❌ Ошибка: Не удалось установить Pillow
-        if "%auto_close%"=="true" (
-            timeout /t 5 >nul
-        ) else (
-            pause
-        )
-        exit /b 1
-    )
-)
+REM Pillow не проверяется заранее: webp_to_png_converter.py сам установит её,
+REM если конвертация не удастся из-за её отсутствия
 
 echo 🚀 Запуск конвертера WebP в PNG...
 echo 📁 Выбранный путь: %selected_path%
@@ -98,7 +74,9 @@ if "%auto_close%"=="true" (
 echo.
 
 REM Формируем команду для Python скрипта
-set "python_cmd=python "%script_path%""
+REM --use-service: если запущен converter_service.py, путь передается ему,
+REM иначе конвертация выполняется в этом процессе
+set "python_cmd=python "%script_path%" --use-service"
 if "%delete_original%"=="true" (
     set "python_cmd=%python_cmd% --delete"
 )
@@ -106,6 +84,17 @@ set "python_cmd=%python_cmd% "%selected_path%""
 
 REM Выполняем команду
 %python_cmd%
+REM Python не проверяется заранее: cmd возвращает 9009, если команда не найдена
+if errorlevel 9009 (
+    echo ❌ Ошибка: Python не установлен или не добавлен в PATH
+    echo Установите Python с сайта https://python.org
+    if "%auto_close%"=="true" (
+        timeout /t 5 >nul
+    ) else (
+        pause
+    )
+    exit /b 1
+)
 
 echo.
 if "%auto_close%"=="true" (
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Фоновый сервис конвертации с прогретым пулом процессов
+
+Контекстное меню запускает отдельный процесс на каждый выбранный файл.
+Если сервис запущен, клиенты только передают ему пути через локальный сокет
+(именованный канал в Windows), а сервис объединяет запросы, пришедшие почти
+одновременно, в один пакет и конвертирует их в уже готовых рабочих процессах.
+
+Сокет и ключ доступа лежат в личной директории пользователя (права 0700):
+ключ случайный и создается заново при каждом запуске сервиса, а сообщения
+передаются в JSON, поэтому ни сервис, ни клиент не распаковывают pickle от
+чужого процесса. Параметры конвертации от клиента проверяются по списку
+разрешенных ключей и типов, пути принимаются только к WebP файлам и папкам.
+
+Примеры:
+  python converter_service.py serve --jobs 4
+  python converter_service.py status
+  python converter_service.py stop
+"""
+
+import os
+import sys
+import json
+import stat
+import time
+import queue
+import getpass
+import secrets
+import argparse
+import tempfile
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+# Запросы, пришедшие в течение этого окна после первого, обрабатываются одним пакетом
+DEFAULT_COALESCE_WINDOW = 0.2
+KEY_FILE = 'service.key'
+SOCKET_FILE = 'service.sock'
+# Сообщения больше этого размера отклоняются без разбора
+MAX_MESSAGE_BYTES = 1024 * 1024
+
+# Параметры convert_webp_to_png, которые клиент может передать сервису.
+# Пути вывода (output_path) и кэш --smallest не принимаются: сервис пишет
+# только рядом с переданными WebP файлами
+OPTION_TYPES = {
+    'delete_original': bool,
+    'keep_alpha': bool,
+    'quiet': bool,
+    'animation': str,
+    'output_format': str,
+    'low_memory_pixels': (int, type(None)),
+    'png_options': dict,
+    'background': (list, type(None)),
+    'sizes': (list, type(None)),
+    'smallest': type(None),
+}
+# Параметры Image.save, которые бывают в пресетах форматов (см. encoders.py)
+SAVE_OPTION_KEYS = ('compress_level', 'compress_type', 'optimize', 'quality', 'progressive',
+                    'lossless', 'exact', 'method', 'compression')
+
+
+def service_dir():
+    """
+    Личная директория сервиса для ключа и сокета
+
+    XDG_RUNTIME_DIR (или папка во временной директории) в Unix, профиль
+    пользователя в Windows. Директория, созданная другим пользователем или
+    доступная другим, не используется.
+
+    Raises:
+        PermissionError: Директория принадлежит другому пользователю или доступна другим
+    """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        path = os.path.join(base, 'webp2png')
+    elif os.environ.get('XDG_RUNTIME_DIR'):
+        path = os.path.join(os.environ['XDG_RUNTIME_DIR'], 'webp2png')
+    else:
+        path = os.path.join(tempfile.gettempdir(), f'webp2png-{getpass.getuser()}')
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if sys.platform != 'win32':
+        info = os.lstat(path)
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            raise PermissionError(f"Директория сервиса {path} принадлежит другому пользователю "
+                                  f"или доступна другим")
+    return path
+
+
+def _key_path():
+    return os.path.join(service_dir(), KEY_FILE)
+
+
+def _authkey():
+    """Ключ запущенного сервиса (FileNotFoundError, если сервис не запускался)"""
+    with open(_key_path(), encoding='ascii') as f:
+        return f.read().strip().encode('ascii')
+
+
+def _create_authkey():
+    """Создает новый случайный ключ, доступный только владельцу (0600)"""
+    path = _key_path()
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(secrets.token_hex(32))
+    os.replace(temp_path, path)
+    return _authkey()
+
+
+def default_address():
+    """
+    Адрес сервиса: переменная окружения WEBP2PNG_SERVICE, иначе Unix сокет
+    в личной директории или именованный канал в Windows
+
+    Имя канала в Windows общее для всех пользователей, поэтому в него входит
+    производная от ключа: занять имя заранее, не зная ключа, нельзя.
+    """
+    address = os.environ.get('WEBP2PNG_SERVICE')
+    if address:
+        return address
+    if sys.platform == 'win32':
+        import hashlib
+
+        token = hashlib.sha256(_authkey()).hexdigest()[:16]
+        return rf'\\.\pipe\webp2png-{getpass.getuser()}-{token}'
+    return os.path.join(service_dir(), SOCKET_FILE)
+
+
+def _send(conn, message):
+    conn.send_bytes(json.dumps(message).encode('utf-8'))
+
+
+def _recv(conn):
+    """
+    Принимает сообщение JSON
+
+    Raises:
+        EOFError, OSError: Соединение закрыто или сообщение слишком велико
+        ValueError: Сообщение не является объектом JSON
+    """
+    message = json.loads(conn.recv_bytes(MAX_MESSAGE_BYTES).decode('utf-8'))
+    if not isinstance(message, dict):
+        raise ValueError("Сообщение должно быть объектом JSON")
+    return message
+
+
+def _is_scalar(value):
+    return isinstance(value, (bool, int, str))
+
+
+def validate_options(options):
+    """
+    Проверяет параметры конвертации от клиента
+
+    Args:
+        options (dict): Параметры из сообщения convert
+
+    Returns:
+        dict: Параметры для convert_webp_to_png (background - кортеж)
+
+    Raises:
+        ValueError: Неизвестный ключ или значение недопустимого типа
+    """
+    from animation import ANIMATION_MODES
+    from encoders import ENCODERS
+    from resize import parse_max_size, parse_scale
+
+    if not isinstance(options, dict):
+        raise ValueError("Параметры должны быть объектом")
+    checked = {}
+    for key, value in options.items():
+        expected = OPTION_TYPES.get(key)
+        if expected is None:
+            raise ValueError(f"Недопустимый параметр: {key}")
+        # bool - подкласс int, поэтому True не принимается за число
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):
+            raise ValueError(f"Недопустимое значение параметра {key}: {value!r}")
+        checked[key] = value
+
+    if checked.get('animation', ANIMATION_MODES[0]) not in ANIMATION_MODES:
+        raise ValueError(f"Неизвестный режим анимации: {checked['animation']}")
+    if checked.get('output_format', 'png') not in ENCODERS:
+        raise ValueError(f"Неизвестный выходной формат: {checked['output_format']}")
+    for key, value in checked.get('png_options', {}).items():
+        if key not in SAVE_OPTION_KEYS or not _is_scalar(value):
+            raise ValueError(f"Недопустимый параметр сохранения: {key}")
+    background = checked.get('background')
+    if background is not None:
+        if len(background) != 3 or not all(type(c) is int and 0 <= c <= 255 for c in background):
+            raise ValueError(f"Недопустимый цвет фона: {background!r}")
+        checked['background'] = tuple(background)
+    for spec in checked.get('sizes') or []:
+        if not isinstance(spec, str):
+            raise ValueError(f"Недопустимый размер: {spec!r}")
+        parsed = parse_scale(spec[:-1]) if spec.endswith('x') else parse_max_size(spec)
+        if parsed != spec:
+            raise ValueError(f"Недопустимый размер: {spec}")
+    return checked
+
+
+def unsupported_flags(args):
+    """
+    Параметры командной строки, которые сервис не выполняет
+
+    Сервис конвертирует каждый файл рядом с исходником; кэш, дедупликация,
+    журнал и другие режимы папки работают только в процессе конвертера.
+
+    Returns:
+        list: Названия заданных параметров
+    """
+    flags = [('--output', getattr(args, 'output', None)),
+             ('--cache', getattr(args, 'cache', False) or getattr(args, 'rebuild_cache', False)),
+             ('--dedup', getattr(args, 'dedup', False)),
+             ('--journal/--resume', getattr(args, 'journal', False) or getattr(args, 'resume', False)),
+             ('--distributed', getattr(args, 'distributed', False)),
+             ('--memory-limit', getattr(args, 'memory_limit', None)),
+             ('--auto-jobs', getattr(args, 'auto_jobs', False)),
+             ('--overlap-io', getattr(args, 'overlap_io', False)),
+             ('--smallest', getattr(args, 'smallest', False)),
+             ('--profile', getattr(args, 'profile', False) or getattr(args, 'profile_trace', None))]
+    return [name for name, value in flags if value]
+
+
+def _warm_up():
+    """Загружает Pillow и кодеки в рабочем процессе заранее"""
+    from PIL import Image, WebPImagePlugin, PngImagePlugin  # noqa: F401
+    return os.getpid()
+
+
+def _expand(paths):
+    """Разворачивает папки в список WebP файлов; остальные пути возвращаются как есть"""
+    from discovery import iter_webp_files
+
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_webp_files(path)
+        else:
+            yield path
+
+
+class _Request:
+    def __init__(self, conn, paths, options):
+        self.conn = conn
+        self.paths = paths
+        self.options = options
+        self.total = 0
+        self.success = 0
+        self.remaining = 0
+
+
+class ConverterService:
+    """
+    Сервис конвертации
+
+    Args:
+        address (str, optional): Адрес сокета или именованного канала
+        jobs (int, optional): Количество рабочих процессов (по умолчанию число ядер CPU)
+        coalesce_window (float): Окно объединения запросов в секундах
+    """
+
+    def __init__(self, address=None, jobs=None, coalesce_window=DEFAULT_COALESCE_WINDOW):
+        from parallel import default_jobs
+
+        self.address = address
+        self.jobs = jobs or default_jobs()
+        self.coalesce_window = coalesce_window
+        self.batches_run = 0
+        self._requests = queue.Queue()
+        self._stopped = threading.Event()
+        self._listener = None
+        self._executor = None
+
+    def _listen(self):
+        # Проверка - с ключом запущенного сервиса, до того как ключ будет заменен
+        if is_running(self.address):
+            raise RuntimeError(f"Сервис уже запущен: {self.address or default_address()}")
+        # Новый ключ при каждом запуске: клиенты прошлых запусков не подключатся
+        authkey = _create_authkey()
+        self.address = self.address or default_address()
+        if not self.address.startswith('\\\\') and os.path.exists(self.address):
+            os.remove(self.address)  # Сокет остался от аварийно завершенного сервиса
+        return Listener(self.address, authkey=authkey)
+
+    def serve_forever(self):
+        """Принимает подключения до команды stop"""
+        from concurrent.futures import ProcessPoolExecutor
+
+        self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+        for future in [self._executor.submit(_warm_up) for _ in range(self.jobs)]:
+            future.result()
+
+        self._listener = self._listen()
+        batch_thread = threading.Thread(target=self._batch_loop, daemon=True)
+        batch_thread.start()
+        print(f"[INFO] Сервис конвертации слушает {self.address} ({self.jobs} процессов)")
+
+        try:
+            while True:
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    if self._stopped.is_set():
+                        break
+                    continue  # Неудачное рукопожатие с клиентом
+                if self._stopped.is_set():
+                    conn.close()
+                    break
+                threading.Thread(target=self._receive, args=(conn,), daemon=True).start()
+        finally:
+            self._stopped.set()
+            self._listener.close()
+            batch_thread.join()
+            self._executor.shutdown()
+            if not self.address.startswith('\\\\') and os.path.exists(self.address):
+                os.remove(self.address)
+
+    def stop(self):
+        """Останавливает сервис"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        try:
+            # Пробуждаем accept() в основном потоке
+            _connect(self.address).close()
+        except (OSError, AuthenticationError):
+            pass
+
+    def _receive(self, conn):
+        try:
+            message = _recv(conn)
+        except (EOFError, OSError, ValueError):
+            conn.close()
+            return
+
+        command = message.get('command')
+        try:
+            if command == 'convert':
+                paths = message.get('paths')
+                if not isinstance(paths, list) or not all(isinstance(p, str) and os.path.isabs(p)
+                                                          for p in paths):
+                    raise ValueError("Пути должны быть списком абсолютных путей")
+                options = validate_options(message.get('options', {}))
+                self._requests.put(_Request(conn, paths, options))
+                return
+            if command == 'ping':
+                _send(conn, {'status': 'ok', 'jobs': self.jobs, 'pid': os.getpid()})
+            elif command == 'stop':
+                _send(conn, {'status': 'stopping'})
+                conn.close()
+                self.stop()
+                return
+            else:
+                raise ValueError(f"Неизвестная команда: {command}")
+        except ValueError as e:
+            try:
+                _send(conn, {'status': 'error', 'error': str(e)})
+            except OSError:
+                pass
+        except OSError:
+            pass
+        conn.close()
+
+    def _batch_loop(self):
+        while not self._stopped.is_set():
+            try:
+                batch = [self._requests.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _result(self, request, path, ok):
+        request.success += bool(ok)
+        try:
+            _send(request.conn, {'status': 'result', 'path': path, 'ok': bool(ok)})
+        except OSError:
+            pass  # Клиент уже отключился, результат остается только в логе сервиса
+
+    def _run_batch(self, batch):
+        from concurrent.futures import as_completed
+        from discovery import is_webp_name
+        from conversion import convert_webp_to_png
+
+        self.batches_run += 1
+        futures = {}
+        for request in batch:
+            for path in _expand(request.paths):
+                request.total += 1
+                if not (is_webp_name(path) and os.path.isfile(path)):
+                    # Сервис конвертирует и удаляет только WebP файлы
+                    print(f"❌ Не WebP файл: {path}")
+                    self._result(request, path, False)
+                    continue
+                futures[self._executor.submit(convert_webp_to_png, path, **request.options)] = (request, path)
+                request.remaining += 1
+            if request.remaining == 0:
+                self._finish(request)
+
+        for future in as_completed(futures):
+            request, path = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка в рабочем процессе для {path}: {e}")
+                ok = False
+            request.remaining -= 1
+            self._result(request, path, ok)
+            if request.remaining == 0:
+                self._finish(request)
+
+    def _finish(self, request):
+        try:
+            _send(request.conn, {'status': 'done', 'success': request.success, 'total': request.total})
+        except OSError:
+            pass
+        request.conn.close()
+
+
+def _connect(address=None):
+    """
+    Подключается к сервису
+
+    Рукопожатие взаимное: сервис, не знающий ключа, не пройдет проверку клиента.
+
+    Raises:
+        OSError: Сервис не запущен (в том числе нет файла ключа)
+        AuthenticationError: Ключ не совпал
+    """
+    return Client(address or default_address(), authkey=_authkey())
+
+
+def is_running(address=None):
+    """Проверяет, отвечает ли сервис"""
+    try:
+        conn = _connect(address)
+    except (OSError, AuthenticationError):
+        return False
+    with conn:
+        try:
+            _send(conn, {'command': 'ping'})
+            return _recv(conn).get('status') == 'ok'
+        except (EOFError, OSError, ValueError):
+            return False
+
+
+def submit(paths, options=None, address=None, on_result=None):
+    """
+    Передает файлы сервису и ждет завершения конвертации
+
+    Args:
+        paths (list): Пути к WebP файлам или папкам
+        options (dict, optional): Параметры convert_webp_to_png из OPTION_TYPES
+            (delete_original, png_options, keep_alpha и т.д.)
+        address (str, optional): Адрес сервиса
+        on_result (callable, optional): Вызывается как on_result(path, ok) для каждого файла
+
+    Returns:
+        tuple: (успешно, всего) или None, если сервис не запущен
+    """
+    try:
+        conn = _connect(address)
+    except (OSError, AuthenticationError):
+        return None
+
+    with conn:
+        _send(conn, {'command': 'convert', 'paths': [os.path.abspath(p) for p in paths],
+                     'options': options or {}})
+        while True:
+            message = _recv(conn)
+            if message['status'] == 'result':
+                if on_result is not None:
+                    on_result(message['path'], message['ok'])
+            elif message['status'] == 'done':
+                return message['success'], message['total']
+            else:
+                raise RuntimeError(message.get('error', 'Ошибка сервиса конвертации'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Фоновый сервис конвертации WebP в PNG')
+    parser.add_argument('command', choices=('serve', 'status', 'stop'), help='Действие')
+    parser.add_argument('--address', help='Адрес сокета или именованного канала')
+    parser.add_argument('-j', '--jobs', type=int, help='Количество рабочих процессов')
+    parser.add_argument('--window', type=float, default=DEFAULT_COALESCE_WINDOW,
+                        help='Окно объединения запросов в пакет, секунды (по умолчанию %(default)s)')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        service = ConverterService(args.address, args.jobs, args.window)
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            service.stop()
+        return 0
+
+    if args.command == 'status':
+        if is_running(args.address):
+            print(f"[OK] Сервис запущен: {args.address or default_address()}")
+            return 0
+        print("[INFO] Сервис не запущен")
+        return 1
+
+    try:
+        conn = _connect(args.address)
+    except (OSError, AuthenticationError):
+        print("[INFO] Сервис не запущен")
+        return 1
+    with conn:
+        _send(conn, {'command': 'stop'})
+        _recv(conn)
+    print("[OK] Сервис остановлен")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
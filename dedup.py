@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Дедупликация одинаковых WebP файлов внутри пакета
+
+Каждое уникальное содержимое конвертируется один раз, а выходные файлы
+для остальных копий создаются жесткими ссылками или копированием готового PNG.
+"""
+
+import os
+
+# hashlib и shutil импортируются внутри функций: константы модуля нужны
+# точкам входа при каждом запуске, а сама дедупликация - только с --dedup
+
+DEDUP_MODES = ('link', 'copy')
+DEFAULT_DEDUP_MODE = 'link'
+# Сначала сравнивается хэш начала файла: разные файлы одного размера
+# обычно различаются уже в заголовке, и читать их целиком не нужно
+HEAD_BYTES = 64 * 1024
+
+
+def _head_hash(path):
+    import hashlib
+
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(HEAD_BYTES), digest_size=16).hexdigest()
+
+
+def _split_by(paths, key_func):
+    groups = {}
+    for path in paths:
+        groups.setdefault(key_func(path), []).append(path)
+    return groups.values()
+
+
+def find_duplicates(paths):
+    """
+    Группирует файлы с одинаковым содержимым
+
+    Файлы уникального размера не читаются вовсе, файлы одного размера
+    сравниваются по хэшу первых HEAD_BYTES, и только совпавшие - по хэшу
+    всего содержимого.
+
+    Args:
+        paths (iterable): Пути к файлам
+
+    Returns:
+        dict: {первый файл группы: [остальные файлы с тем же содержимым]}
+            в порядке исходного списка
+    """
+    from conversion_cache import file_hash
+
+    paths = list(paths)
+    groups = {}
+    for same_size in _split_by(paths, os.path.getsize):
+        if len(same_size) == 1:
+            groups[same_size[0]] = []
+            continue
+        for same_head in _split_by(same_size, _head_hash):
+            if len(same_head) > 1 and os.path.getsize(same_head[0]) > HEAD_BYTES:
+                same_content = _split_by(same_head, file_hash)
+            else:
+                same_content = [same_head]
+            for group in same_content:
+                groups[group[0]] = group[1:]
+    return {path: groups[path] for path in paths if path in groups}
+
+
+def converted_outputs(input_path, sizes=None, output_path=None):
+    """
+    Находит выходные файлы, созданные для input_path
+
+    Args:
+        input_path (str): Путь к исходному файлу
+        sizes (list, optional): Размеры, с которыми выполнялась конвертация (см. resize.py)
+        output_path (str, optional): Путь к выходному PNG, если он пишется не рядом
+            с исходником (--output-dir)
+
+    Returns:
+        list: name.png или кадры name_0000.png, name_0001.png, ... (режим --animation frames);
+            при нескольких размерах - name_WxH.png (или их кадры) для каждого размера
+    """
+    from resize import sized_output_paths
+
+    if output_path is None:
+        output_path = f"{os.path.splitext(input_path)[0]}.png"
+    outputs = []
+    for sized_path, _ in sized_output_paths(output_path, sizes):
+        if os.path.exists(sized_path):
+            outputs.append(sized_path)
+            continue
+        base_name = os.path.splitext(sized_path)[0]
+        index = 0
+        while os.path.exists(f"{base_name}_{index:04d}.png"):
+            outputs.append(f"{base_name}_{index:04d}.png")
+            index += 1
+    return outputs
+
+
+def materialize(source, target, mode=DEFAULT_DEDUP_MODE):
+    """
+    Создает target с содержимым source: жесткой ссылкой или копированием
+
+    Если жесткая ссылка невозможна (другой диск, файловая система без ссылок),
+    файл копируется. Замена выполняется атомарно через временный файл.
+
+    Returns:
+        str: 'link' или 'copy' - каким способом создан файл
+    """
+    temp_path = target + '.dedup.tmp'
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    kind = 'copy'
+    if mode == 'link':
+        try:
+            os.link(source, temp_path)
+            kind = 'link'
+        except OSError:
+            pass
+    if kind == 'copy':
+        import shutil
+        shutil.copyfile(source, temp_path)
+    os.replace(temp_path, target)
+    return kind
+
+
+class Deduplicator:
+    """
+    Учет дубликатов в пакете и статистика сэкономленной работы
+
+    Args:
+        paths (iterable): Пути к WebP файлам пакета
+        mode (str): link - жесткие ссылки (с откатом на копирование), copy - копии
+        sizes (list, optional): Размеры выходных файлов (см. resize.py)
+        output_path (callable, optional): Путь к выходному PNG по пути исходника
+            (по умолчанию рядом с исходником, см. output_tree.OutputTree.output_path)
+    """
+
+    def __init__(self, paths, mode=DEFAULT_DEDUP_MODE, sizes=None, output_path=None):
+        self.mode = mode
+        self.sizes = sizes
+        self.output_path = output_path or (lambda path: f"{os.path.splitext(path)[0]}.png")
+        self.groups = find_duplicates(paths)
+        self.duplicates = sum(len(dups) for dups in self.groups.values())
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+        self.links = 0
+        self.copies = 0
+
+    @property
+    def unique(self):
+        """Файлы, которые нужно сконвертировать"""
+        return list(self.groups)
+
+    def duplicates_of(self, path):
+        """Файлы с тем же содержимым, что и path"""
+        return self.groups.get(path, [])
+
+    def materialize(self, path, duplicate, seconds=0.0):
+        """
+        Создает выходные файлы дубликата из уже сконвертированного path
+
+        Args:
+            path (str): Сконвертированный файл группы
+            duplicate (str): Файл с тем же содержимым
+            seconds (float): Время конвертации path - столько сэкономлено на дубликате
+
+        Returns:
+            list: Созданные выходные файлы
+        """
+        outputs = converted_outputs(path, self.sizes, self.output_path(path))
+        if not outputs:
+            raise FileNotFoundError(f"Не найден выходной файл для {path}")
+        created = []
+        source_base = os.path.splitext(self.output_path(path))[0]
+        target_base = os.path.splitext(self.output_path(duplicate))[0]
+        for output in outputs:
+            target = target_base + output[len(source_base):]
+            if materialize(output, target, self.mode) == 'link':
+                self.links += 1
+            else:
+                self.copies += 1
+            created.append(target)
+        self.bytes_saved += os.path.getsize(duplicate)
+        self.seconds_saved += seconds
+        return created
+
+    def report(self):
+        """Возвращает строку со статистикой дедупликации"""
+        return (f"Дубликаты: {self.duplicates} файлов с повторяющимся содержимым, "
+                f"не декодировано {self.bytes_saved / 1e6:.1f} МБ, "
+                f"сэкономлено ~{self.seconds_saved:.1f} с CPU "
+                f"({self.links} жестких ссылок, {self.copies} копий)")
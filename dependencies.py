@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка и установка зависимостей конвертера
+
+Проверка не выполняется при каждом запуске: она нужна только по флагу
+--check-deps или после того, как конвертация не удалась из-за отсутствия Pillow.
+"""
+
+import sys
+
+
+def pillow_missing():
+    """Проверяет, что Pillow не установлена, не импортируя её"""
+    import importlib.util
+
+    return importlib.util.find_spec('PIL') is None
+
+
+def install_pillow():
+    """Устанавливает библиотеку Pillow если она не установлена"""
+    if not pillow_missing():
+        return True
+
+    import subprocess
+
+    print("⚠️ Устанавливаем библиотеку Pillow...")
+    try:
+        subprocess.check_call([sys.executable, "-m", "pip", "install", "Pillow"])
+    except (subprocess.CalledProcessError, OSError):
+        print("❌ Ошибка: Не удалось установить Pillow")
+        return False
+
+    # Только что установленный пакет должен находиться следующим импортом
+    import importlib
+    importlib.invalidate_caches()
+    return True
+
+
+def check_dependencies(install=True):
+    """
+    Проверяет наличие Pillow и поддержку WebP, при необходимости устанавливает Pillow
+
+    Args:
+        install (bool): Установить Pillow через pip, если она отсутствует
+
+    Returns:
+        bool: True если конвертация возможна
+    """
+    if pillow_missing():
+        if not install:
+            print("❌ Ошибка: Библиотека Pillow не установлена (pip install Pillow)")
+            return False
+        if not install_pillow():
+            return False
+
+    import PIL
+    from PIL import features
+
+    print(f"[OK] Pillow {PIL.__version__}")
+    if not features.check('webp'):
+        print("❌ Ошибка: Pillow собрана без поддержки WebP")
+        return False
+    print("[OK] Поддержка WebP")
+    return True
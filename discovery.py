@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Потоковый поиск WebP файлов в дереве директорий
+"""
+
+import os
+
+WEBP_EXTENSION = '.webp'
+
+
+def is_webp_name(name):
+    """Проверяет расширение файла без учета регистра (.webp, .WEBP, .WebP)"""
+    return name.lower().endswith(WEBP_EXTENSION)
+
+
+def iter_webp_files(directory, skip=()):
+    """
+    Рекурсивно находит WebP файлы, выдавая их по мере обнаружения
+
+    В отличие от os.walk и Path.glob, не накапливает список файлов: в памяти
+    хранится только стек еще не просмотренных директорий, поэтому конвертация
+    может начаться сразу после нахождения первого файла.
+
+    Args:
+        directory (str): Корневая директория
+        skip (iterable): Директории, в которые обход не заходит (например,
+            выходное дерево внутри исходного, см. output_tree.py)
+
+    Yields:
+        str: Путь к найденному WebP файлу
+    """
+    return iter_files(directory, is_webp_name, skip)
+
+
+def iter_files(directory, match=None, skip=()):
+    """
+    Рекурсивно находит файлы, выдавая их по мере обнаружения (см. iter_webp_files)
+
+    Args:
+        directory (str): Корневая директория
+        match (callable, optional): Отбор по имени файла; по умолчанию все файлы
+        skip (iterable): Директории, в которые обход не заходит
+
+    Yields:
+        str: Путь к найденному файлу
+    """
+    skip = {os.path.normcase(os.path.abspath(path)) for path in skip}
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not skip or os.path.normcase(os.path.abspath(entry.path)) not in skip:
+                                stack.append(entry.path)
+                        elif (match is None or match(entry.name)) and entry.is_file():
+                            yield entry.path
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"⚠️ Не удалось прочитать директорию {current}: {e}")
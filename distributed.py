@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Распределенная конвертация одного дерева несколькими узлами через общую файловую систему
+
+Каждый узел обходит дерево сам и забирает файлы через файлы аренды в папке
+.webp2png-leases в корне дерева. Аренда создается атомарно (O_CREAT | O_EXCL),
+пока файл конвертируется, узел продлевает её, обновляя время изменения, а
+аренда, которую не продлевали дольше ttl, считается брошенной (узел упал)
+и забирается другим узлом.
+
+Аренда только распределяет работу. Единственность результата обеспечивает
+запись: PNG пишется во временный файл узла и публикуется жесткой ссылкой
+под итоговым именем. Ссылка не создается, если файл уже существует, поэтому
+даже если два узла сконвертировали один файл, записан будет ровно один результат.
+Временные файлы упавшего узла удаляет узел, забравший его брошенную аренду.
+SQLite для очереди задач не используется: блокировки SQLite ненадежны на NFS/SMB.
+"""
+
+import io
+import os
+import sys
+import time
+import json
+import socket
+import hashlib
+import threading
+import contextlib
+
+from dedup import converted_outputs
+from resize import sized_output_paths
+
+LEASE_DIRNAME = '.webp2png-leases'
+DEFAULT_LEASE_TTL = 120.0
+
+
+def default_node_id():
+    """Идентификатор узла: имя хоста и PID"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def is_converted(input_path, sizes=None):
+    """Проверяет, опубликован ли PNG (или первый кадр в режиме --animation frames)"""
+    output_path, _ = sized_output_paths(f"{os.path.splitext(input_path)[0]}.png", sizes)[0]
+    base_name = os.path.splitext(output_path)[0]
+    return os.path.exists(output_path) or os.path.exists(f"{base_name}_0000.png")
+
+
+class LeaseManager:
+    """
+    Аренда файлов дерева для текущего узла
+
+    Args:
+        directory (str): Корень общего дерева
+        node_id (str, optional): Идентификатор узла (по умолчанию хост-PID)
+        ttl (float): Через сколько секунд без продления аренда считается брошенной
+    """
+
+    def __init__(self, directory, node_id=None, ttl=DEFAULT_LEASE_TTL):
+        self.directory = directory
+        self.lease_dir = os.path.join(directory, LEASE_DIRNAME)
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        self.claimed = 0
+        self.reclaimed = 0
+        self.busy = 0
+        self._held = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = None
+        os.makedirs(self.lease_dir, exist_ok=True)
+
+    def lease_path(self, path):
+        key = os.path.relpath(path, self.directory).replace(os.sep, '/')
+        return os.path.join(self.lease_dir, hashlib.blake2b(key.encode('utf-8'), digest_size=16).hexdigest())
+
+    def _create(self, lease_path, path):
+        flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY
+        try:
+            fd = os.open(lease_path, flags, 0o644)
+        except FileExistsError:
+            return False
+        except FileNotFoundError:
+            # Папку аренд удалил узел, закончивший работу раньше
+            os.makedirs(self.lease_dir, exist_ok=True)
+            try:
+                fd = os.open(lease_path, flags, 0o644)
+            except FileExistsError:
+                return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'node': self.node_id, 'path': path}, f)
+        with self._lock:
+            self._held[path] = lease_path
+        return True
+
+    def is_expired(self, lease_path):
+        try:
+            return time.time() - os.stat(lease_path).st_mtime > self.ttl
+        except FileNotFoundError:
+            return True
+
+    def claim(self, path):
+        """
+        Пытается взять файл в работу
+
+        Returns:
+            bool: True если аренда получена этим узлом
+        """
+        lease_path = self.lease_path(path)
+        if self._create(lease_path, path):
+            self.claimed += 1
+            return True
+
+        if not self.is_expired(lease_path):
+            self.busy += 1
+            return False
+
+        # Брошенная аренда: переименование атомарно, поэтому забрать её может
+        # только один узел, остальные получат FileNotFoundError
+        stale_path = f"{lease_path}.{self.node_id}.stale"
+        try:
+            os.rename(lease_path, stale_path)
+        except FileNotFoundError:
+            self.busy += 1
+            return False
+        if not self.is_expired(stale_path):
+            # Между проверкой и переименованием аренду успел обновить другой узел:
+            # возвращаем её на место, если за это время не создана новая
+            try:
+                os.link(stale_path, lease_path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            self.busy += 1
+            return False
+        stale_node = lease_owner(stale_path)
+        os.remove(stale_path)
+        if self._create(lease_path, path):
+            if stale_node is not None:
+                remove_temp_outputs(path, stale_node)
+            self.claimed += 1
+            self.reclaimed += 1
+            return True
+        self.busy += 1
+        return False
+
+    def release(self, path):
+        """Снимает аренду после обработки файла"""
+        with self._lock:
+            lease_path = self._held.pop(path, None)
+        if lease_path is not None:
+            try:
+                os.remove(lease_path)
+            except FileNotFoundError:
+                pass
+
+    def _renew(self):
+        while not self._stopped.wait(self.ttl / 3):
+            with self._lock:
+                held = list(self._held.values())
+            for lease_path in held:
+                try:
+                    os.utime(lease_path)
+                except FileNotFoundError:
+                    pass
+
+    def start(self):
+        """Запускает продление аренд в фоновом потоке"""
+        self._heartbeat = threading.Thread(target=self._renew, name='webp2png-lease', daemon=True)
+        self._heartbeat.start()
+
+    def close(self):
+        """
+        Останавливает продление и снимает оставшиеся аренды
+
+        Если узел упал и close не вызван, его аренды истекут через ttl
+        и будут забраны другими узлами.
+        """
+        self._stopped.set()
+        self._heartbeat.join()
+        with self._lock:
+            held = list(self._held)
+        for path in held:
+            self.release(path)
+        try:
+            os.rmdir(self.lease_dir)  # Получится только у последнего узла
+        except OSError:
+            pass
+
+    def iter_claimed(self, paths, delete_original=False, poll_interval=None, sizes=None):
+        """
+        Отбирает файлы, которые обработает этот узел
+
+        Файлы, занятые другими узлами, откладываются и проверяются снова после
+        обхода: если их аренда истекла, файл забирается этим узлом. Так работа
+        упавшего узла доделывается без перезапуска.
+
+        Args:
+            paths (iterable): Пути к WebP файлам дерева
+            delete_original (bool): Файл с готовым PNG тоже нужно забрать, чтобы удалить исходник
+            poll_interval (float, optional): Пауза между проверками отложенных файлов
+            sizes (list, optional): Размеры выходных файлов (см. resize.py)
+
+        Yields:
+            str: Путь к файлу, аренда которого получена
+        """
+        if poll_interval is None:
+            poll_interval = min(5.0, self.ttl / 4)
+
+        def done(path):
+            if not os.path.exists(path):
+                return True
+            return not delete_original and is_converted(path, sizes)
+
+        deferred = []
+        for path in paths:
+            if done(path):
+                continue
+            if self.claim(path):
+                yield path
+            else:
+                deferred.append(path)
+
+        while deferred:
+            time.sleep(poll_interval)
+            waiting = []
+            for path in deferred:
+                if done(path):
+                    continue
+                if self.claim(path):
+                    yield path
+                else:
+                    waiting.append(path)
+            deferred = waiting
+
+    def report(self):
+        """Возвращает строку со статистикой узла"""
+        return (f"Узел {self.node_id}: взято {self.claimed} файлов "
+                f"(из них {self.reclaimed} после брошенной аренды), "
+                f"{self.busy} раз файл был занят другим узлом")
+
+
+def lease_owner(lease_path):
+    """Идентификатор узла, создавшего аренду, или None, если файл аренды не прочитать"""
+    try:
+        with open(lease_path, encoding='utf-8') as f:
+            return json.load(f)['node']
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def temp_prefix(path, node_id):
+    """Начало имен временных файлов узла для исходника path (name.<узел>.tmp)"""
+    return f"{os.path.splitext(path)[0]}.{node_id}.tmp"
+
+
+def remove_temp_outputs(path, node_id):
+    """
+    Удаляет временные файлы узла для исходника path
+
+    Упавший узел мог оставить недописанный PNG, кадры или несколько размеров,
+    поэтому удаляются все файлы с его префиксом рядом с исходником.
+
+    Returns:
+        int: Количество удаленных файлов
+    """
+    prefix = os.path.basename(temp_prefix(path, node_id))
+    removed = 0
+    try:
+        with os.scandir(os.path.dirname(path) or '.') as entries:
+            names = [entry.path for entry in entries if entry.name.startswith(prefix)]
+    except OSError:
+        return 0
+    for name in names:
+        try:
+            os.remove(name)
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def publish(temp_path, final_path):
+    """
+    Публикует временный файл под итоговым именем, только если его еще нет
+
+    Returns:
+        bool: True если опубликован этот файл, False если результат уже записан другим узлом
+    """
+    try:
+        os.link(temp_path, final_path)
+    except FileExistsError:
+        return False
+    except OSError:
+        # Файловая система без жестких ссылок. В Windows rename не заменяет
+        # существующий файл и остается атомарным, в остальных системах
+        # возможна гонка между проверкой и заменой
+        if sys.platform == 'win32':
+            try:
+                os.rename(temp_path, final_path)
+                return True
+            except FileExistsError:
+                return False
+        if os.path.exists(final_path):
+            return False
+        os.replace(temp_path, final_path)
+        return True
+    os.remove(temp_path)
+    return True
+
+
+def convert_claimed(path, convert_func, node_id, delete_original=False, **kwargs):
+    """
+    Конвертирует взятый в аренду файл с единственной публикацией результата
+
+    Объявлена на уровне модуля, чтобы её можно было передать в пул процессов
+    через functools.partial.
+
+    Args:
+        path (str): Путь к WebP файлу
+        convert_func (callable): batch.convert_file с функцией конвертации
+        node_id (str): Идентификатор узла для имен временных файлов
+        delete_original (bool): Удалить исходник после публикации
+        **kwargs: Параметры convert_func
+
+    Returns:
+        batch.FileResult: Результат; skipped, если файл уже сконвертирован другим узлом
+    """
+    from batch import FileResult
+
+    base_name = os.path.splitext(path)[0]
+    temp_base = temp_prefix(path, node_id)
+
+    if is_converted(path, kwargs.get('sizes')):
+        # Результат уже опубликован другим узлом, который не успел удалить исходник
+        record = FileResult(path, 'skipped')
+    else:
+        captured = io.StringIO()
+        with contextlib.redirect_stdout(captured):
+            record = convert_func(path, output_path=f"{temp_base}.png", **kwargs)
+        # В сообщениях конвертера вместо временного имени показываем итоговое
+        print(captured.getvalue().replace(temp_base, base_name), end='')
+        if record.error:
+            record.error = record.error.replace(temp_base, base_name)
+        if record.ok:
+            outputs = converted_outputs(f"{temp_base}.webp", kwargs.get('sizes'))
+            published = []
+            for index, output in enumerate(outputs):
+                target = base_name + output[len(temp_base):]
+                if publish(output, target):
+                    published.append(target)
+                elif index == 0:
+                    break  # Другой узел уже записал этот файл
+            for output in outputs:
+                if os.path.exists(output):
+                    os.remove(output)
+            record.outputs = published
+            if not published:
+                record.status = 'skipped'
+                if not kwargs.get('quiet'):
+                    print(f"ℹ️ {path} уже сконвертирован другим узлом")
+
+    if record.ok and delete_original:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return record
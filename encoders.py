@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кодировщики выходных форматов (--format)
+
+Каждый формат описывается объектом Encoder: формат Pillow, расширение файла,
+пресеты скорости/размера и правила подготовки цветового режима. Названия
+пресетов (fastest, balanced, smallest) у всех форматов одинаковые, поэтому
+--png-speed и benchmark.py работают с любым форматом.
+
+Режимы обрабатываются по-разному: PNG пишет 1, L, LA, P и 16 бит без
+преобразования, TIFF - то же, кроме палитры, WebP хранит только RGB и RGBA,
+а JPEG не хранит прозрачность, и изображение всегда накладывается на фон,
+даже с --keep-alpha.
+
+APNG, запись полосами (banded_png) и --smallest существуют только для PNG:
+в остальные форматы анимация конвертируется первым кадром.
+"""
+
+import os
+
+from png_presets import PNG_PRESETS, DEFAULT_PNG_SPEED, png_save_options
+from image_ops import PNG_NATIVE_MODES, prepare_image, has_alpha
+
+DEFAULT_FORMAT = 'png'
+
+
+class Encoder:
+    """
+    Выходной формат
+
+    Args:
+        name (str): Имя формата для --format
+        pillow_format (str): Формат для Image.save
+        extension (str): Расширение выходного файла
+        presets (dict): Параметры Image.save для каждого пресета скорости
+        default_speed (str): Пресет по умолчанию
+        native_modes (tuple): Режимы, которые формат хранит без преобразования
+        alpha (bool): Формат хранит прозрачность
+    """
+
+    def __init__(self, name, pillow_format, extension, presets, default_speed='smallest',
+                 native_modes=('RGB', 'RGBA'), alpha=True):
+        self.name = name
+        self.pillow_format = pillow_format
+        self.extension = extension
+        self.presets = presets
+        self.default_speed = default_speed
+        self.native_modes = native_modes
+        self.alpha = alpha
+
+    def save_options(self, speed=None):
+        """
+        Параметры Image.save для пресета
+
+        Raises:
+            ValueError: Неизвестный пресет
+        """
+        speed = speed or self.default_speed
+        if speed not in self.presets:
+            raise ValueError(f"Неизвестный пресет {self.name}: {speed}")
+        return dict(self.presets[speed])
+
+    def output_path(self, input_path):
+        """Выходной файл рядом с исходником"""
+        return os.path.splitext(input_path)[0] + self.extension
+
+    def prepare(self, img, keep_alpha=False, background=None):
+        """
+        Приводит изображение к режиму, который формат может записать
+
+        Args:
+            img (PIL.Image.Image): Декодированное изображение
+            keep_alpha (bool): Сохранить прозрачность, если формат ее хранит
+            background (tuple, optional): Цвет фона для удаления прозрачности
+
+        Returns:
+            PIL.Image.Image: Исходное изображение или его преобразованная копия
+        """
+        img = prepare_image(img, keep_alpha and self.alpha, background)
+        if img.mode not in self.native_modes:
+            img = img.convert('RGBA' if has_alpha(img) else 'RGB')
+        return img
+
+    def encode(self, img, options=None):
+        """Кодирует подготовленное изображение в память"""
+        import io
+
+        buffer = io.BytesIO()
+        img.save(buffer, self.pillow_format, **(self.save_options() if options is None else options))
+        return buffer.getvalue()
+
+    def save(self, img, output_path, options=None, profiler=None):
+        """
+        Сохраняет подготовленное изображение
+
+        Файл пишется под временным именем и переименовывается после записи.
+        При включенном профилировании кодирование выполняется в память, чтобы
+        время сжатия (encode) и записи на диск (write) замерялись раздельно.
+
+        Args:
+            img (PIL.Image.Image): Изображение
+            output_path (str): Путь для выходного файла
+            options (dict, optional): Параметры сохранения (по умолчанию пресет default_speed)
+            profiler (profiling.StageProfiler, optional): Профайлер этапов
+        """
+        from atomic_files import atomic_output
+
+        if options is None:
+            options = self.save_options()
+
+        if profiler is None or not profiler.enabled:
+            with atomic_output(output_path) as temp_path:
+                img.save(temp_path, self.pillow_format, **options)
+            return
+
+        with profiler.stage('encode'):
+            data = self.encode(img, options)
+        with profiler.stage('write'):
+            with atomic_output(output_path) as temp_path:
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+
+
+ENCODERS = {}
+
+
+def register_encoder(encoder):
+    """Добавляет формат в реестр (доступен в --format и benchmark.py)"""
+    ENCODERS[encoder.name] = encoder
+    return encoder
+
+
+def get_encoder(name=DEFAULT_FORMAT):
+    """
+    Кодировщик по имени формата
+
+    Raises:
+        ValueError: Неизвестный формат
+    """
+    try:
+        return ENCODERS[name or DEFAULT_FORMAT]
+    except KeyError:
+        raise ValueError(f"Неизвестный выходной формат: {name}") from None
+
+
+def save_options(output_format=DEFAULT_FORMAT, speed=None, compress_level=None, strategy=None):
+    """
+    Параметры сохранения для формата и пресета
+
+    Args:
+        output_format (str): Имя формата из ENCODERS
+        speed (str, optional): Пресет (по умолчанию пресет формата)
+        compress_level (int, optional): Уровень zlib 0-9, только для PNG
+        strategy (str, optional): Стратегия zlib, только для PNG
+
+    Raises:
+        ValueError: Неизвестный формат или пресет, параметры zlib не для PNG
+    """
+    encoder = get_encoder(output_format)
+    if encoder.name == 'png':
+        return png_save_options(speed or encoder.default_speed, compress_level, strategy)
+    if compress_level is not None or strategy is not None:
+        raise ValueError(f"Уровень и стратегия zlib задаются только для PNG, а не для {encoder.name}")
+    return encoder.save_options(speed)
+
+
+register_encoder(Encoder('png', 'PNG', '.png', PNG_PRESETS, DEFAULT_PNG_SPEED,
+                         native_modes=PNG_NATIVE_MODES))
+# JPEG с потерями: качество одинаковое во всех пресетах, они отличаются только
+# оптимизацией таблиц Хаффмана и прогрессивной разверткой
+register_encoder(Encoder('jpeg', 'JPEG', '.jpg', {
+    'fastest': {'quality': 95},
+    'balanced': {'quality': 95, 'optimize': True},
+    'smallest': {'quality': 95, 'optimize': True, 'progressive': True},
+}, native_modes=('L', 'RGB'), alpha=False))
+# WebP без потерь: method - глубина поиска (0-6), quality - усилие сжатия;
+# exact сохраняет цвет полностью прозрачных пикселей
+register_encoder(Encoder('webp', 'WEBP', '.webp', {
+    'fastest': {'lossless': True, 'exact': True, 'method': 0, 'quality': 0},
+    'balanced': {'lossless': True, 'exact': True, 'method': 4, 'quality': 75},
+    'smallest': {'lossless': True, 'exact': True, 'method': 6, 'quality': 100},
+}))
+register_encoder(Encoder('tiff', 'TIFF', '.tif', {
+    'fastest': {},
+    'balanced': {'compression': 'packbits'},
+    'smallest': {'compression': 'tiff_adobe_deflate'},
+}, native_modes=('1', 'L', 'LA', 'RGB', 'RGBA', 'I;16')))
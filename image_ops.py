@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Подготовка декодированного изображения к сохранению: прозрачность и цветовой режим
+"""
+
+DEFAULT_BACKGROUND = (255, 255, 255)
+
+_BASIC_COLORS = {'white': DEFAULT_BACKGROUND, 'black': (0, 0, 0)}
+
+# Режимы, которые PNG хранит без преобразования
+PNG_NATIVE_MODES = ('1', 'L', 'LA', 'P', 'RGB', 'RGBA', 'I;16')
+
+
+def parse_color(value):
+    """
+    Разбирает цвет фона: имя (white), #RRGGBB или rgb(...)
+
+    Частые значения разбираются без импорта Pillow, чтобы не замедлять запуск
+    конвертации папки, где главному процессу Pillow не нужна.
+
+    Returns:
+        tuple: (R, G, B)
+    """
+    name = value.strip().lower()
+    if name in _BASIC_COLORS:
+        return _BASIC_COLORS[name]
+    if len(name) == 7 and name.startswith('#'):
+        try:
+            return tuple(int(name[i:i + 2], 16) for i in (1, 3, 5))
+        except ValueError:
+            pass
+
+    from PIL import ImageColor
+
+    return ImageColor.getrgb(value)[:3]
+
+
+def has_alpha(img):
+    """Проверяет, есть ли у изображения прозрачность"""
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def flatten_alpha(img, background=None):
+    """
+    Накладывает изображение с прозрачностью на сплошной фон за один проход
+
+    Вместо img.split(), который создает копию каждого канала, изображение
+    само передается как маска: Pillow берет альфа-канал напрямую. Выделяется
+    только итоговый RGB холст.
+
+    Args:
+        img (PIL.Image.Image): Изображение в режиме RGBA, LA, PA или P с прозрачностью
+        background (tuple, optional): Цвет фона (R, G, B), по умолчанию белый
+
+    Returns:
+        PIL.Image.Image: Изображение в режиме RGB
+    """
+    from PIL import Image
+
+    if img.mode not in ('RGBA', 'LA'):
+        img = img.convert('RGBA')
+    canvas = Image.new('RGB', img.size, background or DEFAULT_BACKGROUND)
+    canvas.paste(img, mask=img)
+    return canvas
+
+
+def prepare_image(img, keep_alpha=False, background=None):
+    """
+    Приводит изображение к режиму для записи в PNG
+
+    Args:
+        img (PIL.Image.Image): Декодированное изображение
+        keep_alpha (bool): Сохранить прозрачность (RGBA/LA пишутся без копирования)
+        background (tuple, optional): Цвет фона для удаления прозрачности, по умолчанию белый
+
+    Returns:
+        PIL.Image.Image: Исходное изображение или его преобразованная копия
+    """
+    if keep_alpha:
+        if img.mode in PNG_NATIVE_MODES:
+            return img
+        return img.convert('RGBA' if has_alpha(img) else 'RGB')
+
+    if has_alpha(img):
+        return flatten_alpha(img, background)
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
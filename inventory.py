@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Предварительный просмотр папки (--scan): опись WebP файлов и оценка времени
+
+Каждый файл дерева открывается только ради первых байт заголовка: тип
+определяется по сигнатуре RIFF/WEBP, а не по расширению, поэтому находятся
+и WebP с другим расширением, и файлы .webp, которые на самом деле являются
+PNG или JPEG. Размеры, прозрачность и анимация берутся из заголовка
+(см. webp_header.py), кадры анимации считаются по заголовкам чанков.
+Файлы читаются в пуле потоков: время определяется задержкой диска,
+а не процессором.
+
+Время конвертации оценивается по мегапикселям всех кадров. Скорость
+(секунд на мегапиксель) берется из результатов benchmark.py run --json
+или из трассы --profile-trace прошлого запуска, а без них - из
+ориентировочной таблицы DEFAULT_SECONDS_PER_MEGAPIXEL.
+"""
+
+import os
+import heapq
+import time
+
+from discovery import is_webp_name, iter_files
+from webp_header import HEADER_BYTES, parse_webp_header, read_extended
+
+# Потоков чтения заголовков
+DEFAULT_SCAN_THREADS = 32
+# Файлов в одной задаче потока: задача на каждый файл стоит дороже чтения заголовка
+SCAN_BATCH = 256
+# Сколько самых больших изображений показывать в описи
+LARGEST_COUNT = 5
+# Ориентировочная скорость конвертации одним процессом без калибровки, с/Мп
+DEFAULT_SECONDS_PER_MEGAPIXEL = {'fastest': 0.05, 'balanced': 0.12, 'smallest': 0.2}
+# Постоянные затраты на файл (открытие, запись, запуск задачи в пуле), с
+FILE_OVERHEAD_SECONDS = 0.003
+
+# Сигнатуры, по которым называется настоящий формат файла с расширением .webp
+OTHER_SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'GIF8', 'GIF'),
+    (b'BM', 'BMP'),
+    (b'II*\x00', 'TIFF'),
+    (b'MM\x00*', 'TIFF'),
+)
+
+
+class ScanEntry:
+    """
+    Результат просмотра одного файла
+
+    Attributes:
+        path (str): Путь к файлу
+        size (int): Размер файла в байтах
+        header (webp_header.WebPHeader): Заголовок WebP (None - не WebP или поврежден)
+        error (str): Причина, по которой WebP считается поврежденным
+        misnamed (bool): Содержимое WebP, а расширение другое
+    """
+
+    __slots__ = ('path', 'size', 'header', 'error', 'misnamed')
+
+    def __init__(self, path, size=0, header=None, error=None, misnamed=False):
+        self.path = path
+        self.size = size
+        self.header = header
+        self.error = error
+        self.misnamed = misnamed
+
+    @property
+    def is_webp(self):
+        return self.header is not None or self.error is not None
+
+
+def _sniff_other(data):
+    for signature, name in OTHER_SIGNATURES:
+        if data.startswith(signature):
+            return name
+    return None
+
+
+def probe_file(path):
+    """
+    Определяет тип файла по сигнатуре и читает заголовок WebP
+
+    Returns:
+        ScanEntry: Для файлов, не являющихся WebP и не названных .webp,
+            header и error равны None
+    """
+    named_webp = is_webp_name(path)
+    size = 0
+    try:
+        # os.open и os.read вдвое быстрее open(): без буфера и объекта файла
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            size = os.fstat(fd).st_size
+            data = os.read(fd, HEADER_BYTES)
+            if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+                if not named_webp:
+                    return ScanEntry(path, size)
+                other = _sniff_other(data)
+                return ScanEntry(path, size, error=f"на самом деле {other}" if other
+                                 else "не является WebP файлом")
+            header = parse_webp_header(data)
+            if header.declared_size > size:
+                return ScanEntry(path, size, error=f"файл обрезан: {size} из {header.declared_size} байт",
+                                 misnamed=not named_webp)
+            if header.extended:
+                # Сжатие (и кадры анимации) расширенного формата - в следующих чанках
+                with os.fdopen(fd, 'rb', closefd=False) as f:
+                    read_extended(f, header, with_frames=True)
+                if header.animated and not header.frames:
+                    return ScanEntry(path, size, error="анимация без кадров", misnamed=not named_webp)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        return ScanEntry(path, error=f"не удалось прочитать: {e}") if named_webp else ScanEntry(path)
+    except ValueError as e:
+        return ScanEntry(path, size, error=str(e), misnamed=not named_webp)
+    return ScanEntry(path, size, header, misnamed=not named_webp)
+
+
+def _probe_batch(paths):
+    return [probe_file(path) for path in paths]
+
+
+def iter_probes(paths, threads=DEFAULT_SCAN_THREADS):
+    """
+    Просматривает файлы в пуле потоков пачками по SCAN_BATCH, читая пути лениво
+
+    Yields:
+        ScanEntry: Результаты в порядке завершения пачек
+    """
+    from itertools import islice
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    paths = iter(paths)
+    pending = set()
+    exhausted = False
+    with ThreadPoolExecutor(threads, thread_name_prefix='webp2png-scan') as executor:
+        while True:
+            while not exhausted and len(pending) < threads * 2:
+                batch = list(islice(paths, SCAN_BATCH))
+                if not batch:
+                    exhausted = True
+                    break
+                pending.add(executor.submit(_probe_batch, batch))
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+class Calibration:
+    """
+    Скорость конвертации для оценки времени
+
+    Args:
+        seconds_per_megapixel (float): Секунд на мегапиксель при jobs процессах
+        jobs (int): При скольких процессах замерена скорость
+        source (str): Откуда взята скорость (для отчета)
+    """
+
+    def __init__(self, seconds_per_megapixel, jobs=1, source="ориентировочная скорость без калибровки"):
+        self.seconds_per_megapixel = seconds_per_megapixel
+        self.jobs = jobs
+        self.source = source
+
+    @classmethod
+    def default(cls, png_speed):
+        return cls(DEFAULT_SECONDS_PER_MEGAPIXEL[png_speed])
+
+    @classmethod
+    def fit(cls, files, megapixels, seconds, jobs=1, source=''):
+        """Скорость по итогам прогона: время за вычетом постоянных затрат на файлы"""
+        if megapixels <= 0:
+            raise ValueError("в замерах нет изображений с известным размером")
+        variable = max(seconds - files * FILE_OVERHEAD_SECONDS / jobs, 0.0)
+        return cls(variable / megapixels, jobs, source)
+
+    def estimate(self, files, megapixels, jobs):
+        """Оценка времени конвертации в секундах при jobs процессах"""
+        seconds = files * FILE_OVERHEAD_SECONDS / self.jobs + megapixels * self.seconds_per_megapixel
+        # Масштабирование по процессам считается линейным: диск и память не учитываются
+        return seconds * self.jobs / max(jobs, 1)
+
+
+def _trace_megapixels(paths):
+    from webp_header import read_webp_header
+
+    measured = []
+    megapixels = 0.0
+    for path in paths:
+        try:
+            header = read_webp_header(path, with_frames=True)
+        except (OSError, ValueError):
+            continue
+        measured.append(path)
+        megapixels += header.pixels * header.frames / 1e6
+    return measured, megapixels
+
+
+def load_calibration(path, png_speed, jobs, output_format='png'):
+    """
+    Загружает скорость конвертации из результатов benchmark.py или трассы --profile-trace
+
+    Из результатов бенчмарка берется прогон process_directory с тем же
+    форматом, пресетом и числом процессов, иначе последовательный прогон convert.
+    Для трассы размеры изображений читаются из заголовков файлов,
+    которые еще лежат по записанным путям.
+
+    Raises:
+        OSError: Файл не удалось прочитать
+        ValueError: В файле нет данных для калибровки
+    """
+    import csv
+    import json
+
+    name = os.path.basename(path)
+    if path.lower().endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        timings = {row['file']: sum(float(value) for key, value in row.items() if key != 'file')
+                   for row in rows}
+    else:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if 'convert' in data:
+            # Результаты до появления --format не содержат формата: это прогоны PNG
+            runs = [run for run in data.get('process_directory', [])
+                    if run.get('png_speed') == png_speed and run.get('jobs') == jobs]
+            runs += [dict(run, jobs=1) for run in data['convert'] if run.get('png_speed') == png_speed]
+            runs = [run for run in runs if run.get('megapixels') and run.get('format', 'png') == output_format]
+            if not runs:
+                raise ValueError(f"{name}: нет прогона {output_format} с пресетом {png_speed} и размерами "
+                                 f"изображений (результаты старой версии benchmark.py?)")
+            run = runs[0]
+            return Calibration.fit(run['files'] - run.get('failures', 0), run['megapixels'], run['seconds'],
+                                   run['jobs'], f"{name}, {run['jobs']} проц.")
+        timings = {entry['file']: sum(entry['timings'].values()) for entry in data.get('files', [])}
+
+    measured, megapixels = _trace_megapixels(timings)
+    if not measured:
+        raise ValueError(f"{name}: файлы из трассы не найдены")
+    return Calibration.fit(len(measured), megapixels, sum(timings[file_path] for file_path in measured),
+                           source=f"{name}, {len(measured)} файлов")
+
+
+class Inventory:
+    """
+    Опись WebP файлов по результатам просмотра заголовков
+
+    Пути сохраняются только для поврежденных файлов, WebP с другим расширением
+    и LARGEST_COUNT самых больших изображений, поэтому память не зависит от
+    размера дерева.
+    """
+
+    def __init__(self):
+        self.scanned = 0
+        self.webp = 0
+        self.bytes = 0
+        self.megapixels = 0.0
+        self.frame_megapixels = 0.0
+        self.animated = 0
+        self.frames = 0
+        self.alpha = 0
+        self.lossless = 0
+        self.corrupt = []
+        self.misnamed = []
+        self.largest = []
+        self.seconds = 0.0
+
+    def add(self, entry):
+        """Учитывает результат просмотра файла"""
+        self.scanned += 1
+        if not entry.is_webp:
+            return
+        if entry.misnamed:
+            self.misnamed.append(entry.path)
+        if entry.error is not None:
+            self.corrupt.append((entry.path, entry.error))
+            return
+        header = entry.header
+        self.webp += 1
+        self.bytes += entry.size
+        megapixels = header.pixels / 1e6
+        self.megapixels += megapixels
+        self.frame_megapixels += megapixels * header.frames
+        if header.animated:
+            self.animated += 1
+            self.frames += header.frames
+        self.alpha += header.alpha
+        self.lossless += header.lossless
+        item = (header.pixels, entry.path, header.width, header.height)
+        if len(self.largest) < LARGEST_COUNT:
+            heapq.heappush(self.largest, item)
+        else:
+            heapq.heappushpop(self.largest, item)
+
+    def estimate(self, calibration, jobs):
+        """Оценка времени конвертации всех найденных WebP в секундах"""
+        return calibration.estimate(self.webp, self.frame_megapixels, jobs)
+
+    def largest_images(self):
+        """Самые большие изображения: [(путь, ширина, высота)] по убыванию"""
+        return [(path, width, height) for _, path, width, height in sorted(self.largest, reverse=True)]
+
+    def to_dict(self, calibration=None, jobs=1):
+        """Опись в виде словаря для JSON"""
+        summary = {
+            'scanned_files': self.scanned,
+            'webp_files': self.webp,
+            'webp_bytes': self.bytes,
+            'megapixels': round(self.megapixels, 3),
+            'frame_megapixels': round(self.frame_megapixels, 3),
+            'animated': self.animated,
+            'frames': self.frames,
+            'alpha': self.alpha,
+            'lossless': self.lossless,
+            'corrupt': [{'path': path, 'error': error} for path, error in self.corrupt],
+            'misnamed': self.misnamed,
+            'largest': [{'path': path, 'width': width, 'height': height}
+                        for path, width, height in self.largest_images()],
+            'scan_seconds': round(self.seconds, 3),
+        }
+        if calibration is not None:
+            summary['estimate'] = {
+                'seconds': round(self.estimate(calibration, jobs), 1),
+                'jobs': jobs,
+                'seconds_per_megapixel': round(calibration.seconds_per_megapixel, 5),
+                'calibration_jobs': calibration.jobs,
+                'source': calibration.source,
+            }
+        return summary
+
+    def report_lines(self, calibration=None, jobs=1):
+        """Строки описи для вывода (без пометок [INFO] и значков - их добавляет вызывающий)"""
+        from batch import format_duration
+
+        lines = [
+            f"Просмотрено файлов: {self.scanned} за {self.seconds:.1f} с",
+            f"WebP: {self.webp}, {self.bytes / 1e6:.1f} МБ, {self.megapixels:.1f} Мп",
+            f"Анимированных: {self.animated} ({self.frames} кадров), "
+            f"с прозрачностью: {self.alpha}, без потерь: {self.lossless}",
+            f"Поврежденных: {len(self.corrupt)}, WebP с другим расширением: {len(self.misnamed)}",
+        ]
+        for path, width, height in self.largest_images():
+            lines.append(f"Крупное: {path} ({width}x{height}, {width * height / 1e6:.1f} Мп)")
+        if calibration is not None:
+            lines.append(f"Оценка времени конвертации: {format_duration(self.estimate(calibration, jobs))} "
+                         f"при {jobs} проц. ({calibration.seconds_per_megapixel:.3f} с/Мп, {calibration.source})")
+        return lines
+
+
+def scan_paths(paths, threads=DEFAULT_SCAN_THREADS):
+    """
+    Составляет опись файлов
+
+    Args:
+        paths (iterable): Пути к файлам (список или генератор)
+        threads (int): Количество потоков чтения заголовков
+
+    Returns:
+        Inventory: Опись
+    """
+    inventory = Inventory()
+    started = time.perf_counter()
+    for entry in iter_probes(paths, threads):
+        inventory.add(entry)
+    # Потоки завершают файлы в произвольном порядке, а отчет должен быть воспроизводимым
+    inventory.corrupt.sort()
+    inventory.misnamed.sort()
+    inventory.seconds = time.perf_counter() - started
+    return inventory
+
+
+def scan_tree(directory, threads=DEFAULT_SCAN_THREADS):
+    """Составляет опись всех файлов дерева (тип определяется по сигнатуре)"""
+    return scan_paths(iter_files(directory), threads)
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Конвейер с перекрытием ввода-вывода и вычислений
+
+На сетевых дисках (NFS/SMB) обычная конвертация простаивает, пока файл
+читается и пока PNG записывается. Здесь работа разделена на три стадии:
+
+  чтение    - пул потоков читает файлы целиком в память;
+  обработка - пул процессов декодирует WebP из BytesIO и кодирует PNG в память;
+  запись    - пул потоков пишет результат во временный файл и атомарно
+              переименовывает его.
+
+Объем данных между стадиями ограничен в байтах: новые файлы не читаются,
+пока прочитанные и еще не записанные данные превышают лимит.
+"""
+
+import os
+import time
+import queue
+import threading
+from functools import partial
+
+from atomic_files import atomic_output
+from batch import FileResult, output_size
+from parallel import default_jobs, PENDING_PER_JOB
+
+DEFAULT_IO_THREADS = 4
+DEFAULT_IO_BUFFER_BYTES = 256 * 1024 * 1024
+
+
+class ByteBudget:
+    """
+    Ограничение объема данных в конвейере
+
+    Args:
+        limit_bytes (int): Максимальный объем прочитанных и еще не записанных данных
+        max_items (int, optional): Максимальное количество файлов в конвейере
+    """
+
+    def __init__(self, limit_bytes, max_items=None):
+        self.limit_bytes = limit_bytes
+        self.max_items = max_items
+        self.used = 0
+        self.items = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        """
+        Резервирует size байт под новый файл, ожидая освобождения места
+
+        Файл больше всего лимита допускается, когда конвейер пуст, иначе он
+        никогда не был бы обработан.
+        """
+        with self._condition:
+            while self.items and (self.used + size > self.limit_bytes
+                                  or (self.max_items and self.items >= self.max_items)):
+                self._condition.wait()
+            self.used += size
+            self.items += 1
+
+    def charge(self, size):
+        """Учитывает size байт без ожидания (результат уже находится в памяти)"""
+        with self._condition:
+            self.used += size
+
+    def release(self, size, finished=False):
+        """Освобождает size байт; finished=True - файл покинул конвейер"""
+        with self._condition:
+            self.used -= size
+            if finished:
+                self.items -= 1
+            self._condition.notify_all()
+
+
+def convert_buffer(input_path, data, output_path=None, png_options=None, keep_alpha=False,
+                   background=None, animation='apng', low_memory_pixels=None, sizes=None, smallest=None,
+                   output_format='png'):
+    """
+    Конвертирует WebP из памяти в PNG (или другой выходной формат) в памяти
+
+    Объявлена на уровне модуля, чтобы её можно было выполнить в пуле процессов.
+    Изображения, для которых включается запись полосами (banded_png), слишком
+    велики для буфера в памяти и записываются на диск прямо здесь: в списке
+    результатов они идут с None вместо байтов.
+
+    Args:
+        input_path (str): Путь к исходному файлу (для имени выходного файла)
+        data (bytes): Содержимое WebP файла
+        output_path (str, optional): Путь для выходного PNG файла
+        sizes (list, optional): Размеры WxH или Fx, получаемые из одного декодирования (см. resize.py)
+        smallest (dict, optional): Сохранять наименьший PNG из перебора (см. png_search.py)
+        output_format (str): Выходной формат из encoders.ENCODERS; APNG, запись полосами
+            и smallest есть только у PNG
+
+    Returns:
+        tuple: (список (путь, байты результата или None, если файл уже записан),
+            словарь {этап: секунды})
+    """
+    import io
+    from PIL import Image, UnidentifiedImageError
+    from encoders import get_encoder
+    from animation import APNGWriter, is_animated, iter_frames
+    from banded_png import use_low_memory, save_png_banded
+    from resize import sized_output_paths, resize_image
+    from profiling import StageProfiler
+
+    encoder = get_encoder(output_format)
+    is_png = encoder.name == 'png'
+    if png_options is None:
+        png_options = encoder.save_options()
+    if output_path is None:
+        output_path = encoder.output_path(input_path)
+
+    profiler = StageProfiler()
+    outputs = []
+    with profiler.stage('open'):
+        try:
+            source = Image.open(io.BytesIO(data))
+        except UnidentifiedImageError:
+            # Сообщение как при открытии по пути, а не с адресом BytesIO
+            raise UnidentifiedImageError(f"cannot identify image file {input_path!r}") from None
+    with source as img:
+        with profiler.stage('decode'):
+            img.load()
+
+        if animation != 'first' and is_png and is_animated(img):
+            for sized_path, size in sized_output_paths(output_path, sizes):
+                frames = iter_frames(img, keep_alpha, background, profiler, size)
+                if animation == 'frames':
+                    base_name = os.path.splitext(sized_path)[0]
+                    for index, (frame, _) in enumerate(frames):
+                        with profiler.stage('encode'):
+                            outputs.append((f"{base_name}_{index:04d}.png", encoder.encode(frame, png_options)))
+                else:
+                    buffer = io.BytesIO()
+                    writer = APNGWriter(buffer, img.n_frames, img.info.get('loop', 0), png_options)
+                    for frame, duration in frames:
+                        with profiler.stage('encode'):
+                            writer.add_frame(frame, duration)
+                    writer.close()
+                    outputs.append((sized_path, buffer.getvalue()))
+        else:
+            digest = None
+            for sized_path, size in sized_output_paths(output_path, sizes):
+                sized = img
+                if size is not None:
+                    with profiler.stage('resize'):
+                        sized = resize_image(img, size)
+                if is_png and use_low_memory(sized, low_memory_pixels):
+                    with profiler.stage('encode'):
+                        save_png_banded(sized, sized_path, png_options, keep_alpha, background)
+                    outputs.append((sized_path, None))
+                    continue
+                with profiler.stage('convert'):
+                    sized = encoder.prepare(sized, keep_alpha, background)
+                if smallest is not None and is_png:
+                    import hashlib
+                    import png_search
+
+                    if digest is None:
+                        # Тот же хэш, что у conversion_cache.file_hash: рецепты общие с конвертацией файлов
+                        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+                    key = png_search.search_key(digest, png_options, size, keep_alpha, background)
+                    with profiler.stage('encode'):
+                        png, _, _ = png_search.smallest_png(sized, png_options, smallest, key)
+                    outputs.append((sized_path, png))
+                    continue
+                with profiler.stage('encode'):
+                    outputs.append((sized_path, encoder.encode(sized, png_options)))
+
+    return outputs, profiler.timings
+
+
+def _read(path):
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data, time.perf_counter() - started
+
+
+def _write(outputs, input_path, delete_original):
+    timings = {}
+    started = time.perf_counter()
+    for output_path, data in outputs:
+        if data is None:
+            continue  # Записан полосами в convert_buffer
+        # Незаконченный PNG никогда не появляется под итоговым именем
+        with atomic_output(output_path) as temp_path, open(temp_path, 'wb') as f:
+            f.write(data)
+    timings['write'] = time.perf_counter() - started
+    error = None
+    if delete_original:
+        started = time.perf_counter()
+        try:
+            os.remove(input_path)
+        except OSError as e:
+            error = f"Не удалось удалить исходный файл: {e}"
+        timings['delete'] = time.perf_counter() - started
+    return timings, error
+
+
+def run_pipeline(files, jobs=None, io_threads=DEFAULT_IO_THREADS,
+                 buffer_bytes=DEFAULT_IO_BUFFER_BYTES, delete_original=False,
+                 with_records=False, quiet=False, output_path_for=None, **kwargs):
+    """
+    Конвертирует файлы конвейером чтение -> обработка -> запись
+
+    Args:
+        files (iterable): Пути к WebP файлам (список или генератор)
+        jobs (int, optional): Количество процессов обработки (по умолчанию число ядер CPU)
+        io_threads (int): Количество потоков чтения и столько же потоков записи
+        buffer_bytes (int): Лимит объема данных в конвейере
+        delete_original (bool): Удалить исходный файл после записи результата
+        with_records (bool): Возвращать вместо успеха запись batch.FileResult
+            (замеры этапов, размеры, ошибка)
+        quiet (bool): Не печатать ошибки (они сохраняются в записях)
+        output_path_for (callable, optional): Путь к выходному PNG по пути исходника
+            (по умолчанию рядом с исходником, см. output_tree.py)
+        **kwargs: Параметры convert_buffer (png_options, keep_alpha и т.д.)
+
+    Yields:
+        tuple: (путь к файлу, успех) или (путь, FileResult) при with_records,
+            в порядке завершения
+    """
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+    if jobs is None:
+        jobs = default_jobs()
+
+    budget = ByteBudget(buffer_bytes, max_items=max(1, jobs) * PENDING_PER_JOB + 2 * io_threads)
+    results = queue.Queue()
+    readers = ThreadPoolExecutor(io_threads, thread_name_prefix='webp2png-read')
+    writers = ThreadPoolExecutor(io_threads, thread_name_prefix='webp2png-write')
+    # При jobs=1 обработка идет в одном потоке текущего процесса
+    compute = ProcessPoolExecutor(jobs) if jobs > 1 else ThreadPoolExecutor(1)
+
+    def finish(size, record):
+        budget.release(size, finished=True)
+        results.put((record.path, record if with_records else record.ok))
+
+    def failed(path, stage, error, size, timings=None):
+        if not quiet:
+            print(f"❌ Ошибка конвейера ({stage}) для {path}: {error}")
+        timings = timings or {}
+        finish(size, FileResult(path, seconds=sum(timings.values()), timings=timings,
+                                error=f"Ошибка конвейера ({stage}): {error}"))
+
+    def on_written(path, input_size, size, banded_size, outputs, timings, future):
+        try:
+            written, error = future.result()
+        except Exception as e:
+            failed(path, 'запись', e, size, timings)
+            return
+        timings.update(written)
+        if error and not quiet:
+            print(f"⚠️ {error}: {path}")
+        finish(size, FileResult(path, 'converted', outputs, input_size, size + banded_size,
+                                sum(timings.values()), timings, error))
+
+    def on_computed(path, size, read_seconds, future):
+        try:
+            outputs, timings = future.result()
+        except Exception as e:
+            failed(path, 'обработка', e, size)
+            return
+        timings = dict(timings, read=read_seconds)
+        in_memory = sum(len(data) for _, data in outputs if data is not None)
+        # Исходные байты больше не нужны, вместо них в памяти результат
+        budget.charge(in_memory)
+        budget.release(size)
+        banded_size = output_size(output_path for output_path, data in outputs if data is None)
+        future = writers.submit(_write, outputs, path, delete_original)
+        future.add_done_callback(partial(on_written, path, size, in_memory, banded_size,
+                                         [output_path for output_path, _ in outputs], timings))
+
+    def on_read(path, size, future):
+        try:
+            data, read_seconds = future.result()
+        except Exception as e:
+            failed(path, 'чтение', e, size)
+            return
+        try:
+            output_path = output_path_for(path) if output_path_for is not None else None
+            future = compute.submit(convert_buffer, path, data, output_path, **kwargs)
+        except Exception as e:
+            failed(path, 'обработка', e, size)
+            return
+        future.add_done_callback(partial(on_computed, path, size, read_seconds))
+
+    submitted = 0
+    feed_error = None
+    done = threading.Event()
+    stopped = threading.Event()
+
+    def feed():
+        nonlocal submitted, feed_error
+        try:
+            for path in files:
+                if stopped.is_set():
+                    break
+                try:
+                    size = os.path.getsize(path)
+                except OSError as e:
+                    size = 0
+                    budget.acquire(size)
+                    submitted += 1
+                    failed(path, 'чтение', e, size)
+                    continue
+                budget.acquire(size)
+                submitted += 1
+                readers.submit(_read, path).add_done_callback(partial(on_read, path, size))
+        except Exception as e:
+            # Ошибка обхода (например, недоступная папка) передается получателю
+            feed_error = e
+        finally:
+            done.set()
+            results.put(None)  # Пробуждаем получателя, чтобы он увидел done
+
+    feeder = threading.Thread(target=feed, name='webp2png-feed', daemon=True)
+    feeder.start()
+    received = 0
+    try:
+        while not (done.is_set() and received == submitted):
+            item = results.get()
+            if item is None:
+                continue
+            received += 1
+            yield item
+        if feed_error is not None:
+            # Уже отправленные файлы обработаны, ошибку обхода поднимаем в вызывающем потоке
+            raise feed_error
+    finally:
+        # Получатель мог прекратить чтение раньше времени: новые файлы больше не берем
+        stopped.set()
+        feeder.join()
+        readers.shutdown()
+        compute.shutdown()
+        writers.shutdown()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал пакетной конвертации для продолжения прерванного запуска
+
+Журнал .webp2png-journal в корне директории - файл только для дописывания,
+по строке JSON на событие: файл найден (discovered), сконвертирован
+(converted), выходной PNG проверен (verified), исходник удален (deleted)
+или конвертация не удалась (failed). Записи сбрасываются на диск пачками,
+а исходники удаляются только после того, как их проверенные PNG и запись
+verified надежно записаны. С --resume конвертер читает журнал и продолжает
+с последнего состояния каждого файла, не обходя дерево заново, если обход
+в прошлый раз был завершен. Продолжить можно только с теми же параметрами
+конвертации, что сохранены в заголовке журнала.
+
+С --overlap-io файлы находит поток подачи конвейера, а результаты записывает
+основной поток, поэтому изменения журнала защищены блокировкой.
+"""
+
+import os
+import json
+import time
+import threading
+
+from atomic_files import fsync_file
+from dedup import converted_outputs
+from png_chunks import PNG_SIGNATURE, make_chunk
+
+JOURNAL_FILENAME = '.webp2png-journal'
+JOURNAL_VERSION = 1
+STATES = ('discovered', 'converted', 'verified', 'deleted', 'failed')
+# Сброс на диск не чаще, чем раз в SYNC_EVERY записей или SYNC_INTERVAL секунд
+SYNC_EVERY = 256
+SYNC_INTERVAL = 1.0
+
+_IEND_CHUNK = make_chunk(b'IEND', b'')
+
+
+def verify_png(path):
+    """
+    Проверяет, что PNG записан целиком: сигнатура в начале и чанк IEND в конце
+
+    Returns:
+        bool: True если файл не обрезан
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(len(PNG_SIGNATURE))
+            f.seek(-len(_IEND_CHUNK), os.SEEK_END)
+            tail = f.read()
+    except OSError:
+        return False
+    return head == PNG_SIGNATURE and tail == _IEND_CHUNK
+
+
+class Journal:
+    """
+    Журнал состояний файлов одного пакетного запуска
+
+    Args:
+        directory (str): Корневая директория обработки
+        settings (dict, optional): Параметры конвертации, сохраняемые в заголовке
+        resume (bool): Продолжить по существующему журналу вместо создания нового
+        sizes (list, optional): Размеры выходных файлов (см. resize.py)
+    """
+
+    def __init__(self, directory, settings=None, resume=False, sizes=None):
+        self.directory = directory
+        self.sizes = sizes
+        self.path = os.path.join(directory, JOURNAL_FILENAME)
+        self.settings = json.loads(json.dumps(settings or {}))
+        self.states = {}
+        self.scanned = False
+        self.resumed = False
+        self.settings_changed = False
+        self._pending_deletes = []
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        # Повторно входимая: sync записывает deleted через record
+        self._lock = threading.RLock()
+
+        if resume and os.path.exists(self.path):
+            self._load()
+            self.resumed = True
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._write({'version': JOURNAL_VERSION, 'settings': self.settings})
+            self.sync()
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        if not data.endswith(b'\n'):
+            # Последняя строка недописана из-за сбоя: отрезаем её, чтобы
+            # новые записи начинались с новой строки
+            data = data[:data.rfind(b'\n') + 1]
+            with open(self.path, 'r+b') as f:
+                f.truncate(len(data))
+        for number, line in enumerate(data.decode('utf-8').splitlines()):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if number == 0:
+                self.settings_changed = record.get('settings') != self.settings
+            elif record[0] == 'scanned':
+                self.scanned = True
+            else:
+                self.states[record[1]] = record[0]
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _key(self, path):
+        return os.path.relpath(path, self.directory).replace(os.sep, '/')
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def state(self, path):
+        """Последнее записанное состояние файла или None"""
+        return self.states.get(self._key(path))
+
+    def record(self, state, path):
+        """Дописывает событие; на диск сбрасывается пачками"""
+        key = self._key(path)
+        with self._lock:
+            self.states[key] = state
+            self._write([state, key])
+            self._unsynced += 1
+            if self._unsynced >= SYNC_EVERY or time.monotonic() - self._last_sync >= SYNC_INTERVAL:
+                self.sync()
+
+    def mark_scanned(self):
+        """Отмечает, что обход дерева завершен и все файлы есть в журнале"""
+        with self._lock:
+            self.scanned = True
+            self._write(['scanned', ''])
+            self.sync()
+
+    def sync(self):
+        """
+        Сбрасывает журнал на диск и удаляет исходники, ожидающие удаления
+
+        Перед удалением на диск сбрасываются выходные PNG, чтобы после сбоя
+        питания не остаться ни с исходником, ни с результатом.
+        """
+        with self._lock:
+            for path, outputs in self._pending_deletes:
+                for output in outputs:
+                    fsync_file(output)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+            pending, self._pending_deletes = self._pending_deletes, []
+            for path, _ in pending:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"⚠️ Не удалось удалить исходный файл {path}: {e}")
+                    continue
+                self.record('deleted', path)
+
+    def schedule_delete(self, path, outputs):
+        """Удаляет исходник при следующем сбросе журнала, после записи verified"""
+        with self._lock:
+            self._pending_deletes.append((path, outputs))
+
+    def iter_discovered(self, paths):
+        """
+        Записывает найденные файлы и пропускает уже обработанные в прошлом запуске
+
+        Yields:
+            str: Пути к файлам, которые нужно сконвертировать
+        """
+        for path in paths:
+            state = self.state(path)
+            if state is None:
+                self.record('discovered', path)
+            if state in (None, 'discovered', 'failed'):
+                yield path
+        self.mark_scanned()
+
+    def iter_unfinished(self):
+        """
+        Файлы из журнала, которые еще не сконвертированы (обход дерева не нужен)
+
+        Yields:
+            str: Пути к файлам, которые нужно сконвертировать
+        """
+        with self._lock:
+            items = list(self.states.items())
+        for key, state in items:
+            if state in ('discovered', 'failed'):
+                yield self._path(key)
+
+    def iter_converted(self):
+        """Файлы, сконвертированные, но не проверенные или не удаленные в прошлом запуске"""
+        with self._lock:
+            items = list(self.states.items())
+        for key, state in items:
+            if state in ('converted', 'verified'):
+                yield self._path(key), state
+
+    def verified_outputs(self, path):
+        """
+        Выходные файлы исходника, если все они записаны целиком
+
+        Returns:
+            list: Пути к PNG или None, если результата нет или он поврежден
+        """
+        outputs = converted_outputs(path, self.sizes)
+        if outputs and all(verify_png(output) for output in outputs):
+            return outputs
+        return None
+
+    def finish_converted(self, path, delete_original=False):
+        """
+        Проверяет результат сконвертированного файла и записывает verified
+
+        Returns:
+            bool: True если результат цел
+        """
+        outputs = self.verified_outputs(path)
+        if outputs is None:
+            self.record('failed', path)
+            return False
+        self.record('verified', path)
+        if delete_original:
+            self.schedule_delete(path, outputs)
+        return True
+
+    def recover(self, delete_original=False):
+        """
+        Доводит файлы, сконвертированные в прерванном запуске
+
+        Результат проверяется заново: файл с поврежденным или отсутствующим
+        PNG отмечается failed и конвертируется еще раз вместе с необработанными.
+        """
+        for path, state in self.iter_converted():
+            if state == 'verified' and self.verified_outputs(path) is not None:
+                if delete_original:
+                    self.schedule_delete(path, converted_outputs(path, self.sizes))
+            else:
+                self.finish_converted(path, delete_original)
+
+    def counts(self):
+        """Количество файлов в каждом состоянии"""
+        counts = dict.fromkeys(STATES, 0)
+        with self._lock:
+            states = list(self.states.values())
+        for state in states:
+            counts[state] += 1
+        return counts
+
+    def close(self, finished=False):
+        """
+        Закрывает журнал; после полностью успешного запуска журнал удаляется
+
+        Args:
+            finished (bool): Все файлы обработаны успешно
+        """
+        self.sync()
+        self._file.close()
+        if finished:
+            os.remove(self.path)
+
+    def report(self):
+        """Возвращает строку со статистикой журнала"""
+        counts = self.counts()
+        return "Журнал: " + ", ".join(f"{state} {counts[state]}" for state in STATES)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Выходное дерево в другой директории (--output-dir)
+
+По умолчанию PNG пишется рядом с исходником, и чтение и запись идут на один
+диск. С --output-dir структура папок исходного дерева повторяется в другом
+месте (лучше на другом томе):
+
+- директории выходного дерева создаются заранее одним обходом исходного
+  дерева (только для папок с WebP файлами), поэтому рабочие процессы не
+  проверяют и не создают папки для каждого файла;
+- со --staging-dir PNG сначала пишется на быстрый локальный диск, а
+  BackgroundMover в фоновых потоках переносит готовые файлы в --output-dir
+  (медленное сетевое или архивное хранилище), не задерживая конвертацию.
+  Исходник при --delete удаляется только после переноса его PNG.
+"""
+
+import os
+import queue
+import threading
+
+from atomic_files import atomic_output
+from discovery import iter_webp_files
+
+# Количество потоков переноса из промежуточной директории
+DEFAULT_MOVE_THREADS = 2
+# Сколько файлов может ждать переноса, прежде чем конвертация приостановится
+MOVE_QUEUE_SIZE = 1024
+
+
+class OutputTree:
+    """
+    Соответствие путей исходного и выходного дерева
+
+    Объект передается в рабочие процессы, поэтому хранит только строки.
+
+    Args:
+        source_root (str): Корень исходного дерева
+        output_root (str): Корень выходного дерева
+        staging_root (str, optional): Промежуточная директория, куда PNG пишется
+            до переноса в output_root
+        extension (str): Расширение выходных файлов (см. encoders.py)
+    """
+
+    def __init__(self, source_root, output_root, staging_root=None, extension='.png'):
+        self.source_root = os.path.abspath(source_root)
+        self.output_root = os.path.abspath(output_root)
+        self.staging_root = os.path.abspath(staging_root) if staging_root else None
+        self.extension = extension
+
+    @property
+    def write_root(self):
+        """Директория, куда пишут рабочие процессы"""
+        return self.staging_root or self.output_root
+
+    @property
+    def roots(self):
+        """Выходная и промежуточная директории (обход исходного дерева в них не заходит)"""
+        return [self.output_root] + ([self.staging_root] if self.staging_root else [])
+
+    def _mirror(self, input_path, root):
+        relative = os.path.relpath(os.path.abspath(input_path), self.source_root)
+        return os.path.join(root, os.path.splitext(relative)[0] + self.extension)
+
+    def output_path(self, input_path):
+        """Путь, по которому пишется PNG для input_path (в промежуточной директории, если она задана)"""
+        return self._mirror(input_path, self.write_root)
+
+    def final_path(self, input_path):
+        """Итоговый путь PNG для input_path в выходном дереве"""
+        return self._mirror(input_path, self.output_root)
+
+    def moved_path(self, written_path):
+        """Куда переносится файл из промежуточной директории"""
+        return os.path.join(self.output_root, os.path.relpath(written_path, self.staging_root))
+
+    def create_skeleton(self):
+        """
+        Создает директории выходного дерева (и промежуточного, если оно задано)
+
+        Дерево обходится один раз, директории создаются только для папок, в которых
+        есть WebP файлы: пустые папки и выходные деревья прошлых запусков (в них
+        только PNG) не копируются. Выходная и промежуточная директории внутри
+        исходного дерева не обходятся, чтобы не копировать их в себя.
+
+        Returns:
+            int: Количество директорий исходного дерева с WebP файлами
+        """
+        created = set()
+        for path in iter_webp_files(self.source_root, self.roots):
+            directory = os.path.dirname(path)
+            if directory in created:
+                continue
+            created.add(directory)
+            relative = os.path.relpath(directory, self.source_root)
+            for root in self.roots:
+                os.makedirs(os.path.normpath(os.path.join(root, relative)), exist_ok=True)
+        return len(created)
+
+
+def convert_mirrored(path, convert_func, tree, **kwargs):
+    """
+    Конвертирует файл в выходное дерево
+
+    Объявлена на уровне модуля, чтобы её можно было передать в пул процессов
+    через functools.partial.
+
+    Args:
+        path (str): Путь к WebP файлу
+        convert_func (callable): batch.convert_file с функцией конвертации
+        tree (OutputTree): Соответствие исходного и выходного дерева
+        **kwargs: Параметры convert_func
+    """
+    return convert_func(path, output_path=tree.output_path(path), **kwargs)
+
+
+class BackgroundMover:
+    """
+    Перенос готовых PNG из промежуточной директории в выходное дерево в фоне
+
+    Файл переносится под временным именем и переименовывается в итоговое,
+    поэтому в выходном дереве не бывает недописанных PNG. Очередь ограничена:
+    если хранилище не успевает, конвертация ждет, а промежуточный диск не
+    переполняется. Результаты забираются через drain() в основном потоке.
+
+    Args:
+        tree (OutputTree): Дерево с промежуточной директорией
+        threads (int): Количество потоков переноса
+        max_pending (int): Сколько файлов может ждать переноса
+    """
+
+    def __init__(self, tree, threads=DEFAULT_MOVE_THREADS, max_pending=MOVE_QUEUE_SIZE):
+        self.tree = tree
+        self.moved = 0
+        self.moved_bytes = 0
+        self.failed = 0
+        self._queue = queue.Queue(max_pending)
+        self._done = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._run, name=f'webp2png-move-{index}', daemon=True)
+                         for index in range(max(1, threads))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, source, outputs, delete_source=False):
+        """
+        Ставит выходные файлы source в очередь переноса
+
+        Args:
+            source (str): Исходный WebP файл
+            outputs (list): Записанные в промежуточную директорию файлы
+            delete_source (bool): Удалить исходник после переноса всех файлов
+        """
+        self._queue.put((source, list(outputs), delete_source))
+
+    def _move(self, path):
+        import shutil
+
+        target = self.tree.moved_path(path)
+        size = os.path.getsize(path)
+        with atomic_output(target) as temp_path:
+            # Внутри одного тома - переименование, между томами - копирование и удаление
+            shutil.move(path, temp_path)
+        with self._lock:
+            self.moved += 1
+            self.moved_bytes += size
+        return target
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            source, outputs, delete_source = item
+            moved, error = [], None
+            try:
+                for path in outputs:
+                    moved.append(self._move(path))
+                if delete_source:
+                    os.remove(source)
+            except OSError as e:
+                error = str(e)
+                with self._lock:
+                    self.failed += 1
+            self._done.put((source, moved, error))
+
+    def drain(self):
+        """
+        Забирает завершенные переносы
+
+        Yields:
+            tuple: (исходный файл, перенесенные файлы, текст ошибки или None)
+        """
+        while True:
+            try:
+                yield self._done.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        """Дожидается переноса всех файлов и удаляет опустевшие промежуточные директории"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        for current, _, _ in os.walk(self.tree.staging_root, topdown=False):
+            if current == self.tree.staging_root:
+                continue
+            try:
+                os.rmdir(current)
+            except OSError:
+                pass
+
+    def report(self):
+        """Строка итога переноса"""
+        line = (f"Перенос в {self.tree.output_root}: {self.moved} файлов, "
+                f"{self.moved_bytes / 1e6:.1f} МБ")
+        if self.failed:
+            line += f", ошибок переноса: {self.failed} (файлы остались в {self.tree.staging_root})"
+        return line
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельная конвертация файлов в пуле процессов
+"""
+
+import os
+import sys
+
+# Сколько задач на один процесс может ожидать в очереди пула
+PENDING_PER_JOB = 4
+
+
+def default_jobs():
+    """Возвращает количество рабочих процессов по умолчанию (число ядер CPU)"""
+    return os.cpu_count() or 1
+
+
+def run_conversions(convert_func, files, jobs=None, max_pending=None, scheduler=None, **kwargs):
+    """
+    Конвертирует файлы, распределяя их по пулу процессов
+
+    Файлы берутся из итератора лениво: в пуле одновременно находится не больше
+    max_pending задач, поэтому поиск файлов и конвертация идут параллельно,
+    а потребление памяти не зависит от размера дерева.
+
+    Если рабочий процесс завершается аварийно (например, его убивает система
+    при нехватке памяти), файлы в работе отмечаются неудачными, а пул
+    запускается заново. Если и новый пул ломается, не завершив ни одного
+    файла, оставшиеся файлы отмечаются неудачными без конвертации.
+    Ошибки файлов не печатаются: вместо результата возвращается исключение,
+    и вызывающий сам решает, как его показать (--quiet, --json).
+
+    Args:
+        convert_func (callable): Функция конвертации одного файла. Должна быть
+            объявлена на уровне модуля, чтобы её можно было передать в процесс
+        files (iterable): Пути к файлам (список или генератор)
+        jobs (int, optional): Количество процессов (по умолчанию число ядер CPU).
+            При jobs=1 файлы обрабатываются последовательно в текущем процессе
+        max_pending (int, optional): Ограничение очереди задач
+            (по умолчанию jobs * PENDING_PER_JOB)
+        scheduler (scheduling.AdaptiveScheduler, optional): Допуск файлов по оценке
+            памяти и подстройка параллельности; файлы запускаются по одному по мере
+            допуска, а не ставятся в очередь пула заранее
+        **kwargs: Дополнительные параметры для convert_func
+
+    Yields:
+        tuple: (путь к файлу, результат convert_func или исключение рабочего
+            процесса) в порядке завершения
+    """
+    if jobs is None:
+        jobs = default_jobs()
+
+    if jobs <= 1:
+        for path in files:
+            yield path, convert_func(path, **kwargs)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+
+    if max_pending is None:
+        max_pending = jobs * PENDING_PER_JOB
+
+    files = iter(files)
+    exhausted = False
+    waiting = None
+    pending = {}
+    executor = ProcessPoolExecutor(max_workers=jobs)
+    broken = False
+    # Завершился ли хотя бы один файл с момента запуска пула
+    progressed = True
+    try:
+        while True:
+            while not broken and not exhausted and len(pending) < max_pending:
+                if waiting is None:
+                    waiting = next(files, None)
+                    if waiting is None:
+                        exhausted = True
+                        break
+                if scheduler is not None and not scheduler.admit(waiting):
+                    break
+                try:
+                    future = executor.submit(convert_func, waiting, **kwargs)
+                except BrokenProcessPool:
+                    # Пул сломался после завершения предыдущих задач: файл остается ждать новый пул
+                    broken = True
+                    break
+                if scheduler is not None:
+                    scheduler.start(waiting)
+                pending[future] = waiting
+                waiting = None
+
+            if not pending:
+                if not broken:
+                    break
+                if not progressed:
+                    # Новый пул сломался, не завершив ни одного файла: оставшиеся файлы не конвертируются
+                    yield from _fail_remaining(waiting, files)
+                    break
+                # stdout остается для результатов (--json)
+                print("⚠️ Рабочий процесс завершился аварийно, пул процессов перезапускается",
+                      file=sys.stderr)
+                executor.shutdown()
+                executor = ProcessPoolExecutor(max_workers=jobs)
+                broken = progressed = False
+                continue
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                if scheduler is not None:
+                    scheduler.finish(path)
+                try:
+                    result = future.result()
+                    progressed = True
+                except Exception as e:
+                    # Падение рабочего процесса не должно останавливать весь пакет
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    result = e
+                yield path, result
+    finally:
+        executor.shutdown()
+
+
+def _fail_remaining(waiting, files):
+    """Отмечает неудачными файлы, которые не удалось передать в пул процессов"""
+    from concurrent.futures.process import BrokenProcessPool
+
+    error = BrokenProcessPool("пул процессов снова сломался, файл не конвертирован")
+    if waiting is not None:
+        yield waiting, error
+    for path in files:
+        yield path, error
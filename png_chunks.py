@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Низкоуровневая работа с чанками PNG
+"""
+
+import zlib
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def make_chunk(tag, data):
+    """Собирает чанк PNG: длина, тип, данные и CRC"""
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def iter_chunks(png_data):
+    """
+    Разбирает PNG на чанки
+
+    Yields:
+        tuple: (тип чанка bytes, данные memoryview)
+    """
+    view = memoryview(png_data)
+    if bytes(view[:8]) != PNG_SIGNATURE:
+        raise ValueError("Некорректные данные PNG")
+    offset = 8
+    while offset < len(view):
+        length, = struct.unpack('>I', view[offset:offset + 4])
+        tag = bytes(view[offset + 4:offset + 8])
+        yield tag, view[offset + 8:offset + 8 + length]
+        offset += 12 + length
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Пресеты скорости/размера для кодирования PNG
+"""
+
+# Параметры Image.save(..., 'PNG') для каждого пресета.
+# optimize=True включает максимальное сжатие zlib (уровень 9) и самый медленный поиск.
+PNG_PRESETS = {
+    'fastest': {'compress_level': 1},
+    'balanced': {'compress_level': 6},
+    'smallest': {'optimize': True},
+}
+
+# Поведение по умолчанию совпадает с прежним optimize=True
+DEFAULT_PNG_SPEED = 'smallest'
+
+# Стратегии zlib (параметр compress_type в Pillow). Построчные PNG фильтры
+# Pillow выбирает сам, поэтому стратегия - основной доступный рычаг кроме уровня.
+ZLIB_STRATEGIES = {
+    'default': 0,
+    'filtered': 1,
+    'huffman': 2,
+    'rle': 3,
+    'fixed': 4,
+}
+
+
+def png_save_options(speed=DEFAULT_PNG_SPEED, compress_level=None, strategy=None):
+    """
+    Формирует параметры сохранения PNG
+
+    Args:
+        speed (str): Название пресета: fastest, balanced или smallest
+        compress_level (int, optional): Явный уровень сжатия zlib 0-9,
+            переопределяет уровень пресета
+        strategy (str, optional): Стратегия zlib из ZLIB_STRATEGIES
+
+    Returns:
+        dict: Именованные параметры для Image.save(..., 'PNG')
+    """
+    if speed not in PNG_PRESETS:
+        raise ValueError(f"Неизвестный пресет PNG: {speed}")
+    options = dict(PNG_PRESETS[speed])
+
+    if compress_level is not None:
+        if not 0 <= compress_level <= 9:
+            raise ValueError(f"Уровень сжатия должен быть от 0 до 9: {compress_level}")
+        options.pop('optimize', None)
+        options['compress_level'] = compress_level
+
+    if strategy is not None:
+        if strategy not in ZLIB_STRATEGIES:
+            raise ValueError(f"Неизвестная стратегия zlib: {strategy}")
+        options['compress_type'] = ZLIB_STRATEGIES[strategy]
+
+    return options
+
+
+def save_png(img, output_path, png_options=None, profiler=None):
+    """
+    Сохраняет изображение в PNG
+
+    Файл пишется под временным именем и переименовывается после записи.
+    При включенном профилировании кодирование выполняется в память, чтобы
+    время сжатия (encode) и записи на диск (write) замерялись раздельно.
+
+    Args:
+        img (PIL.Image.Image): Изображение
+        output_path (str): Путь для выходного файла
+        png_options (dict, optional): Параметры сохранения (по умолчанию пресет DEFAULT_PNG_SPEED)
+        profiler (profiling.StageProfiler, optional): Профайлер этапов
+    """
+    from encoders import get_encoder
+
+    if png_options is None:
+        png_options = png_save_options()
+    get_encoder('png').save(img, output_path, png_options, profiler)
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Поиск наименьшего PNG (--smallest)
+
+Для ресурсов, которые раздаются много раз, размер файла важнее времени
+конвертации. Вместо одного прохода optimize=True изображение кодируется
+несколькими способами, и сохраняется самый маленький результат:
+
+- представления без потерь: исходный режим, без альфа-канала (если он
+  полностью непрозрачен), оттенки серого (если R = G = B), 1 бит (черно-белое)
+  и палитра, если цветов не больше 256 (Pillow сам уменьшает глубину палитры
+  до 1, 2 или 4 бит); палитра проверяется на точное совпадение с исходником;
+- стратегии zlib на уровне 9 (PNG фильтры строк Pillow выбирает сам).
+
+Кодирование идет в пуле потоков: Pillow отпускает GIL на время сжатия.
+
+Результат поиска (какое представление и какие параметры дали наименьший
+файл) сохраняется в кэше по хэшу содержимого исходного файла и параметрам
+конвертации, поэтому для того же содержимого поиск не повторяется: при
+следующем запуске изображение кодируется один раз по найденному рецепту.
+"""
+
+import os
+import json
+import threading
+
+SEARCH_VERSION = 1
+# Стратегии zlib, перебираемые на уровне сжатия 9
+SEARCH_STRATEGIES = ('default', 'filtered', 'huffman', 'rle')
+PALETTE_COLORS = 256
+# Больше этой площади палитра по пикселям не строится (словарь на каждый пиксель
+# в Python медленный); представление 'palette' тогда пропускается
+EXACT_PALETTE_MAX_PIXELS = 1_000_000
+VARIANTS = ('base', 'opaque', 'grey', 'bilevel', 'palette')
+VARIANT_NAMES = {
+    'base': 'исходный режим',
+    'opaque': 'без альфа-канала',
+    'grey': 'оттенки серого',
+    'bilevel': '1 бит',
+    'palette': 'палитра',
+}
+
+
+def default_cache_dir():
+    """Каталог кэша поиска по умолчанию (~/.cache/webp2png/smallest)"""
+    base = os.environ.get('XDG_CACHE_HOME')
+    if not base and os.name == 'nt':
+        base = os.environ.get('LOCALAPPDATA')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'webp2png', 'smallest')
+
+
+def search_options(cache_dir=None, jobs=1):
+    """
+    Параметры поиска для convert_webp_to_png(smallest=...)
+
+    Args:
+        cache_dir (str, optional): Каталог кэша (по умолчанию default_cache_dir())
+        jobs (int): Сколько файлов конвертируется параллельно: ядра делятся
+            между процессами, чтобы потоки поиска не вытесняли друг друга
+
+    Returns:
+        dict: {'cache_dir': ..., 'threads': ...}
+    """
+    return {'cache_dir': cache_dir or default_cache_dir(),
+            'threads': max(1, (os.cpu_count() or 1) // max(jobs, 1))}
+
+
+def search_key(content_digest, png_options, size=None, keep_alpha=False, background=None):
+    """Ключ кэша: хэш исходного файла и параметры, от которых зависит результат"""
+    import hashlib
+
+    settings = json.dumps({'version': SEARCH_VERSION, 'png_options': png_options, 'size': size,
+                           'keep_alpha': keep_alpha, 'background': background}, sort_keys=True)
+    return content_digest + hashlib.blake2b(settings.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class SearchCache:
+    """
+    Кэш рецептов поиска: один JSON файл на ключ
+
+    Отдельные файлы не требуют блокировок: процессы пула пишут их независимо,
+    каждый под своим временным именем с атомарной заменой.
+
+    Args:
+        directory (str): Каталог кэша
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.json')
+
+    def get(self, key):
+        """Рецепт по ключу или None"""
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                recipe = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return recipe if recipe.get('version') == SEARCH_VERSION else None
+
+    def put(self, key, recipe):
+        """Сохраняет рецепт; ошибки записи не мешают конвертации"""
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(recipe, f)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+
+def _is_grey(img):
+    from PIL import ImageChops
+
+    red, green, blue = img.split()[:3]
+    return (ImageChops.difference(red, green).getbbox() is None
+            and ImageChops.difference(green, blue).getbbox() is None)
+
+
+def _exact_palette(img, colors):
+    """
+    Палитровое изображение с точным соответствием цветов
+
+    Палитра строится квантованием в C и проверяется на совпадение с исходником.
+    Если квантование слило близкие цвета, палитра строится по пикселям, но
+    только для изображений не больше EXACT_PALETTE_MAX_PIXELS.
+
+    Args:
+        img (PIL.Image.Image): Изображение RGB или RGBA
+        colors (list): Результат img.getcolors() (не больше 256 цветов)
+
+    Returns:
+        PIL.Image.Image: Изображение в режиме P или None
+    """
+    from PIL import Image, ImageChops
+
+    alpha = None
+    if img.mode == 'RGBA':
+        alpha = {color[:3]: color[3] for _, color in colors}
+    if alpha is None or len(alpha) == len(colors):
+        # Медианное сечение есть только для RGB; прозрачность однозначно
+        # определяется цветом RGB и дописывается в палитру
+        palette = img.convert('RGB').quantize(len(colors), method=Image.Quantize.MEDIANCUT,
+                                              dither=Image.Dither.NONE)
+        if alpha is not None:
+            entries = palette.getpalette()
+            rgba = bytearray()
+            for index in range(0, len(entries), 3):
+                rgb = tuple(entries[index:index + 3])
+                rgba += bytes(rgb + (alpha.get(rgb, 255),))
+            palette.putpalette(rgba, 'RGBA')
+    else:
+        # Один цвет RGB с разной прозрачностью: квантование октодеревом по RGBA
+        palette = img.quantize(len(colors), method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE)
+    if ImageChops.difference(palette.convert(img.mode), img).getbbox() is None:
+        return palette
+    if img.width * img.height <= EXACT_PALETTE_MAX_PIXELS:
+        return _palette_by_pixels(img)
+    return None
+
+
+def _palette_by_pixels(img):
+    """Палитра по пикселям: индекс каждого цвета RGBA ищется в словаре"""
+    from array import array
+    from PIL import Image
+
+    # Пиксель RGBA упаковывается в одно 32-битное число
+    packed = array('I', img.convert('RGBA').tobytes())
+    lookup = {value: index for index, value in enumerate(dict.fromkeys(packed))}
+    palette = Image.frombytes('P', img.size, bytes(map(lookup.__getitem__, packed)))
+    palette.putpalette(array('I', lookup).tobytes(), 'RGBA')
+    return palette
+
+
+def build_variants(img, names=VARIANTS):
+    """
+    Строит представления изображения без потерь
+
+    Args:
+        img (PIL.Image.Image): Подготовленное к записи изображение
+        names (tuple): Какие представления нужны
+
+    Returns:
+        dict: {имя: изображение} для применимых к изображению представлений
+    """
+    from PIL import Image
+
+    variants = {'base': img}
+    source = img
+    if img.mode == 'RGBA' and img.getchannel('A').getextrema() == (255, 255):
+        source = variants['opaque'] = img.convert('RGB')
+
+    if ('grey' in names or 'bilevel' in names) and source.mode in ('RGB', 'RGBA') and _is_grey(source):
+        grey = variants['grey'] = source.convert('LA' if source.mode == 'RGBA' else 'L')
+        if grey.mode == 'L' and {value for _, value in grey.getcolors(PALETTE_COLORS)} <= {0, 255}:
+            variants['bilevel'] = grey.convert('1', dither=Image.Dither.NONE)
+
+    if 'palette' in names and source.mode in ('RGB', 'RGBA'):
+        colors = source.getcolors(PALETTE_COLORS)
+        if colors is not None:
+            palette = _exact_palette(source, colors)
+            if palette is not None:
+                variants['palette'] = palette
+
+    return {name: variant for name, variant in variants.items() if name in names}
+
+
+def candidate_options(png_options):
+    """Параметры сохранения для перебора: обычные параметры и стратегии zlib на уровне 9"""
+    from png_presets import ZLIB_STRATEGIES
+
+    candidates = [dict(png_options)]
+    for strategy in SEARCH_STRATEGIES:
+        options = {'compress_level': 9, 'compress_type': ZLIB_STRATEGIES[strategy]}
+        if options not in candidates:
+            candidates.append(options)
+    return candidates
+
+
+def encode(img, options):
+    """Кодирует изображение в PNG в памяти"""
+    import io
+
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG', **options)
+    return buffer.getvalue()
+
+
+def search(img, png_options, threads=1):
+    """
+    Перебирает представления и параметры сжатия, возвращая наименьший PNG
+
+    В памяти одновременно находятся только лучший результат и результаты,
+    которые кодируются прямо сейчас.
+
+    Args:
+        img (PIL.Image.Image): Подготовленное к записи изображение
+        png_options (dict): Обычные параметры сохранения (с ними считается экономия)
+        threads (int): Количество потоков кодирования
+
+    Returns:
+        tuple: (байты PNG, рецепт {'variant', 'options', 'bytes', 'baseline_bytes'})
+    """
+    variants = build_variants(img)
+    candidates = [(name, variant, options) for name, variant in variants.items()
+                  for options in candidate_options(png_options)]
+    lock = threading.Lock()
+    best = {}
+
+    def run(index):
+        name, variant, options = candidates[index]
+        if threads > 1:
+            # Image.save хранит параметры в самом объекте (encoderinfo), поэтому
+            # параллельные сохранения одного изображения подменяли бы параметры друг друга
+            variant = variant.copy()
+        data = encode(variant, options)
+        with lock:
+            if index == 0:
+                # Первый кандидат - исходный режим с обычными параметрами
+                best['baseline_bytes'] = len(data)
+            # При равном размере побеждает кандидат, стоящий раньше в списке
+            if 'data' not in best or (len(data), index) < (len(best['data']), best['index']):
+                best.update(data=data, index=index, variant=name, options=options)
+
+    if threads > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(min(threads, len(candidates)), thread_name_prefix='webp2png-png') as executor:
+            list(executor.map(run, range(len(candidates))))
+    else:
+        for index in range(len(candidates)):
+            run(index)
+
+    recipe = {'version': SEARCH_VERSION, 'variant': best['variant'], 'options': best['options'],
+              'bytes': len(best['data']), 'baseline_bytes': best['baseline_bytes']}
+    return best['data'], recipe
+
+
+def smallest_png(img, png_options, smallest, key=None):
+    """
+    Наименьший PNG с использованием кэша рецептов
+
+    Args:
+        img (PIL.Image.Image): Подготовленное к записи изображение
+        png_options (dict): Обычные параметры сохранения
+        smallest (dict): Параметры поиска (см. search_options)
+        key (str, optional): Ключ кэша (см. search_key); без него кэш не используется
+
+    Returns:
+        tuple: (байты PNG, рецепт, взят ли рецепт из кэша)
+    """
+    if png_options is None:
+        from png_presets import png_save_options
+
+        png_options = png_save_options()
+    cache_dir = smallest.get('cache_dir')
+    cache = SearchCache(cache_dir) if cache_dir and key else None
+    if cache is not None:
+        recipe = cache.get(key)
+        if recipe is not None:
+            variant = build_variants(img, (recipe['variant'],)).get(recipe['variant'])
+            if variant is not None:
+                return encode(variant, recipe['options']), recipe, True
+
+    data, recipe = search(img, png_options, smallest.get('threads', 1))
+    if cache is not None:
+        cache.put(key, recipe)
+    return data, recipe, False
+
+
+def save_smallest(img, output_path, png_options, smallest, key=None, profiler=None):
+    """
+    Записывает наименьший PNG на диск (под временным именем с переименованием)
+
+    Returns:
+        tuple: (рецепт, взят ли рецепт из кэша)
+    """
+    from atomic_files import atomic_output
+    from profiling import NULL_PROFILER
+
+    profiler = profiler or NULL_PROFILER
+    with profiler.stage('encode'):
+        data, recipe, cached = smallest_png(img, png_options, smallest, key)
+    with profiler.stage('write'):
+        with atomic_output(output_path) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+    return recipe, cached
+
+
+def saved_bytes(recipe):
+    """На сколько байт результат меньше обычного сжатия"""
+    return recipe['baseline_bytes'] - recipe['bytes']
+
+
+def describe(recipe, cached=False):
+    """Краткое описание результата поиска для вывода"""
+    saved = saved_bytes(recipe)
+    text = f"{VARIANT_NAMES.get(recipe['variant'], recipe['variant'])}, -{saved / 1024:.1f} КБ"
+    if recipe['baseline_bytes']:
+        text += f" ({saved / recipe['baseline_bytes']:.0%})"
+    if cached:
+        text += ", рецепт из кэша"
+    return text
+
+
+def saved_report(saved, output_bytes):
+    """Строка итога --smallest для пакета: экономия относительно обычного сжатия"""
+    baseline = saved + output_bytes
+    share = f" ({saved / baseline:.1%})" if baseline else ""
+    return f"Поиск наименьшего PNG: сэкономлено {saved / 1024:.1f} КБ{share}"
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Замер времени по этапам конвертации и сводный отчет по пакету
+"""
+
+import time
+import contextlib
+
+# Этапы конвертации в порядке выполнения (read - чтение файла в память в режиме --overlap-io,
+# resize - уменьшение в режимах --max-size и --scale)
+STAGES = ('read', 'open', 'decode', 'resize', 'convert', 'encode', 'write', 'delete')
+
+
+class StageProfiler:
+    """
+    Накопитель времени этапов для одного файла
+
+    Args:
+        hook (callable, optional): Вызывается как hook(stage, seconds) после каждого этапа
+    """
+
+    enabled = True
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.timings = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Контекст, замеряющий время этапа name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            if self.hook is not None:
+                self.hook(name, elapsed)
+
+
+class NullProfiler:
+    """Профайлер-заглушка для обычного режима без замеров"""
+
+    enabled = False
+    timings = {}
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def profile_conversion(convert_func, path, **kwargs):
+    """
+    Выполняет convert_func с новым StageProfiler и возвращает замеры
+
+    Объявлена на уровне модуля, чтобы её можно было передать в пул процессов
+    через functools.partial(profile_conversion, convert_func).
+
+    Returns:
+        tuple: (результат convert_func, словарь {этап: секунды})
+    """
+    profiler = StageProfiler()
+    result = convert_func(path, profiler=profiler, **kwargs)
+    return result, profiler.timings
+
+
+class BatchProfile:
+    """
+    Сводка замеров по всем файлам пакета
+
+    Args:
+        hook (callable, optional): Вызывается как hook(path, timings) для каждого файла
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.records = []
+
+    def add(self, path, timings):
+        """Добавляет замеры одного файла"""
+        self.records.append((path, dict(timings)))
+        if self.hook is not None:
+            self.hook(path, timings)
+
+    def totals(self):
+        """Возвращает суммарное время по каждому этапу"""
+        totals = {}
+        for _, timings in self.records:
+            for stage, seconds in timings.items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def summary_table(self):
+        """Формирует текстовую таблицу: этап, сумма, среднее на файл, доля"""
+        totals = self.totals()
+        grand_total = sum(totals.values()) or 1.0
+        count = len(self.records) or 1
+        stages = [s for s in STAGES if s in totals] + sorted(set(totals) - set(STAGES))
+
+        lines = [f"{'Этап':<10}{'Всего, с':>12}{'Среднее, мс':>14}{'Доля':>8}"]
+        for stage in stages:
+            lines.append(f"{stage:<10}{totals[stage]:>12.3f}"
+                         f"{totals[stage] / count * 1000:>14.2f}{totals[stage] / grand_total:>8.1%}")
+        lines.append(f"{'Файлов:':<10}{len(self.records):>12}")
+        return "\n".join(lines)
+
+    def write_trace(self, path):
+        """
+        Сохраняет замеры по каждому файлу в JSON или CSV (по расширению path)
+        """
+        import csv
+        import json
+
+        if path.lower().endswith('.csv'):
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(('file',) + STAGES)
+                for file_path, timings in self.records:
+                    writer.writerow([file_path] + [f"{timings.get(s, 0.0):.6f}" for s in STAGES])
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'totals': self.totals(),
+                    'files': [{'file': file_path, 'timings': timings}
+                              for file_path, timings in self.records],
+                }, f, indent=2)
+
+    def print_report(self, trace_path=None):
+        """Печатает сводную таблицу и при необходимости сохраняет трассу по файлам"""
+        print()
+        print("⏱️ Время по этапам конвертации:")
+        print(self.summary_table())
+        if trace_path:
+            self.write_trace(trace_path)
+            print(f"⏱️ Трасса по файлам сохранена: {trace_path}")
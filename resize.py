@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Уменьшение изображений при конвертации: превью и несколько размеров за одно декодирование
+
+Размер задается строкой: WxH - вписать в прямоугольник (--max-size),
+Fx - умножить стороны на коэффициент F (--scale). Изображения только
+уменьшаются, пропорции сохраняются.
+
+libwebp умеет масштабировать при декодировании, но Pillow этого не
+использует (Image.draft поддерживается только для JPEG), поэтому WebP
+декодируется в полном размере. Дальше работа пропорциональна размеру
+результата: Image.reduce быстро сжимает изображение в целое число раз
+усреднением блоков, и только оставшийся промежуточный размер (не больше
+REDUCING_GAP размеров результата) пересчитывается качественным фильтром
+Lanczos. Несколько размеров получаются из одного декодированного
+изображения, а кодируются уже уменьшенные копии.
+"""
+
+import os
+
+# Image.reduce сжимает изображение, пока промежуточный размер не станет
+# меньше REDUCING_GAP размеров результата; остаток пересчитывает Lanczos
+REDUCING_GAP = 3.0
+
+
+def parse_max_size(value):
+    """
+    Разбирает значение --max-size: WxH или N (квадрат NxN)
+
+    Returns:
+        str: Размер в виде WxH
+    """
+    width, _, height = value.lower().partition('x')
+    width = int(width)
+    height = int(height) if height else width
+    if width <= 0 or height <= 0:
+        raise ValueError(f"Размер должен быть положительным: {value}")
+    return f"{width}x{height}"
+
+
+def parse_scale(value):
+    """
+    Разбирает значение --scale: коэффициент от 0 до 1 (0.5 или 50%)
+
+    Returns:
+        str: Размер в виде Fx
+    """
+    if value.endswith('%'):
+        scale = float(value[:-1]) / 100
+    else:
+        scale = float(value)
+    if not 0 < scale <= 1:
+        raise ValueError(f"Коэффициент должен быть больше 0 и не больше 1: {value}")
+    return f"{scale:g}x"
+
+
+def target_size(size, spec):
+    """
+    Вычисляет размер результата
+
+    Args:
+        size (tuple): Исходный размер (ширина, высота)
+        spec (str): WxH или Fx
+
+    Returns:
+        tuple: (ширина, высота) не больше исходного
+    """
+    width, height = size
+    if spec.endswith('x'):
+        factor = float(spec[:-1])
+    else:
+        max_width, max_height = (int(side) for side in spec.split('x'))
+        factor = min(max_width / width, max_height / height)
+    if factor >= 1:
+        return size
+    return max(1, round(width * factor)), max(1, round(height * factor))
+
+
+def sized_output_paths(output_path, sizes):
+    """
+    Имена выходных файлов для запрошенных размеров
+
+    Один размер пишется под обычным именем, несколько - как name_WxH.png, name_0.5x.png.
+
+    Returns:
+        list: Пары (путь, размер); размер None, если уменьшение не задано
+    """
+    if not sizes:
+        return [(output_path, None)]
+    if len(sizes) == 1:
+        return [(output_path, sizes[0])]
+    base_name, extension = os.path.splitext(output_path)
+    return [(f"{base_name}_{spec}{extension}", spec) for spec in sizes]
+
+
+def primary_output_path(input_path, sizes=None, extension='.png'):
+    """Путь к выходному файлу для input_path, при нескольких размерах - к первому из них"""
+    return sized_output_paths(os.path.splitext(input_path)[0] + extension, sizes)[0][0]
+
+
+def resize_image(img, spec):
+    """
+    Уменьшает изображение до размера spec
+
+    Args:
+        img (PIL.Image.Image): Декодированное изображение
+        spec (str, optional): WxH или Fx; None - без изменений
+
+    Returns:
+        PIL.Image.Image: Исходное изображение, если уменьшать не нужно, иначе новое
+    """
+    if spec is None:
+        return img
+    size = target_size(img.size, spec)
+    if size == img.size:
+        return img
+
+    from PIL import Image
+
+    if img.mode == '1':
+        img = img.convert('L')
+    elif img.mode == 'P':
+        # Палитровые изображения Pillow масштабирует только ближайшим соседом
+        img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+    # Для RGBA Pillow сам умножает цвет на альфа-канал перед фильтрацией,
+    # поэтому по краям прозрачных областей не появляется темная кайма
+    return img.resize(size, Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP)
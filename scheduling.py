@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планирование пакетной конвертации по оценке памяти
+
+Стоимость файла оценивается до декодирования по размеру из заголовка WebP
+(см. webp_header.py): декодированное RGBA изображение занимает 4 байта на
+пиксель, а на время преобразования и сжатия в памяти одновременно находится
+несколько его копий. По этой оценке AdaptiveScheduler:
+
+- выдает файлы от больших к меньшим в пределах окна просмотра, чтобы
+  самые долгие файлы не оказались в конце пакета;
+- не запускает файл, если сумма оценок файлов в работе превысит бюджет
+  памяти (один файл допускается всегда, иначе большой файл не был бы
+  обработан никогда);
+- при autotune подбирает число одновременно выполняемых файлов по замеренной
+  пропускной способности: раз в TUNE_INTERVAL секунд лимит сдвигается на
+  один шаг и разворачивается, если скорость упала.
+"""
+
+import os
+import time
+import heapq
+
+# Во сколько раз пик памяти при конвертации больше декодированного изображения
+PEAK_FACTOR = 3
+BYTES_PER_PIXEL = 4
+# Оценка для файлов, размер которых не удалось прочитать из заголовка:
+# во сколько раз изображение больше сжатого файла
+FALLBACK_EXPANSION = 10
+# Сколько файлов просматривается вперед для сортировки от больших к меньшим
+DEFAULT_LOOKAHEAD = 256
+# Доля свободной памяти, отводимая под конвертацию при --memory-limit auto
+AUTO_MEMORY_FRACTION = 0.5
+# Период и порог подстройки параллельности
+TUNE_INTERVAL = 1.0
+TUNE_TOLERANCE = 0.05
+
+
+def estimate_cost(path):
+    """
+    Оценивает пиковый объем памяти (в байтах) для конвертации файла
+
+    Читается только заголовок файла; для файлов, заголовок которых
+    не удалось разобрать, оценка строится по размеру файла.
+    """
+    from webp_header import read_webp_header
+
+    try:
+        header = read_webp_header(path)
+    except ValueError:
+        try:
+            return os.path.getsize(path) * FALLBACK_EXPANSION
+        except OSError:
+            return 0
+    except OSError:
+        return 0
+    return header.pixels * BYTES_PER_PIXEL * PEAK_FACTOR
+
+
+def available_memory():
+    """Возвращает объем доступной памяти в байтах или None, если его не удалось определить"""
+    try:
+        with open('/proc/meminfo', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    if os.name == 'nt':
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong),
+                        ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong),
+                        ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong),
+                        ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong),
+                        ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(MemoryStatus)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullAvailPhys
+        return None
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def parse_memory_limit(value):
+    """
+    Разбирает значение --memory-limit: число мегабайт или auto
+
+    Returns:
+        int: Бюджет памяти в байтах
+
+    Raises:
+        ValueError: Значение не распознано или объем свободной памяти неизвестен
+    """
+    if value.strip().lower() == 'auto':
+        available = available_memory()
+        if available is None:
+            raise ValueError("не удалось определить объем свободной памяти, укажите лимит в МБ")
+        return int(available * AUTO_MEMORY_FRACTION)
+    try:
+        megabytes = float(value)
+    except ValueError:
+        raise ValueError(f"ожидается число мегабайт или auto: {value}") from None
+    if megabytes <= 0:
+        raise ValueError(f"лимит памяти должен быть больше нуля: {value}")
+    return int(megabytes * 1024 * 1024)
+
+
+class AdaptiveScheduler:
+    """
+    Допуск файлов в работу по бюджету памяти и подстройка параллельности
+
+    Args:
+        max_workers (int): Верхняя граница одновременно выполняемых файлов (размер пула)
+        memory_budget (int, optional): Бюджет оценки памяти в байтах (None - без ограничения)
+        autotune (bool): Подбирать число одновременно выполняемых файлов по пропускной
+            способности; без него лимит равен max_workers
+        lookahead (int): Сколько файлов просматривается вперед для сортировки
+        estimate (callable): Оценка стоимости файла по пути (по умолчанию estimate_cost)
+    """
+
+    def __init__(self, max_workers, memory_budget=None, autotune=False,
+                 lookahead=DEFAULT_LOOKAHEAD, estimate=estimate_cost):
+        self.max_workers = max(1, max_workers)
+        self.memory_budget = memory_budget
+        self.autotune = autotune
+        self.lookahead = max(1, lookahead)
+        self.estimate = estimate
+        self.limit = max(1, self.max_workers // 2) if autotune else self.max_workers
+        self.in_flight = 0
+        self.reserved = 0
+        self.peak_reserved = 0
+        self.deferred = 0
+        self.limits = [self.limit]
+        self._costs = {}
+        self._blocked = None
+        self._direction = 1
+        self._last_rate = None
+        self._window_start = time.monotonic()
+        self._window_work = 0
+
+    def order(self, files):
+        """
+        Выдает файлы от больших к меньшим в скользящем окне из lookahead файлов
+
+        Файлы читаются из итератора лениво: в памяти не больше lookahead путей,
+        поэтому конвертация начинается до окончания обхода дерева.
+        """
+        heap = []
+        for index, path in enumerate(files):
+            cost = self.estimate(path)
+            self._costs[path] = cost
+            heapq.heappush(heap, (-cost, index, path))
+            if len(heap) >= self.lookahead:
+                yield heapq.heappop(heap)[2]
+        while heap:
+            yield heapq.heappop(heap)[2]
+
+    def cost(self, path):
+        """Оценка стоимости файла (файлы, не прошедшие через order, оцениваются при обращении)"""
+        cost = self._costs.get(path)
+        if cost is None:
+            cost = self._costs[path] = self.estimate(path)
+        return cost
+
+    def admit(self, path):
+        """Проверяет, можно ли запустить файл сейчас"""
+        if self.in_flight == 0:
+            return True
+        if self.in_flight >= self.limit:
+            return False
+        if self.memory_budget is not None and self.reserved + self.cost(path) > self.memory_budget:
+            if path != self._blocked:
+                # Один и тот же файл проверяется после каждого завершения, считается один раз
+                self.deferred += 1
+                self._blocked = path
+            return False
+        return True
+
+    def start(self, path):
+        """Учитывает запущенный файл"""
+        self.in_flight += 1
+        self.reserved += self.cost(path)
+        self.peak_reserved = max(self.peak_reserved, self.reserved)
+
+    def finish(self, path, now=None):
+        """Учитывает завершенный файл и при autotune подстраивает лимит"""
+        cost = self._costs.pop(path, 0)
+        self.in_flight -= 1
+        self.reserved -= cost
+        # Работа измеряется в оценке памяти: она растет с числом пикселей,
+        # а значит и со временем декодирования и сжатия
+        self._window_work += max(cost, 1)
+        if self.autotune:
+            self._tune(time.monotonic() if now is None else now)
+
+    def _tune(self, now):
+        elapsed = now - self._window_start
+        if elapsed < TUNE_INTERVAL:
+            return
+        rate = self._window_work / elapsed
+        if self._last_rate is not None and rate < self._last_rate * (1 - TUNE_TOLERANCE):
+            # Прошлый шаг замедлил конвертацию: идем обратно
+            self._direction = -self._direction
+        self._last_rate = rate
+        limit = min(max(self.limit + self._direction, 1), self.max_workers)
+        if limit == self.limit:
+            self._direction = -self._direction
+        else:
+            self.limit = limit
+            self.limits.append(limit)
+        self._window_start = now
+        self._window_work = 0
+
+    def summary(self):
+        """Строка итога планирования"""
+        parts = []
+        if self.autotune:
+            parts.append(f"параллельность {min(self.limits)}-{max(self.limits)} "
+                         f"(в конце {self.limit} из {self.max_workers})")
+        if self.memory_budget is not None:
+            parts.append(f"пик оценки памяти {self.peak_reserved / 1024 / 1024:.0f} "
+                         f"из {self.memory_budget / 1024 / 1024:.0f} МБ")
+            parts.append(f"запусков отложено из-за памяти: {self.deferred}")
+        return "Планировщик: " + ", ".join(parts)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Конвертация потоков: stdin/stdout и tar архив WebP в tar архив PNG
+
+Путь '-' означает stdin для входа и stdout для результата, поэтому
+конвертер можно вставить в конвейер без временных файлов:
+
+    fetch | python webp2png.py - > image.png
+    fetch-tar | python webp2png.py - --tar | upload-tar
+
+В режиме tar элементы архива читаются по одному и конвертируются в памяти
+в пуле процессов (см. archives.convert_members): память не зависит от
+размера архива, а элементы, не являющиеся WebP, переносятся без изменений.
+"""
+
+import sys
+import contextlib
+
+from atomic_files import atomic_output
+from io_pipeline import convert_buffer, DEFAULT_IO_BUFFER_BYTES
+
+STDIO_PATH = '-'
+# Имя изображения из stdin: от него строятся имена кадров и размеров
+STDIN_NAME = 'stdin.webp'
+
+
+def is_stdio(path):
+    """Проверяет, обозначает ли путь stdin/stdout"""
+    return path == STDIO_PATH
+
+
+@contextlib.contextmanager
+def open_input(path):
+    """Открывает вход для чтения: '-' - stdin (не закрывается), иначе файл"""
+    if is_stdio(path):
+        yield sys.stdin.buffer
+        return
+    with open(path, 'rb') as f:
+        yield f
+
+
+@contextlib.contextmanager
+def open_output(path, stdout=None):
+    """
+    Открывает выход для записи: '-' - stdout, иначе файл с атомарной публикацией
+
+    Args:
+        path (str): Путь к выходному файлу или '-'
+        stdout: Двоичный stdout; передается явно, так как сообщения на время
+            записи данных в stdout перенаправляются в stderr
+    """
+    if is_stdio(path):
+        stdout = stdout if stdout is not None else sys.stdout.buffer
+        yield stdout
+        stdout.flush()
+        return
+    with atomic_output(path) as temp_path, open(temp_path, 'wb') as f:
+        yield f
+
+
+def _stream_options(convert_options):
+    # Запись полосами (banded_png) идет прямо в файл на диске, в потоке все изображение остается в памяти
+    return dict(convert_options, low_memory_pixels=None)
+
+
+def convert_stream(data, name=STDIN_NAME, **convert_options):
+    """
+    Конвертирует одно изображение из памяти в один PNG в памяти
+
+    Args:
+        data (bytes): Содержимое WebP файла
+        name (str): Имя исходного файла (для сообщений)
+        **convert_options: Параметры convert_buffer (png_options, keep_alpha, sizes и т.д.)
+
+    Returns:
+        tuple: (байты PNG, словарь {этап: секунды})
+
+    Raises:
+        ValueError: Получилось несколько файлов (кадры или несколько размеров),
+            их нельзя записать в один поток
+    """
+    outputs, timings = convert_buffer(name, data, **_stream_options(convert_options))
+    if len(outputs) != 1:
+        raise ValueError(f"{name}: получено {len(outputs)} PNG файлов, в один поток их можно "
+                         f"записать только архивом (--tar)")
+    return outputs[0][1], timings
+
+
+def convert_tar_stream(source, target, jobs=None, max_pending=None,
+                       buffer_bytes=DEFAULT_IO_BUFFER_BYTES, **convert_options):
+    """
+    Читает tar архив WebP из source и пишет tar архив PNG в target
+
+    Оба архива обрабатываются потоково (tarfile в режимах 'r|*' и 'w|'):
+    source и target могут быть каналами, перемотка не нужна. Вход может
+    быть сжат gzip, bzip2 или xz.
+
+    Args:
+        source: Двоичный поток с tar архивом
+        target: Двоичный поток для выходного tar архива
+        jobs (int, optional): Количество процессов (по умолчанию число ядер CPU).
+            При jobs=1 элементы конвертируются в текущем процессе
+        max_pending (int, optional): Сколько элементов одновременно в работе
+            (по умолчанию jobs * PENDING_PER_JOB)
+        buffer_bytes (int): Лимит объема исходных данных элементов в работе
+        **convert_options: Параметры convert_buffer (png_options, keep_alpha, sizes и т.д.)
+
+    Yields:
+        batch.FileResult: Результат по каждому WebP элементу в порядке архива;
+            outputs содержит имена записанных элементов
+    """
+    from archives import TarReader, TarWriter, convert_members
+
+    reader = TarReader(source)
+    try:
+        writer = TarWriter(target)
+        yield from convert_members(reader, writer, jobs, max_pending, buffer_bytes, **convert_options)
+        writer.close()
+    finally:
+        reader.close()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты конвертации анимированных WebP
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+import conversion
+
+
+
+def create_animated_webp(path, count=4):
+    frames = [Image.new('RGBA', (32, 24), (i * 50, 0, 255 - i * 50, 255)) for i in range(count)]
+    frames[0].save(path, 'WEBP', save_all=True, append_images=frames[1:],
+                   duration=[40 + 10 * i for i in range(count)], loop=2, lossless=True)
+
+
+def test_animated_webp_becomes_apng():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'anim.webp')
+        output = os.path.join(temp_dir, 'anim.png')
+        create_animated_webp(source)
+        assert conversion.convert_webp_to_png(source, output)
+
+        with Image.open(output) as img:
+            assert img.n_frames == 4
+            assert img.info['loop'] == 2
+            for index in range(img.n_frames):
+                img.seek(index)
+                assert img.info['duration'] == 40 + 10 * index
+                assert img.convert('RGB').getpixel((0, 0)) == (index * 50, 0, 255 - index * 50)
+
+
+def test_animated_webp_to_frames_and_first_frame():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'anim.webp')
+        create_animated_webp(source, count=3)
+        output = os.path.join(temp_dir, 'out.png')
+        assert conversion.convert_webp_to_png(source, output, animation='frames')
+        assert sorted(name for name in os.listdir(temp_dir) if name.startswith('out_')) == \
+               ['out_0000.png', 'out_0001.png', 'out_0002.png']
+
+        assert conversion.convert_webp_to_png(source, output, animation='first')
+        with Image.open(output) as img:
+            assert not getattr(img, 'is_animated', False)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты конвертации WebP внутри zip и tar архивов
+"""
+
+import io
+import os
+import sys
+import tarfile
+import zipfile
+import tempfile
+import subprocess
+
+import pytest
+from PIL import Image
+
+from archives import convert_archive, default_output_path, safe_member_path
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def webp_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (20, 12), color).save(buffer, 'WEBP', lossless=True)
+    return buffer.getvalue()
+
+
+def create_zip(path, members):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+
+
+def png_color(data):
+    with Image.open(io.BytesIO(data)) as img:
+        img.load()
+        assert img.format == 'PNG'
+        return img.getpixel((0, 0))
+
+
+def test_default_output_and_safe_paths():
+    assert default_output_path('photos.zip') == 'photos_png.zip'
+    assert default_output_path('dir/batch.TAR.GZ') == 'dir/batch_png.TAR.GZ'
+    assert safe_member_path('a/./b/c.png') == os.path.join('a', 'b', 'c.png')
+    for name in ('/etc/passwd', '../escape.png', 'a/../../b.png', 'C:/windows.png'):
+        with pytest.raises(ValueError):
+            safe_member_path(name)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_zip_to_zip_in_archive_order(jobs):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'photos.zip')
+        colors = [(i * 30, 90, 10) for i in range(6)]
+        members = [(f'set/img_{i}.webp', webp_bytes(color)) for i, color in enumerate(colors)]
+        members.insert(3, ('set/notes.txt', b'keep me'))
+        create_zip(source, members)
+
+        records = list(convert_archive(source, jobs=jobs, buffer_bytes=1))
+
+        assert [record.path for record in records] == [f'set/img_{i}.webp' for i in range(6)]
+        assert all(record.ok and 'read' in record.timings for record in records)
+        with zipfile.ZipFile(os.path.join(temp_dir, 'photos_png.zip')) as archive:
+            names = archive.namelist()
+            assert names == ['set/img_0.png', 'set/img_1.png', 'set/img_2.png', 'set/notes.txt',
+                             'set/img_3.png', 'set/img_4.png', 'set/img_5.png']
+            assert archive.getinfo('set/img_0.png').compress_type == zipfile.ZIP_STORED
+            assert archive.read('set/notes.txt') == b'keep me'
+            assert png_color(archive.read('set/img_4.png')) == colors[4]
+
+
+def test_tar_gz_to_directory_rejects_unsafe_members():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'batch.tar.gz')
+        with tarfile.open(source, 'w:gz') as archive:
+            for name, data in (('a/one.webp', webp_bytes((255, 0, 0))), ('../evil.webp', webp_bytes((0, 0, 0)))):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        target = os.path.join(temp_dir, 'out')
+
+        records = {record.path: record for record in convert_archive(source, target, jobs=1)}
+
+        assert records['a/one.webp'].ok
+        assert records['a/one.webp'].outputs == [os.path.join(target, 'a', 'one.png')]
+        assert not records['../evil.webp'].ok
+        assert not os.path.exists(os.path.join(temp_dir, 'evil.png'))
+        with open(os.path.join(target, 'a', 'one.png'), 'rb') as f:
+            assert png_color(f.read()) == (255, 0, 0)
+
+
+def test_zip_input_cli():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'photos.zip')
+        create_zip(source, [('one.webp', webp_bytes((1, 2, 3))), ('two.webp', webp_bytes((4, 5, 6)))])
+        target = os.path.join(temp_dir, 'photos.tar')
+
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'webp2png.py'), source, '-o', target, '-j', '2', '--json'],
+            capture_output=True, text=True, timeout=120)
+
+        assert result.returncode == 0, result.stderr
+        assert '"converted": 2' in result.stdout
+        with tarfile.open(target) as archive:
+            assert archive.getnames() == ['one.png', 'two.png']
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты пакетного API, режима --quiet и итогов --json
+"""
+
+import os
+import io
+import sys
+import json
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
+
+from PIL import Image
+
+from batch import BatchReport, FileResult, convert_batch
+import conversion
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def create_webp_files(root, count=3):
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'image_{i}.webp')
+        Image.new('RGB', (40, 30), (i * 60, 100, 30)).save(path, 'WEBP')
+        paths.append(path)
+    return paths
+
+
+def create_broken_file(root):
+    path = os.path.join(root, 'broken.webp')
+    with open(path, 'wb') as f:
+        f.write(b'not a webp')
+    return path
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_convert_batch_returns_records():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir)
+        broken = create_broken_file(temp_dir)
+
+        records = {record.path: record for record in convert_batch(temp_dir, jobs=1)}
+
+        assert set(records) == set(paths) | {broken}
+        for path in paths:
+            record = records[path]
+            assert record.status == 'converted'
+            assert record.outputs == [os.path.splitext(path)[0] + '.png']
+            assert record.input_bytes == os.path.getsize(path)
+            assert record.output_bytes == os.path.getsize(record.outputs[0])
+            assert 'encode' in record.timings
+        assert not records[broken].ok
+        assert records[broken].error
+
+
+def test_quiet_directory_prints_no_per_file_lines():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_webp_files(temp_dir)
+        create_broken_file(temp_dir)
+        errors = io.StringIO()
+        report = BatchReport(stream=errors)
+        output = io.StringIO()
+
+        with redirect_stdout(output):
+            assert conversion.process_directory(temp_dir, jobs=2, report=report) == (3, 4)
+
+        # Остаются только итоговые строки, по файлу ничего не печатается
+        assert 'image_' not in output.getvalue()
+        assert 'broken.webp' not in output.getvalue()
+        assert 'broken.webp' in errors.getvalue()
+        summary = report.summary()
+        assert summary['files'] == {'converted': 3, 'duplicate': 0, 'skipped': 0, 'failed': 1, 'total': 4}
+        assert summary['output_bytes'] > 0
+        assert [failure['path'] for failure in summary['failures']] == [os.path.join(temp_dir, 'broken.webp')]
+
+
+def test_report_counts_duplicates_and_cache_hits():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_webp_files(temp_dir, count=2)
+        with open(os.path.join(temp_dir, 'image_0.webp'), 'rb') as src:
+            data = src.read()
+        with open(os.path.join(temp_dir, 'copy.webp'), 'wb') as dst:
+            dst.write(data)
+
+        report = BatchReport(progress=False)
+        assert conversion.process_directory(temp_dir, jobs=1, use_cache=True, dedup='hash', report=report) == (3, 3)
+        assert report.counts['converted'] == 2
+        assert report.counts['duplicate'] == 1
+
+        report = BatchReport(progress=False)
+        assert conversion.process_directory(temp_dir, jobs=1, use_cache=True, dedup='hash', report=report) == (3, 3)
+        assert report.counts['skipped'] == 3
+
+
+def test_progress_line_on_terminal():
+    stream = FakeTerminal()
+    report = BatchReport(stream=stream)
+    files = list(report.track(['a.webp', 'b.webp']))
+    report.add(FileResult(files[0], 'converted', input_bytes=1000))
+    report.add(FileResult(files[1], error='сбой'))
+    report.close()
+
+    assert report.progress_line().startswith('[2/2] 100%')
+    assert 'ошибок 1' in report.progress_line()
+    assert '\r' in stream.getvalue()
+    assert stream.getvalue().endswith('\n')
+    # Без терминала прогресс не рисуется
+    quiet_stream = io.StringIO()
+    BatchReport(stream=quiet_stream).add(FileResult('a.webp', 'converted'))
+    assert quiet_stream.getvalue() == ''
+
+
+def test_json_summary_on_stdout():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_webp_files(temp_dir, count=2)
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'webp2png.py'), temp_dir, '--json', '-j', '1'],
+            capture_output=True, text=True, timeout=120)
+
+        assert result.returncode == 0, result.stderr
+        summary = json.loads(result.stdout)
+        assert summary['files']['converted'] == 2
+        assert summary['files']['total'] == 2
+        assert summary['input_bytes'] > 0
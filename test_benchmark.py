@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты генератора синтетического набора и бенчмарка
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+import benchmark
+
+
+def test_corpus_is_reproducible_and_benchmarkable():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        first = benchmark.generate_corpus(os.path.join(temp_dir, 'a'), count=4, seed=7,
+                                          max_megapixels=0.05, animated_share=0.5)
+        second = benchmark.generate_corpus(os.path.join(temp_dir, 'b'), count=4, seed=7,
+                                           max_megapixels=0.05, animated_share=0.5)
+        assert [(e['name'], e['width'], e['height']) for e in first] == \
+               [(e['name'], e['width'], e['height']) for e in second]
+
+        for entry in first:
+            with Image.open(os.path.join(temp_dir, 'a', entry['name'])) as img:
+                assert img.format == 'WEBP'
+                assert getattr(img, 'n_frames', 1) == entry['frames']
+
+        results = benchmark.run_benchmark(os.path.join(temp_dir, 'a'), ['fastest'], [1])
+        assert results['convert'][0]['failures'] == 0
+        assert results['process_directory'][0]['files'] == 4
+        assert results['convert'][0]['p95_ms'] >= results['convert'][0]['p50_ms']
+        megapixels = sum(e['width'] * e['height'] * e['frames'] for e in first) / 1e6
+        assert abs(results['convert'][0]['megapixels'] - megapixels) < 1e-9
+
+
+def test_formats_are_benchmarked_separately():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        corpus = os.path.join(temp_dir, 'corpus')
+        benchmark.generate_corpus(corpus, count=3, seed=1, max_megapixels=0.02, animated_share=0)
+
+        results = benchmark.run_benchmark(corpus, ['fastest'], [1], ['jpeg', 'webp'])
+
+        assert [run['format'] for run in results['convert']] == ['jpeg', 'webp']
+        for run in results['convert'] + results['process_directory']:
+            assert run['failures'] == 0 and run['files'] == 3
+        assert all(run['output_bytes'] > 0 for run in results['convert'])
+        # Выходные файлы не остаются в наборе
+        assert not any(name.endswith(('.jpg', '.png')) for name in os.listdir(corpus))
+
+
+def test_entry_points_start_without_heavy_imports():
+    results = benchmark.benchmark_startup(repeats=1, budget_ms=10_000)
+    for metrics in results['modules']:
+        assert metrics['loaded'] == [], metrics['module']
+        assert metrics['import_ms'] > 0
+
+    # Функции движка по-прежнему доступны из точек входа
+    import conversion
+    import webp2png
+    import webp_to_png_converter
+
+    assert webp2png.process_directory is conversion.process_directory
+    assert webp_to_png_converter.convert_webp_to_png is conversion.convert_webp_to_png
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты инкрементального кэша конвертации
+"""
+
+import os
+import json
+import tempfile
+
+from PIL import Image
+
+from conversion_cache import ConversionCache, CACHE_FILENAME
+import conversion
+
+
+def stored_settings(directory):
+    """Параметры конвертации, с которыми process_directory заполнил манифест"""
+    with open(os.path.join(directory, CACHE_FILENAME), encoding='utf-8') as f:
+        entries = json.load(f)['entries']
+    return json.loads(next(iter(entries.values()))['settings'])
+
+
+def test_unchanged_files_are_skipped():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        first = os.path.join(temp_dir, 'a.webp')
+        second = os.path.join(temp_dir, 'b.webp')
+        Image.new('RGB', (8, 8), 'red').save(first, 'WEBP')
+        Image.new('RGB', (8, 8), 'blue').save(second, 'WEBP')
+
+        assert conversion.process_directory(temp_dir, jobs=1, use_cache=True) == (2, 2)
+        settings = stored_settings(temp_dir)
+
+        cache = ConversionCache(temp_dir, settings)
+        assert cache.is_current(first) and cache.is_current(second)
+        assert (cache.hits, cache.misses) == (2, 0)
+
+        # Изменение файла и параметров конвертации делает запись неактуальной
+        Image.new('RGB', (9, 9), 'green').save(second, 'WEBP')
+        assert not cache.is_current(second)
+        assert not ConversionCache(temp_dir, dict(settings, format='jpeg')).is_current(first)
+        assert not ConversionCache(temp_dir, settings, invalidate=True).is_current(first)
+
+
+def test_hash_tolerates_touched_files():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'a.webp')
+        Image.new('RGB', (8, 8), 'red').save(source, 'WEBP')
+        conversion.process_directory(temp_dir, jobs=1, use_cache=True, cache_hash=True)
+        settings = stored_settings(temp_dir)
+
+        stat = os.stat(source)
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        assert not ConversionCache(temp_dir, settings).is_current(source)
+        assert ConversionCache(temp_dir, settings, use_hash=True).is_current(source)
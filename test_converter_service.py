@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты фонового сервиса конвертации (Unix сокет)
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+import pytest
+from PIL import Image
+
+import converter_service
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='Тест использует Unix сокет')
+
+
+def wait_until_running(address, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if converter_service.is_running(address):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_service_converts_and_coalesces_requests():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        address = os.path.join(temp_dir, 'service.sock')
+        paths = []
+        for i in range(4):
+            path = os.path.join(temp_dir, f'image_{i}.webp')
+            Image.new('RGB', (16, 16), (i * 60, 0, 0)).save(path, 'WEBP')
+            paths.append(path)
+
+        assert converter_service.submit(paths, address=address) is None
+
+        service = converter_service.ConverterService(address, jobs=2, coalesce_window=0.5)
+        server = threading.Thread(target=service.serve_forever)
+        server.start()
+        try:
+            assert wait_until_running(address)
+
+            results = [None] * len(paths)
+
+            def send(index):
+                results[index] = converter_service.submit([paths[index]], address=address)
+
+            clients = [threading.Thread(target=send, args=(i,)) for i in range(len(paths))]
+            for client in clients:
+                client.start()
+            for client in clients:
+                client.join()
+
+            assert results == [(1, 1)] * len(paths)
+            assert service.batches_run == 1
+            for path in paths:
+                assert os.path.exists(os.path.splitext(path)[0] + '.png')
+
+            seen = []
+            assert converter_service.submit([temp_dir], {'delete_original': True}, address,
+                                            on_result=lambda path, ok: seen.append(ok)) == (4, 4)
+            assert seen == [True] * 4
+            assert not any(os.path.exists(path) for path in paths)
+        finally:
+            service.stop()
+            server.join(timeout=20)
+        assert not server.is_alive()
+        assert not os.path.exists(address)
+
+
+def test_service_files_are_private():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        service = converter_service.ConverterService(os.path.join(temp_dir, 'service.sock'))
+        listener = service._listen()
+        try:
+            directory = converter_service.service_dir()
+            assert os.stat(directory).st_mode & 0o777 == 0o700
+            key_path = os.path.join(directory, converter_service.KEY_FILE)
+            assert os.stat(key_path).st_mode & 0o777 == 0o600
+            # Ключ случайный, а не производный от имени пользователя
+            assert len(converter_service._authkey()) == 64
+        finally:
+            listener.close()
+
+
+def test_batch_flags_are_not_sent_to_service():
+    from argparse import Namespace
+
+    assert converter_service.unsupported_flags(Namespace(output=None, cache=False, dedup=False)) == []
+    assert converter_service.unsupported_flags(Namespace(cache=True, journal=True, smallest=True)) == \
+        ['--cache', '--journal/--resume', '--smallest']
+
+
+@pytest.mark.parametrize('options', [
+    {'output_path': '/etc/passwd'},
+    {'delete_original': 'yes'},
+    {'low_memory_pixels': True},
+    {'png_options': {'pnginfo': 'x'}},
+    {'background': [1, 2]},
+    {'sizes': ['../x']},
+    {'smallest': {'cache_dir': '/tmp'}},
+    {'output_format': 'exe'},
+])
+def test_service_rejects_unexpected_options(options):
+    with pytest.raises(ValueError):
+        converter_service.validate_options(options)
+
+
+def test_service_accepts_cli_options():
+    options = converter_service.validate_options({
+        'delete_original': True, 'quiet': False, 'keep_alpha': False, 'background': [255, 255, 255],
+        'animation': 'apng', 'low_memory_pixels': 40_000_000, 'sizes': ['64x64', '0.5x'],
+        'png_options': {'compress_level': 1}, 'smallest': None, 'output_format': 'jpeg'})
+    assert options['background'] == (255, 255, 255)
+
+
+def test_service_skips_non_webp_paths():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        address = os.path.join(temp_dir, 'service.sock')
+        other = os.path.join(temp_dir, 'photo.jpg')
+        Image.new('RGB', (8, 8)).save(other, 'JPEG')
+
+        service = converter_service.ConverterService(address, jobs=1, coalesce_window=0)
+        server = threading.Thread(target=service.serve_forever)
+        server.start()
+        try:
+            assert wait_until_running(address)
+            assert converter_service.submit([other], {'delete_original': True}, address) == (0, 1)
+            assert os.path.exists(other)
+            with pytest.raises(RuntimeError):
+                converter_service.submit([other], {'output_path': other}, address)
+        finally:
+            service.stop()
+            server.join(timeout=20)
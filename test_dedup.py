@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты дедупликации одинаковых WebP файлов
+"""
+
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+from dedup import Deduplicator, find_duplicates
+import conversion
+
+
+def create_duplicates(root):
+    """Создает два разных WebP и по две копии каждого под другими именами"""
+    originals = []
+    for i, color in enumerate(('red', 'blue')):
+        path = os.path.join(root, f'original_{i}.webp')
+        Image.new('RGB', (40, 30), color).save(path, 'WEBP')
+        originals.append(path)
+    os.makedirs(os.path.join(root, 'sub'))
+    copies = []
+    for i, path in enumerate(originals):
+        for j in range(2):
+            copy_path = os.path.join(root, 'sub', f'copy_{i}_{j}.webp')
+            shutil.copyfile(path, copy_path)
+            copies.append(copy_path)
+    return originals, copies
+
+
+def test_find_duplicates_groups_same_content():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        originals, copies = create_duplicates(temp_dir)
+        groups = find_duplicates(originals + copies)
+        assert list(groups) == originals
+        assert groups[originals[0]] == copies[:2]
+        assert groups[originals[1]] == copies[2:]
+
+
+def test_process_directory_converts_each_content_once():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        originals, copies = create_duplicates(temp_dir)
+        assert conversion.process_directory(temp_dir, jobs=2, dedup='link') == (6, 6)
+
+        for path in originals + copies:
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+        first_output = os.path.splitext(originals[0])[0] + '.png'
+        copy_output = os.path.splitext(copies[0])[0] + '.png'
+        assert os.path.samefile(first_output, copy_output)
+
+
+def test_dedup_copy_mode_with_delete():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        originals, copies = create_duplicates(temp_dir)
+        assert conversion.process_directory(temp_dir, True, jobs=1, dedup='copy') == (6, 6)
+
+        for path in originals + copies:
+            assert not os.path.exists(path)
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+        first_output = os.path.splitext(originals[0])[0] + '.png'
+        copy_output = os.path.splitext(copies[0])[0] + '.png'
+        assert not os.path.samefile(first_output, copy_output)
+
+
+def test_report_counts_saved_work():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        originals, copies = create_duplicates(temp_dir)
+        deduplicator = Deduplicator(originals + copies)
+        assert deduplicator.duplicates == 4
+        conversion.convert_webp_to_png(originals[0])
+        deduplicator.materialize(originals[0], copies[0], seconds=0.5)
+        assert deduplicator.bytes_saved == os.path.getsize(copies[0])
+        assert deduplicator.seconds_saved == 0.5
+        assert '1 жестких ссылок' in deduplicator.report()
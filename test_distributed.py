@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты распределенной конвертации несколькими процессами на одной папке
+"""
+
+import os
+import sys
+import time
+import tempfile
+import subprocess
+
+from PIL import Image
+
+from distributed import LEASE_DIRNAME, LeaseManager, publish
+import conversion
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def create_tree(root, count):
+    paths = []
+    for i in range(count):
+        folder = os.path.join(root, f'part_{i % 3}')
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'image_{i}.webp')
+        Image.new('RGB', (96, 64), (i * 10 % 256, 50, 200)).save(path, 'WEBP')
+        paths.append(path)
+    return paths
+
+
+def test_several_nodes_convert_each_file_once():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_tree(temp_dir, 30)
+        nodes = [subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'webp2png.py'), temp_dir,
+                                   '--distributed', '--delete', '-j', '2', '--node-id', f'node{i}'],
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+                 for i in range(3)]
+        outputs = [node.communicate(timeout=120)[0] for node in nodes]
+
+        assert [node.returncode for node in nodes] == [0, 0, 0], outputs
+        assert not any('уже сконвертирован другим узлом' in output for output in outputs)
+        for path in paths:
+            assert not os.path.exists(path)
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+        leftovers = [name for _, _, names in os.walk(temp_dir) for name in names if '.tmp' in name]
+        assert leftovers == []
+        assert not os.path.exists(os.path.join(temp_dir, LEASE_DIRNAME))
+
+
+def test_expired_lease_is_reclaimed():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_tree(temp_dir, 3)
+        # Узел, который взял файл и упал, не продлевая аренду
+        crashed = LeaseManager(temp_dir, 'crashed', ttl=0.5)
+        assert crashed.claim(paths[0])
+        old = time.time() - 60
+        os.utime(crashed.lease_path(paths[0]), (old, old))
+
+        # Недописанные результаты упавшего узла рядом с исходником
+        base_name = os.path.splitext(paths[0])[0]
+        leftovers = [f'{base_name}.crashed.tmp.png', f'{base_name}.crashed.tmp.png.tmp',
+                     f'{base_name}.crashed.tmp_0000.png']
+        for leftover in leftovers:
+            with open(leftover, 'wb') as f:
+                f.write(b'partial')
+
+        assert conversion.process_directory(temp_dir, jobs=1, distributed=True,
+                                            node_id='survivor', lease_ttl=0.5) == (3, 3)
+        for path in paths:
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+        assert not any(os.path.exists(leftover) for leftover in leftovers)
+
+
+def test_live_lease_is_waited_for_then_taken_over():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_tree(temp_dir, 2)
+        busy = LeaseManager(temp_dir, 'busy', ttl=0.5)
+        assert busy.claim(paths[0])
+
+        leases = LeaseManager(temp_dir, 'other', ttl=0.5)
+        claimed = list(leases.iter_claimed(paths, poll_interval=0.1))
+        assert claimed == [paths[1], paths[0]]
+        assert leases.reclaimed == 1
+
+
+def test_publish_keeps_first_result():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        final_path = os.path.join(temp_dir, 'result.png')
+        for name, data in (('first.tmp', b'first'), ('second.tmp', b'second')):
+            with open(os.path.join(temp_dir, name), 'wb') as f:
+                f.write(data)
+
+        assert publish(os.path.join(temp_dir, 'first.tmp'), final_path)
+        assert not publish(os.path.join(temp_dir, 'second.tmp'), final_path)
+        with open(final_path, 'rb') as f:
+            assert f.read() == b'first'
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты кодировщиков выходных форматов (--format)
+"""
+
+import io
+import os
+import tempfile
+
+import pytest
+from PIL import Image, ImageChops
+
+import encoders
+from io_pipeline import convert_buffer
+import conversion
+
+
+def translucent():
+    img = Image.new('RGBA', (24, 16), (200, 40, 10, 255))
+    img.paste((0, 120, 250, 0), (0, 0, 12, 16))
+    return img
+
+
+@pytest.mark.parametrize('name, mode', [('png', 'RGBA'), ('webp', 'RGBA'), ('tiff', 'RGBA'), ('jpeg', 'RGB')])
+@pytest.mark.parametrize('speed', ['fastest', 'balanced', 'smallest'])
+def test_encoders_keep_alpha_only_where_format_allows(name, mode, speed):
+    encoder = encoders.get_encoder(name)
+    img = encoder.prepare(translucent(), keep_alpha=True, background=(0, 0, 0))
+
+    with Image.open(io.BytesIO(encoder.encode(img, encoder.save_options(speed)))) as decoded:
+        assert decoded.format == encoder.pillow_format
+        assert decoded.mode == mode
+        if name != 'jpeg':
+            # Форматы без потерь возвращают те же пиксели, включая цвет прозрачных
+            assert ImageChops.difference(decoded.convert('RGBA'), translucent()).getbbox() is None
+        else:
+            # JPEG не хранит прозрачность: прозрачная половина наложена на черный фон
+            assert max(decoded.getpixel((2, 2))) < 16
+
+
+def test_palette_is_converted_for_formats_without_it():
+    palette = translucent().convert('RGB').quantize(4)
+    assert encoders.get_encoder('png').prepare(palette, keep_alpha=True).mode == 'P'
+    assert encoders.get_encoder('tiff').prepare(palette, keep_alpha=True).mode == 'RGB'
+    assert encoders.get_encoder('webp').prepare(palette, keep_alpha=True).mode == 'RGB'
+
+
+def test_save_options_validation():
+    assert encoders.save_options('png', 'fastest', compress_level=3) == {'compress_level': 3}
+    assert encoders.save_options('jpeg', 'smallest')['progressive']
+    with pytest.raises(ValueError):
+        encoders.save_options('jpeg', compress_level=3)
+    with pytest.raises(ValueError):
+        encoders.save_options('webp', 'slowest')
+    with pytest.raises(ValueError):
+        encoders.get_encoder('bmp')
+
+
+def test_process_directory_writes_selected_format():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        os.makedirs(os.path.join(source, 'sub'))
+        translucent().save(os.path.join(source, 'a.webp'), 'WEBP', lossless=True)
+        Image.new('RGB', (8, 8), 'blue').save(os.path.join(source, 'sub', 'b.webp'), 'WEBP')
+        Image.new('RGB', (8, 8), 'blue').save(os.path.join(source, 'sub', 'c.webp'), 'WEBP')
+        frames = [Image.new('RGB', (8, 8), color) for color in ('red', 'green')]
+        frames[0].save(os.path.join(source, 'anim.webp'), 'WEBP', save_all=True, append_images=frames[1:])
+
+        assert conversion.process_directory(source, jobs=2, use_cache=True, dedup='link', output_format='jpeg') == (4, 4)
+        for name in ('a.jpg', 'anim.jpg', 'sub/b.jpg', 'sub/c.jpg'):
+            with Image.open(os.path.join(source, name)) as img:
+                assert img.format == 'JPEG'
+        assert not any(name.endswith('.png') for _, _, names in os.walk(source) for name in names)
+
+        # WebP рядом с исходником перезаписал бы его
+        assert conversion.process_directory(source, output_format='webp') is None
+        output = os.path.join(temp_dir, 'out')
+        assert conversion.process_directory(source, jobs=1, overlap_io=True, output_dir=output,
+                                            output_format='webp') == (4, 4)
+        with Image.open(os.path.join(output, 'sub', 'b.webp')) as img:
+            assert img.format == 'WEBP'
+
+
+def test_convert_buffer_uses_format_extension():
+    buffer = io.BytesIO()
+    translucent().save(buffer, 'WEBP', lossless=True)
+
+    outputs, _ = convert_buffer('image.webp', buffer.getvalue(), keep_alpha=True, output_format='tiff')
+
+    (path, data), = outputs
+    assert path == 'image.tif'
+    with Image.open(io.BytesIO(data)) as img:
+        assert img.format == 'TIFF' and img.mode == 'RGBA'
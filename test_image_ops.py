@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты обработки прозрачности
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+from banded_png import save_png_banded
+from image_ops import prepare_image, parse_color
+import conversion
+
+
+def test_flatten_matches_split_and_uses_background():
+    img = Image.new('RGBA', (4, 4), (255, 0, 0, 0))
+    img.putpixel((0, 0), (0, 0, 255, 255))
+    flat = prepare_image(img, background=parse_color('#00ff00'))
+    assert flat.mode == 'RGB'
+    assert flat.getpixel((0, 0)) == (0, 0, 255)
+    assert flat.getpixel((1, 1)) == (0, 255, 0)
+
+    la = Image.new('LA', (2, 2), (100, 128))
+    legacy = Image.new('RGB', la.size, (255, 255, 255))
+    legacy.paste(la, mask=la.split()[-1])
+    assert prepare_image(la).tobytes() == legacy.tobytes()
+
+
+def test_keep_alpha_writes_rgba_png():
+    img = Image.new('RGBA', (4, 4), (10, 20, 30, 40))
+    assert prepare_image(img, keep_alpha=True) is img
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'alpha.webp')
+        img.save(source, 'WEBP', lossless=True)
+        output = os.path.join(temp_dir, 'alpha.png')
+        assert conversion.convert_webp_to_png(source, output, keep_alpha=True)
+        with Image.open(output) as result:
+            assert result.mode == 'RGBA'
+            assert result.getpixel((0, 0)) == (10, 20, 30, 40)
+
+
+def test_low_memory_mode_matches_regular_output():
+    band = Image.effect_mandelbrot((120, 75), (-2, -1, 1, 1), 40)
+    img = Image.merge('RGBA', (band, band.rotate(90), band, Image.linear_gradient('L').resize((120, 75))))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'big.webp')
+        img.save(source, 'WEBP', lossless=True)
+        regular = os.path.join(temp_dir, 'regular.png')
+        banded = os.path.join(temp_dir, 'banded.png')
+        assert conversion.convert_webp_to_png(source, regular, low_memory_pixels=None)
+        assert conversion.convert_webp_to_png(source, banded, low_memory_pixels=0)
+
+        with Image.open(source) as decoded:
+            save_png_banded(decoded, os.path.join(temp_dir, 'alpha.png'), keep_alpha=True, band_rows=16)
+            with Image.open(os.path.join(temp_dir, 'alpha.png')) as result:
+                assert result.tobytes() == decoded.tobytes()
+
+        with Image.open(regular) as expected, Image.open(banded) as result:
+            assert result.mode == expected.mode == 'RGB'
+            assert result.tobytes() == expected.tobytes()
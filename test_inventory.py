@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты описи папки по заголовкам WebP (--scan)
+"""
+
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+import pytest
+from PIL import Image
+
+from inventory import Calibration, FILE_OVERHEAD_SECONDS, load_calibration, probe_file, scan_tree
+from profiling import BatchProfile
+from webp_header import read_webp_header
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def create_mixed_tree(root):
+    """Папка с обычными, анимированными, поврежденными и переименованными файлами"""
+    os.makedirs(os.path.join(root, 'sub'))
+    Image.new('RGB', (200, 100), 'red').save(os.path.join(root, 'photo.webp'), 'WEBP')
+    Image.new('RGBA', (50, 40), (0, 0, 255, 100)).save(os.path.join(root, 'sub', 'icon.webp'),
+                                                       'WEBP', lossless=True)
+    frames = [Image.new('RGB', (30, 20), color) for color in ('red', 'green', 'blue')]
+    frames[0].save(os.path.join(root, 'anim.webp'), 'WEBP', save_all=True, append_images=frames[1:])
+    # WebP с расширением .jpg находится по сигнатуре
+    Image.new('RGB', (400, 300), 'green').save(os.path.join(root, 'sub', 'cdn.jpg'), 'WEBP')
+    Image.new('RGB', (10, 10)).save(os.path.join(root, 'fake.webp'), 'PNG')
+    with open(os.path.join(root, 'photo.webp'), 'rb') as f:
+        data = f.read()
+    with open(os.path.join(root, 'cut.webp'), 'wb') as f:
+        f.write(data[:len(data) // 2])
+    with open(os.path.join(root, 'notes.txt'), 'w') as f:
+        f.write('не изображение')
+
+
+def test_scan_tree_builds_inventory_from_headers():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_mixed_tree(temp_dir)
+
+        inventory = scan_tree(temp_dir, threads=2)
+
+        assert inventory.scanned == 7
+        assert inventory.webp == 4
+        assert inventory.animated == 1
+        assert inventory.frames == 3
+        assert inventory.alpha == 1
+        assert inventory.lossless == 1
+        assert inventory.megapixels == pytest.approx((200 * 100 + 50 * 40 + 30 * 20 + 400 * 300) / 1e6)
+        assert inventory.frame_megapixels == pytest.approx(inventory.megapixels + 2 * 30 * 20 / 1e6)
+        assert inventory.misnamed == [os.path.join(temp_dir, 'sub', 'cdn.jpg')]
+        errors = dict(inventory.corrupt)
+        assert set(errors) == {os.path.join(temp_dir, 'cut.webp'), os.path.join(temp_dir, 'fake.webp')}
+        assert 'обрезан' in errors[os.path.join(temp_dir, 'cut.webp')]
+        assert 'PNG' in errors[os.path.join(temp_dir, 'fake.webp')]
+        assert inventory.largest_images()[0] == (os.path.join(temp_dir, 'sub', 'cdn.jpg'), 400, 300)
+
+        summary = inventory.to_dict(Calibration(0.5), jobs=2)
+        assert summary['estimate']['seconds'] == pytest.approx(
+            round((4 * FILE_OVERHEAD_SECONDS + inventory.frame_megapixels * 0.5) / 2, 1))
+
+
+def test_probe_ignores_other_files_and_reads_frames():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        text = os.path.join(temp_dir, 'readme.md')
+        with open(text, 'w') as f:
+            f.write('# README')
+        assert not probe_file(text).is_webp
+
+        path = os.path.join(temp_dir, 'anim.webp')
+        frames = [Image.new('RGBA', (16, 16), (i * 50, 0, 0, 128)) for i in range(5)]
+        frames[0].save(path, 'WEBP', save_all=True, append_images=frames[1:])
+        assert read_webp_header(path, with_frames=True).frames == 5
+        assert probe_file(path).header.frames == 5
+
+
+@pytest.mark.parametrize('lossless', [True, False])
+def test_extended_header_reads_compression_from_image_chunk(lossless):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # EXIF и анимация сохраняются в расширенном формате (VP8X)
+        still = os.path.join(temp_dir, 'exif.webp')
+        exif = Image.Exif()
+        exif[0x010e] = 'описание'
+        Image.new('RGBA', (24, 16), (0, 0, 255, 100)).save(still, 'WEBP', lossless=lossless, exif=exif)
+        anim = os.path.join(temp_dir, 'anim.webp')
+        frames = [Image.new('RGBA', (16, 16), (i * 50, 0, 0, 128)) for i in range(3)]
+        frames[0].save(anim, 'WEBP', save_all=True, append_images=frames[1:], lossless=lossless)
+
+        for path in (still, anim):
+            header = read_webp_header(path)
+            assert header.extended and header.alpha
+            assert header.lossless == lossless
+        assert read_webp_header(anim, with_frames=True).frames == 3
+        inventory = scan_tree(temp_dir)
+        assert inventory.lossless == (2 if lossless else 0)
+        assert inventory.frames == 3
+
+
+def test_calibration_from_benchmark_results():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        results_path = os.path.join(temp_dir, 'results.json')
+        with open(results_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'convert': [{'png_speed': 'fastest', 'files': 10, 'failures': 0, 'seconds': 2.03, 'megapixels': 20.0}],
+                'process_directory': [{'png_speed': 'fastest', 'jobs': 4, 'files': 10, 'failures': 0,
+                                       'seconds': 1.0, 'megapixels': 20.0}],
+            }, f)
+
+        serial = load_calibration(results_path, 'fastest', jobs=2)
+        assert serial.jobs == 1
+        assert serial.seconds_per_megapixel == pytest.approx((2.03 - 10 * FILE_OVERHEAD_SECONDS) / 20)
+        assert serial.estimate(10, 20.0, jobs=2) == pytest.approx(2.03 / 2)
+
+        parallel = load_calibration(results_path, 'fastest', jobs=4)
+        assert parallel.jobs == 4
+        assert parallel.estimate(10, 20.0, jobs=4) == pytest.approx(1.0)
+
+        with pytest.raises(ValueError):
+            load_calibration(results_path, 'smallest', jobs=1)
+
+
+@pytest.mark.parametrize('extension', ['json', 'csv'])
+def test_calibration_from_profile_trace(extension):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'image.webp')
+        Image.new('RGB', (1000, 500)).save(path, 'WEBP')
+        profile = BatchProfile()
+        profile.add(path, {'decode': 0.1, 'encode': 0.2})
+        profile.add(os.path.join(temp_dir, 'deleted.webp'), {'decode': 5.0})
+        trace_path = os.path.join(temp_dir, f'trace.{extension}')
+        profile.write_trace(trace_path)
+
+        calibration = load_calibration(trace_path, 'smallest', jobs=1)
+
+        assert calibration.seconds_per_megapixel == pytest.approx((0.3 - FILE_OVERHEAD_SECONDS) / 0.5)
+
+
+def test_scan_cli_outputs_json_without_converting():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_mixed_tree(temp_dir)
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'webp2png.py'), temp_dir, '--scan', '--json', '-j', '2'],
+            capture_output=True, text=True, timeout=120)
+
+        assert result.returncode == 0, result.stderr
+        summary = json.loads(result.stdout)
+        assert summary['webp_files'] == 4
+        assert len(summary['corrupt']) == 2
+        assert summary['estimate']['jobs'] == 2
+        assert not any(name.endswith('.png') for _, _, names in os.walk(temp_dir) for name in names)
+
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'webp_to_png_converter.py'), temp_dir, '--scan'],
+            capture_output=True, text=True, timeout=120)
+        assert result.returncode == 0, result.stderr
+        assert 'cdn.jpg' in result.stdout
+        assert 'Оценка времени' in result.stdout
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты конвейера с перекрытием ввода-вывода
+"""
+
+import os
+import tempfile
+import threading
+
+import pytest
+from PIL import Image
+
+from io_pipeline import ByteBudget, run_pipeline
+import conversion
+
+
+def create_webp_files(root, count=6):
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'image_{i}.webp')
+        Image.new('RGBA', (64, 48), (i * 40, 100, 0, 128)).save(path, 'WEBP', lossless=True)
+        paths.append(path)
+    return paths
+
+
+def test_pipeline_matches_regular_conversion():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir)
+        expected = {}
+        for path in paths:
+            reference = path + '.reference.png'
+            conversion.convert_webp_to_png(path, reference)
+            with Image.open(reference) as img:
+                expected[path] = img.tobytes()
+
+        # Буфер меньше одного файла: конвейер обрабатывает файлы по одному, но не зависает
+        results = dict(run_pipeline(paths, jobs=2, io_threads=2, buffer_bytes=1))
+        assert results == {path: True for path in paths}
+        for path in paths:
+            with Image.open(os.path.splitext(path)[0] + '.png') as img:
+                assert img.tobytes() == expected[path]
+        assert not [name for name in os.listdir(temp_dir) if name.endswith('.tmp')]
+
+
+def test_process_directory_overlap_io_with_delete_and_failures():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir, count=3)
+        with open(os.path.join(temp_dir, 'broken.webp'), 'wb') as f:
+            f.write(b'not a webp')
+
+        assert conversion.process_directory(temp_dir, True, jobs=1, overlap_io=True) == (3, 4)
+        for path in paths:
+            assert not os.path.exists(path)
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+        assert os.path.exists(os.path.join(temp_dir, 'broken.webp'))
+
+
+def test_pipeline_reraises_error_from_files_iterator():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir, count=2)
+
+        def files():
+            yield from paths
+            raise PermissionError('папка недоступна')
+
+        received = []
+        with pytest.raises(PermissionError, match='папка недоступна'):
+            for path, ok in run_pipeline(files(), jobs=1, io_threads=1):
+                received.append((path, ok))
+        # Файлы, отправленные до ошибки, обработаны и возвращены
+        assert sorted(received) == [(path, True) for path in paths]
+
+
+def test_byte_budget_blocks_until_release():
+    budget = ByteBudget(100)
+    budget.acquire(80)
+    acquired = threading.Event()
+    thread = threading.Thread(target=lambda: (budget.acquire(50), acquired.set()))
+    thread.start()
+    assert not acquired.wait(0.1)
+    budget.release(80, finished=True)
+    assert acquired.wait(5)
+    thread.join()
+    assert budget.used == 50
+
+
+def test_pipeline_records_banded_outputs():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        os.makedirs(source)
+        paths = create_webp_files(source, count=2)
+
+        # Порог 0: все файлы пишутся полосами прямо в процессе обработки
+        records = dict(run_pipeline(paths, jobs=1, low_memory_pixels=0, with_records=True, quiet=True))
+        for path in paths:
+            output = os.path.splitext(path)[0] + '.png'
+            assert records[path].ok and records[path].outputs == [output]
+            assert records[path].output_bytes == os.path.getsize(output)
+            os.remove(output)
+
+        output_dir = os.path.join(temp_dir, 'out')
+        staging_dir = os.path.join(temp_dir, 'staging')
+        assert conversion.process_directory(source, jobs=1, overlap_io=True, low_memory_pixels=0,
+                                            output_dir=output_dir, staging_dir=staging_dir) == (2, 2)
+        assert sorted(os.listdir(output_dir)) == ['image_0.png', 'image_1.png']
+        assert not [name for _, _, names in os.walk(staging_dir) for name in names]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты журнала пакетной конвертации и атомарной записи PNG
+"""
+
+import os
+import json
+import tempfile
+
+import pytest
+from PIL import Image
+
+from atomic_files import atomic_output
+from journal import JOURNAL_FILENAME, Journal, verify_png
+from png_presets import save_png
+import conversion
+
+
+def create_webp_files(root, count=4):
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'image_{i}.webp')
+        Image.new('RGB', (48, 32), (i * 50, 20, 90)).save(path, 'WEBP')
+        paths.append(path)
+    return paths
+
+
+def png_path(path):
+    return os.path.splitext(path)[0] + '.png'
+
+
+def default_settings():
+    """Параметры, которые process_directory по умолчанию пишет в заголовок журнала"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with open(os.path.join(temp_dir, 'broken.webp'), 'wb') as f:
+            f.write(b'not a webp')
+        conversion.process_directory(temp_dir, jobs=1, journal=True)
+        with open(os.path.join(temp_dir, JOURNAL_FILENAME), encoding='utf-8') as f:
+            return json.loads(f.readline())['settings']
+
+
+def test_resume_finishes_interrupted_run():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir)
+        # Прерванный запуск: обход завершен, первый файл удален, второй
+        # сконвертирован без проверки, третий записан не до конца
+        journal = Journal(temp_dir, default_settings(), resume=False)
+        list(journal.iter_discovered(paths))
+        for path in paths[:3]:
+            conversion.convert_webp_to_png(path)
+            journal.record('converted', path)
+        journal.record('verified', paths[0])
+        journal.close()
+        os.remove(paths[0])
+        with open(png_path(paths[2]), 'r+b') as f:
+            f.truncate(100)
+        with open(os.path.join(temp_dir, JOURNAL_FILENAME), 'a', encoding='utf-8') as f:
+            f.write('["deleted", "image_')  # Недописанная строка
+
+        assert conversion.process_directory(temp_dir, True, jobs=1, resume=True) == (4, 4)
+        for path in paths:
+            assert not os.path.exists(path)
+            assert verify_png(png_path(path))
+        assert not os.path.exists(os.path.join(temp_dir, JOURNAL_FILENAME))
+
+
+def test_failed_run_keeps_journal_and_sources():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir, count=2)
+        broken = os.path.join(temp_dir, 'broken.webp')
+        with open(broken, 'wb') as f:
+            f.write(b'not a webp')
+
+        assert conversion.process_directory(temp_dir, True, jobs=1, journal=True) == (2, 3)
+        assert os.path.exists(broken)
+        assert not any(os.path.exists(path) for path in paths)
+
+        with open(os.path.join(temp_dir, JOURNAL_FILENAME), encoding='utf-8') as f:
+            records = [json.loads(line) for line in f]
+        assert ['failed', 'broken.webp'] in records
+        assert records.index(['verified', 'image_0.webp']) < records.index(['deleted', 'image_0.webp'])
+
+        # Продолжение без обхода дерева: пробуется только файл, который не удалось сконвертировать
+        journal = Journal(temp_dir, resume=True)
+        assert journal.scanned
+        assert list(journal.iter_unfinished()) == [broken]
+        journal.close()
+
+
+def test_resume_refuses_changed_settings():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir, count=2)
+        journal = Journal(temp_dir, default_settings(), resume=False)
+        list(journal.iter_discovered(paths))
+        journal.close()
+
+        # С другими параметрами продолжение отклоняется, журнал и исходники не трогаются
+        assert conversion.process_directory(temp_dir, True, jobs=1, resume=True, keep_alpha=True) is None
+        assert all(os.path.exists(path) for path in paths)
+        assert not any(os.path.exists(png_path(path)) for path in paths)
+        assert Journal(temp_dir, default_settings(), resume=True).counts()['discovered'] == 2
+
+        assert conversion.process_directory(temp_dir, True, jobs=1, resume=True) == (2, 2)
+
+
+def test_journal_with_overlap_io_records_every_file():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_files(temp_dir, count=12)
+        broken = os.path.join(temp_dir, 'broken.webp')
+        with open(broken, 'wb') as f:
+            f.write(b'not a webp')
+
+        # Файлы записывает в журнал поток подачи конвейера, результаты - основной поток
+        assert conversion.process_directory(temp_dir, True, jobs=2, journal=True,
+                                            overlap_io=True) == (12, 13)
+        with open(os.path.join(temp_dir, JOURNAL_FILENAME), encoding='utf-8') as f:
+            records = [json.loads(line) for line in f][1:]
+        assert ['scanned', ''] in records
+        for path in paths:
+            name = os.path.basename(path)
+            assert records.index(['discovered', name]) < records.index(['verified', name]) \
+                < records.index(['deleted', name])
+            assert not os.path.exists(path)
+        assert ['failed', 'broken.webp'] in records
+
+
+def test_atomic_output_keeps_previous_file_on_failure():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'result.png')
+        save_png(Image.new('RGB', (8, 8), 'red'), path)
+        with open(path, 'rb') as f:
+            before = f.read()
+
+        with pytest.raises(RuntimeError):
+            with atomic_output(path) as temp_path:
+                with open(temp_path, 'wb') as f:
+                    f.write(b'partial')
+                raise RuntimeError('сбой во время записи')
+
+        with open(path, 'rb') as f:
+            assert f.read() == before
+        assert os.listdir(temp_dir) == ['result.png']
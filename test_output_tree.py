@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты выходного дерева в другой директории (--output-dir, --staging-dir)
+"""
+
+import os
+import tempfile
+
+from PIL import Image
+
+from output_tree import BackgroundMover, OutputTree
+import conversion
+
+
+def create_tree(root):
+    """Исходное дерево с вложенными папками, пустой папкой и дубликатом"""
+    os.makedirs(os.path.join(root, 'a', 'b'))
+    os.makedirs(os.path.join(root, 'empty'))
+    Image.new('RGB', (20, 20), 'red').save(os.path.join(root, 'a', 'x.webp'), 'WEBP')
+    Image.new('RGB', (20, 20), 'red').save(os.path.join(root, 'a', 'b', 'copy.webp'), 'WEBP')
+    Image.new('RGB', (30, 20), 'blue').save(os.path.join(root, 'y.webp'), 'WEBP')
+    return ['a/x.png', 'a/b/copy.png', 'y.png']
+
+
+def test_skeleton_mirrors_directories_and_skips_nested_output():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        create_tree(source)
+        # Выходное дерево прошлого запуска с другим --output-dir: в нем только PNG
+        os.makedirs(os.path.join(source, 'old', 'sub'))
+        Image.new('RGB', (20, 20), 'red').save(os.path.join(source, 'old', 'sub', 'x.png'), 'PNG')
+        tree = OutputTree(source, os.path.join(source, 'out'), os.path.join(temp_dir, 'stage'))
+
+        assert tree.create_skeleton() == 3
+        for root in (tree.output_root, tree.staging_root):
+            assert os.path.isdir(os.path.join(root, 'a', 'b'))
+            assert not os.path.exists(os.path.join(root, 'empty'))
+            assert not os.path.exists(os.path.join(root, 'old'))
+        assert not os.path.exists(os.path.join(tree.output_root, 'out'))
+        # Повторный обход не создает выходную директорию внутри самой себя
+        tree.create_skeleton()
+        assert not os.path.exists(os.path.join(tree.output_root, 'out'))
+
+        written = tree.output_path(os.path.join(source, 'a', 'x.webp'))
+        assert written == os.path.join(tree.staging_root, 'a', 'x.png')
+        assert tree.moved_path(written) == tree.final_path(os.path.join(source, 'a', 'x.webp'))
+
+
+def test_process_directory_writes_mirrored_tree():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        output = os.path.join(temp_dir, 'out')
+        expected = create_tree(source)
+
+        assert conversion.process_directory(source, jobs=2, dedup='link', use_cache=True, output_dir=output) == (3, 3)
+        for path in expected:
+            assert os.path.isfile(os.path.join(output, path))
+        assert not any(name.endswith('.png') for _, _, names in os.walk(source) for name in names)
+
+        success = conversion.process_directory(source, jobs=1, overlap_io=True,
+                                               output_dir=os.path.join(temp_dir, 'piped'))
+        assert success == (3, 3)
+        for path in expected:
+            assert os.path.isfile(os.path.join(temp_dir, 'piped', path))
+
+
+def test_nested_output_is_not_converted_again():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        output = os.path.join(source, 'out')
+        staging = os.path.join(source, 'stage')
+        create_tree(source)
+
+        # WebP в выходном и промежуточном деревьях не считаются новыми исходниками
+        for _ in range(2):
+            assert conversion.process_directory(source, jobs=2, output_dir=output, staging_dir=staging,
+                                                output_format='webp') == (3, 3)
+        assert not os.path.exists(os.path.join(output, 'out'))
+        assert conversion.process_directory(source, jobs=1, overlap_io=True, output_dir=output, output_format='webp') == (3, 3)
+        assert not os.path.exists(os.path.join(output, 'out'))
+        assert not [name for _, _, names in os.walk(os.path.join(output, 'stage')) for name in names]
+
+
+def test_staging_moves_in_background_and_deletes_after_move():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'src')
+        output = os.path.join(temp_dir, 'out')
+        staging = os.path.join(temp_dir, 'stage')
+        expected = create_tree(source)
+
+        assert conversion.process_directory(
+            source, jobs=2, delete_original=True, dedup='link',
+            output_dir=output, staging_dir=staging) == (3, 3)
+        for path in expected:
+            assert os.path.isfile(os.path.join(output, path))
+        assert os.listdir(staging) == []
+        assert not any(name.endswith('.webp') for _, _, names in os.walk(source) for name in names)
+
+
+def test_mover_keeps_file_in_staging_when_move_fails():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        tree = OutputTree(temp_dir, os.path.join(temp_dir, 'out'), os.path.join(temp_dir, 'stage'))
+        staged = os.path.join(tree.staging_root, 'sub', 'image.png')
+        os.makedirs(os.path.dirname(staged))
+        with open(staged, 'wb') as f:
+            f.write(b'png')
+        # Директории выходного дерева не созданы: перенос не удается
+        mover = BackgroundMover(tree, threads=1)
+        mover.submit('image.webp', [staged])
+        mover.close()
+
+        (source, moved, error), = list(mover.drain())
+        assert source == 'image.webp' and moved == [] and error
+        assert os.path.exists(staged)
+        assert mover.failed == 1
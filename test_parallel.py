@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты параллельной обработки директорий
+"""
+
+import os
+import tempfile
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from batch import as_record
+from discovery import iter_webp_files
+from parallel import run_conversions
+from profiling import BatchProfile
+import conversion
+
+
+def create_webp_tree(root, count=4):
+    """Создает несколько WebP файлов, часть из них во вложенной папке"""
+    sub_dir = os.path.join(root, 'sub')
+    os.makedirs(sub_dir)
+    paths = []
+    for i in range(count):
+        folder = root if i % 2 else sub_dir
+        path = os.path.join(folder, f'image_{i}.webp')
+        Image.new('RGBA', (32, 16), (i * 40, 0, 0, 128)).save(path, 'WEBP')
+        paths.append(path)
+    return paths
+
+
+def test_parallel_process_directory():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_tree(temp_dir)
+        assert conversion.process_directory(temp_dir, jobs=2) == (4, 4)
+        for path in paths:
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+
+
+def test_serial_process_directory_with_delete():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = create_webp_tree(temp_dir)
+        assert conversion.process_directory(temp_dir, delete_original=True, jobs=1) == (4, 4)
+        for path in paths:
+            assert not os.path.exists(path)
+            assert os.path.exists(os.path.splitext(path)[0] + '.png')
+
+
+def test_parallel_reports_failures():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_webp_tree(temp_dir, count=2)
+        with open(os.path.join(temp_dir, 'broken.webp'), 'wb') as f:
+            f.write(b'not a webp')
+        assert conversion.process_directory(temp_dir, jobs=2) == (2, 3)
+
+
+def test_uppercase_extension_is_found():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'PHOTO.WEBP')
+        Image.new('RGB', (8, 8), 'red').save(path, 'WEBP')
+        assert list(iter_webp_files(temp_dir)) == [path]
+        assert conversion.process_directory(temp_dir, jobs=1) == (1, 1)
+
+
+def test_files_are_consumed_lazily():
+    consumed = []
+
+    def files():
+        for i in range(10):
+            consumed.append(i)
+            yield f'file_{i}'
+
+    results = run_conversions(len, files(), jobs=1)
+    assert next(results) == ('file_0', 6)
+    assert consumed == [0]
+
+
+def crash_on(path):
+    """Функция конвертации, рабочий процесс которой аварийно завершается на файлах crash"""
+    if path.startswith('crash'):
+        os._exit(1)
+    return len(path)
+
+
+def test_broken_pool_is_restarted(monkeypatch):
+    files = ['ok_0', 'crash', 'ok_1', 'ok_2']
+    results = dict(run_conversions(crash_on, files, jobs=2, max_pending=1))
+    # Ошибка рабочего процесса возвращается вызывающему, а не печатается
+    error = results.pop('crash')
+    assert isinstance(error, BrokenProcessPool)
+    record = as_record('crash', error)
+    assert not record.ok and record.error.startswith('Ошибка в рабочем процессе')
+    assert results == {'ok_0': 4, 'ok_1': 4, 'ok_2': 4}
+
+    # Пул сломан к моменту передачи следующего файла: файл ждет новый пул
+    pools = []
+
+    class BreakingPool(concurrent.futures.ProcessPoolExecutor):
+        def submit(self, *args, **kwargs):
+            if len(pools) == 1 and args[1] == 'ok_1':
+                raise BrokenProcessPool('пул сломан')
+            return super().submit(*args, **kwargs)
+
+        def __init__(self, *args, **kwargs):
+            pools.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', BreakingPool)
+    results = dict(run_conversions(crash_on, ['ok_0', 'ok_1', 'ok_2'], jobs=2, max_pending=1))
+    assert results == {'ok_0': 4, 'ok_1': 4, 'ok_2': 4}
+    assert len(pools) == 2
+    monkeypatch.undo()
+
+    # Пул ломается снова без единого завершенного файла: остальные файлы отмечаются неудачными
+    files = ['crash_0', 'crash_1', 'ok_0', 'ok_1']
+    results = dict(run_conversions(crash_on, iter(files), jobs=2, max_pending=1))
+    assert sorted(results) == sorted(files)
+    assert all(isinstance(error, BrokenProcessPool) for error in results.values())
+
+
+def test_profile_collects_stage_timings_from_workers():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_webp_tree(temp_dir, count=3)
+        profile = BatchProfile()
+        assert conversion.process_directory(temp_dir, jobs=2, profile=profile) == (3, 3)
+        assert len(profile.records) == 3
+        for _, timings in profile.records:
+            assert {'open', 'decode', 'convert', 'encode', 'write'} <= set(timings)
+        trace_path = os.path.join(temp_dir, 'trace.csv')
+        profile.write_trace(trace_path)
+        with open(trace_path, encoding='utf-8') as f:
+            assert len(f.readlines()) == 4
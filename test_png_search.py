@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты поиска наименьшего PNG (--smallest)
+"""
+
+import io
+import os
+import tempfile
+
+import pytest
+from PIL import Image, ImageChops, ImageDraw
+
+import png_search
+from batch import FileResult
+from png_presets import png_save_options
+import conversion
+
+
+def same_pixels(png_data, img):
+    with Image.open(io.BytesIO(png_data)) as decoded:
+        return ImageChops.difference(decoded.convert(img.mode), img).getbbox() is None
+
+
+def striped(mode, colors, size=(64, 48)):
+    img = Image.new(mode, size, colors[0])
+    draw = ImageDraw.Draw(img)
+    for index, color in enumerate(colors):
+        draw.rectangle((index * 4, 0, index * 4 + 3, size[1]), fill=color)
+    return img
+
+
+def noisy(size=(64, 48), levels=256, blue=5):
+    noise = Image.effect_noise(size, 60).point(lambda value: value // (256 // levels) * (256 // levels))
+    return Image.merge('RGB', [noise, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT),
+                               Image.new('L', size, blue)])
+
+
+@pytest.mark.parametrize('img, expected', [
+    (striped('RGB', [(i, 255 - i, 7) for i in range(0, 250, 25)]), {'base', 'palette'}),
+    (striped('RGBA', [(i, 0, 0, 255) for i in range(0, 250, 25)]), {'base', 'opaque', 'palette'}),
+    (striped('RGBA', [(i, 0, 0, i) for i in range(0, 250, 25)]), {'base', 'palette'}),
+    (striped('RGB', [(i, i, i) for i in range(0, 250, 25)]), {'base', 'grey', 'palette'}),
+    (striped('RGB', [(0, 0, 0), (255, 255, 255)]), {'base', 'grey', 'bilevel', 'palette'}),
+    (noisy(), {'base'}),
+])
+def test_variants_are_lossless(img, expected):
+    variants = png_search.build_variants(img)
+
+    assert set(variants) == expected
+    for variant in variants.values():
+        assert same_pixels(png_search.encode(variant, {}), img)
+
+
+def close_colors(alpha):
+    """Изображение из близких цветов, которые квантование октодеревом сливает"""
+    img = Image.new('RGBA', (96, 64))
+    img.putdata([(100 + i % 5, 100 + i // 5 % 5, 100 + i // 25 % 5, alpha(i)) for i in range(96 * 64)])
+    return img
+
+
+@pytest.mark.parametrize('alpha', [lambda i: 250 + i % 5, lambda i: 254 + i // 125 % 2])
+def test_palette_keeps_close_colors(alpha, monkeypatch):
+    img = close_colors(alpha)
+
+    palette = png_search.build_variants(img, ('palette',))['palette']
+    assert palette.mode == 'P'
+    assert ImageChops.difference(palette.convert('RGBA'), img).getbbox() is None
+
+    # Сверх лимита палитра по пикселям не строится: остается только точное квантование
+    monkeypatch.setattr(png_search, 'EXACT_PALETTE_MAX_PIXELS', 0)
+    palette = png_search.build_variants(img, ('palette',)).get('palette')
+    assert palette is None or ImageChops.difference(palette.convert('RGBA'), img).getbbox() is None
+
+
+def test_search_is_not_larger_than_usual_encoding():
+    img = striped('RGB', [(i, i, i) for i in range(0, 250, 25)])
+    png_options = png_save_options('fastest')
+
+    data, recipe = png_search.search(img, png_options, threads=4)
+
+    assert same_pixels(data, img)
+    assert recipe['bytes'] == len(data)
+    assert recipe['baseline_bytes'] == len(png_search.encode(img, png_options))
+    assert png_search.saved_bytes(recipe) > 0
+    # Результат не зависит от числа потоков
+    assert png_search.search(img, png_options, threads=1) == (data, recipe)
+
+
+def test_cached_recipe_skips_search(monkeypatch):
+    img = striped('RGB', [(0, 0, 0), (255, 255, 255)])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        smallest = png_search.search_options(temp_dir)
+        key = png_search.search_key('0' * 32, {})
+
+        data, recipe, cached = png_search.smallest_png(img, {}, smallest, key)
+        assert not cached
+
+        def fail(*args, **kwargs):
+            raise AssertionError('поиск не должен повторяться')
+
+        monkeypatch.setattr(png_search, 'search', fail)
+        assert png_search.smallest_png(img, {}, smallest, key) == (data, recipe, True)
+        # Другие параметры конвертации - другой ключ
+        assert png_search.search_key('0' * 32, {'compress_level': 1}) != key
+
+
+def test_process_directory_reports_saved_bytes(capsys):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache_dir = os.path.join(temp_dir, 'cache')
+        source = os.path.join(temp_dir, 'images')
+        os.makedirs(source)
+        for index in range(3):
+            noisy(levels=4, blue=index).save(os.path.join(source, f'image_{index}.webp'),
+                                             'WEBP', lossless=True)
+        smallest = png_search.search_options(cache_dir, jobs=2)
+
+        assert conversion.process_directory(source, jobs=2, smallest=smallest) == (3, 3)
+        assert 'сэкономлено' in capsys.readouterr().out
+        assert len(os.listdir(cache_dir)) > 0
+
+        record = FileResult(os.path.join(source, 'image_0.webp'))
+        assert conversion.convert_webp_to_png(record.path, smallest=smallest,
+                                              quiet=True, result=record)
+        assert record.saved_bytes > 0
+        with Image.open(os.path.join(source, 'image_0.webp')) as original:
+            with open(os.path.join(source, 'image_0.png'), 'rb') as f:
+                assert same_pixels(f.read(), original.convert('RGB'))
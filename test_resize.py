@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты уменьшения изображений при конвертации
+"""
+
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+from resize import parse_max_size, parse_scale, target_size
+from profiling import StageProfiler
+import conversion
+
+
+def test_size_specs():
+    assert parse_max_size('800x600') == '800x600'
+    assert parse_max_size('256') == '256x256'
+    assert parse_scale('0.25') == '0.25x'
+    assert parse_scale('50%') == '0.5x'
+    with pytest.raises(ValueError):
+        parse_scale('2')
+    with pytest.raises(ValueError):
+        parse_max_size('0x10')
+
+    assert target_size((4000, 3000), '800x800') == (800, 600)
+    assert target_size((4000, 3000), '0.5x') == (2000, 1500)
+    # Изображения не увеличиваются
+    assert target_size((100, 50), '800x600') == (100, 50)
+
+
+def test_several_sizes_from_one_decode():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'photo.webp')
+        Image.new('RGBA', (1200, 900), (10, 200, 30, 255)).save(path, 'WEBP')
+
+        calls = []
+        profiler = StageProfiler(hook=lambda stage, seconds: calls.append(stage))
+        assert conversion.convert_webp_to_png(path, sizes=['400x400', '0.1x'], profiler=profiler)
+        assert calls.count('decode') == 1
+        assert calls.count('resize') == 2
+
+        with Image.open(os.path.join(temp_dir, 'photo_400x400.png')) as img:
+            assert img.size == (400, 300)
+            assert img.mode == 'RGB'
+        with Image.open(os.path.join(temp_dir, 'photo_0.1x.png')) as img:
+            assert img.size == (120, 90)
+        assert not os.path.exists(os.path.join(temp_dir, 'photo.png'))
+
+
+def test_single_size_keeps_name_and_transparency():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'icon.webp')
+        img = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+        img.paste((255, 0, 0, 255), (16, 16, 48, 48))
+        img.save(path, 'WEBP', lossless=True)
+
+        assert conversion.convert_webp_to_png(path, keep_alpha=True, sizes=['32x32'])
+        with Image.open(os.path.join(temp_dir, 'icon.png')) as result:
+            assert result.size == (32, 32)
+            assert result.getpixel((0, 0))[3] == 0
+            # Цвет на краю непрозрачной области не темнеет от прозрачных черных пикселей
+            red, _, _, alpha = result.getpixel((8, 16))
+            assert alpha > 0 and red > 240
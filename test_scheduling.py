@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты оценки памяти по заголовку WebP и планировщика пакетной конвертации
+"""
+
+import io
+import os
+import tempfile
+
+import pytest
+from PIL import Image
+
+from parallel import run_conversions
+from scheduling import AdaptiveScheduler, TUNE_INTERVAL, estimate_cost, parse_memory_limit
+from webp_header import HEADER_BYTES, parse_webp_header
+import conversion
+
+
+def webp_bytes(mode='RGB', size=(37, 21), **save_options):
+    buffer = io.BytesIO()
+    # Полупрозрачный цвет: полностью непрозрачный альфа-канал libwebp не сохраняет
+    Image.new(mode, size, (255, 0, 0, 128)).save(buffer, 'WEBP', **save_options)
+    return buffer.getvalue()
+
+
+def animated_webp_bytes(size=(40, 30)):
+    frames = [Image.new('RGB', size, color) for color in ('red', 'green', 'blue')]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, 'WEBP', save_all=True, append_images=frames[1:], duration=50)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('data, alpha, animated, lossless', [
+    (webp_bytes(), False, False, False),
+    (webp_bytes(lossless=True), False, False, True),
+    (webp_bytes('RGBA'), True, False, False),
+    (webp_bytes('RGBA', lossless=True), True, False, True),
+    (animated_webp_bytes(), False, True, False),
+])
+def test_header_matches_decoded_image(data, alpha, animated, lossless):
+    header = parse_webp_header(data[:HEADER_BYTES])
+
+    with Image.open(io.BytesIO(data)) as img:
+        assert (header.width, header.height) == img.size
+    assert header.alpha == alpha
+    assert header.animated == animated
+    assert header.lossless == lossless
+
+
+def test_header_rejects_other_data():
+    with pytest.raises(ValueError):
+        parse_webp_header(b'\x89PNG\r\n\x1a\n' + b'\0' * HEADER_BYTES)
+    with pytest.raises(ValueError):
+        parse_webp_header(webp_bytes()[:HEADER_BYTES - 1])
+
+
+def test_estimate_cost_uses_header_and_falls_back_to_file_size():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        small = os.path.join(temp_dir, 'small.webp')
+        large = os.path.join(temp_dir, 'large.webp')
+        broken = os.path.join(temp_dir, 'broken.webp')
+        Image.new('RGB', (10, 10)).save(small, 'WEBP')
+        Image.new('RGB', (100, 100)).save(large, 'WEBP')
+        with open(broken, 'wb') as f:
+            f.write(b'x' * 50)
+
+        assert estimate_cost(large) == 100 * estimate_cost(small)
+        assert estimate_cost(broken) > 0
+        assert estimate_cost(os.path.join(temp_dir, 'missing.webp')) == 0
+
+
+def test_order_is_largest_first_within_lookahead():
+    costs = {'a': 1, 'b': 5, 'c': 3, 'd': 9, 'e': 2}
+    consumed = []
+
+    def files():
+        for path in costs:
+            consumed.append(path)
+            yield path
+
+    scheduler = AdaptiveScheduler(2, lookahead=3, estimate=costs.get)
+    ordered = scheduler.order(files())
+
+    assert next(ordered) == 'b'
+    assert consumed == ['a', 'b', 'c']
+    assert list(ordered) == ['d', 'c', 'e', 'a']
+
+    assert list(AdaptiveScheduler(2, estimate=costs.get).order(costs)) == ['d', 'b', 'c', 'e', 'a']
+
+
+def test_admission_respects_memory_budget():
+    costs = {'huge': 100, 'big': 60, 'small': 30}
+    scheduler = AdaptiveScheduler(4, memory_budget=80, estimate=costs.get)
+
+    # Файл больше бюджета запускается, когда в работе ничего нет
+    assert scheduler.admit('huge')
+    scheduler.start('huge')
+    assert not scheduler.admit('small')
+    assert not scheduler.admit('small')
+    assert scheduler.deferred == 1
+    scheduler.finish('huge')
+
+    scheduler.start('big')
+    assert not scheduler.admit('small')
+    scheduler.finish('big')
+    assert scheduler.admit('small')
+    assert scheduler.peak_reserved == 100
+    assert scheduler.reserved == 0
+
+
+def test_autotune_climbs_and_reverses_when_rate_drops():
+    scheduler = AdaptiveScheduler(4, autotune=True, estimate=lambda path: 100)
+    scheduler._window_start = 0.0
+    assert scheduler.limit == 2
+
+    def run_window(index, files):
+        # files файлов равномерно завершаются за одно окно подстройки
+        for i in range(files):
+            path = f'{index}-{i}'
+            scheduler.start(path)
+            scheduler.finish(path, now=index * TUNE_INTERVAL + TUNE_INTERVAL * (i + 1) / files)
+
+    run_window(0, 10)
+    assert scheduler.limit == 3
+    run_window(1, 20)
+    assert scheduler.limit == 4
+    # Скорость упала: лимит возвращается назад
+    run_window(2, 5)
+    assert scheduler.limit == 3
+    assert scheduler.limits == [2, 3, 4, 3]
+
+
+def test_run_conversions_admits_by_memory_budget():
+    costs = {f'file_{i}': 10 * (i + 1) for i in range(6)}
+    scheduler = AdaptiveScheduler(3, memory_budget=1, estimate=costs.get)
+
+    results = list(run_conversions(len, scheduler.order(costs), jobs=3, scheduler=scheduler))
+
+    assert sorted(results) == sorted((path, len(path)) for path in costs)
+    # Каждый файл больше бюджета, поэтому файлы выполнялись по одному
+    assert scheduler.peak_reserved == max(costs.values())
+    assert scheduler.in_flight == 0
+
+
+def test_process_directory_with_memory_limit_and_auto_jobs():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths = []
+        for i in range(4):
+            path = os.path.join(temp_dir, f'image_{i}.webp')
+            Image.new('RGB', (16 * (i + 1), 16), (i * 50, 0, 0)).save(path, 'WEBP')
+            paths.append(path)
+
+        assert conversion.process_directory(temp_dir, jobs=2, memory_budget=1024 * 1024, auto_jobs=True) == (4, 4)
+        assert conversion.process_directory(temp_dir, jobs=2, memory_budget=1024) == (4, 4)
+        assert all(os.path.exists(os.path.splitext(path)[0] + '.png') for path in paths)
+        assert conversion.process_directory(temp_dir, overlap_io=True, auto_jobs=True) is None
+
+
+def test_single_job_does_not_report_scheduler(capsys):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        Image.new('RGB', (16, 16)).save(os.path.join(temp_dir, 'image.webp'), 'WEBP')
+
+        assert conversion.process_directory(temp_dir, jobs=1, memory_budget=1024, auto_jobs=True) == (1, 1)
+        output = capsys.readouterr().out
+        assert 'не действуют при одном процессе' in output
+        assert 'параллельность' not in output
+
+
+def test_parse_memory_limit():
+    assert parse_memory_limit('512') == 512 * 1024 * 1024
+    assert parse_memory_limit('auto') > 0
+    with pytest.raises(ValueError):
+        parse_memory_limit('0')
+    with pytest.raises(ValueError):
+        parse_memory_limit('много')
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты конвертации stdin/stdout и tar архивов
+"""
+
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import subprocess
+
+import pytest
+from PIL import Image
+
+from streams import convert_stream, convert_tar_stream
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def webp_bytes(color=(10, 120, 200), size=(24, 16)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'WEBP', lossless=True)
+    return buffer.getvalue()
+
+
+def make_tar(members):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as archive:
+        for name, data in members:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1_700_000_000
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+class OneWayStream(io.RawIOBase):
+    """Поток без перемотки, как канал между процессами"""
+
+    def __init__(self, data=b''):
+        self._source = io.BytesIO(data)
+        self.written = bytearray()
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        self.written += data
+        return len(data)
+
+
+def test_convert_stream_single_image():
+    png_data, timings = convert_stream(webp_bytes())
+    with Image.open(io.BytesIO(png_data)) as img:
+        assert img.format == 'PNG'
+        assert img.size == (24, 16)
+    assert 'encode' in timings
+
+    with pytest.raises(ValueError):
+        convert_stream(webp_bytes(), sizes=['10x10', '0.5x'])
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_tar_stream_keeps_order_and_passes_other_members(jobs):
+    colors = [(i * 20, 50, 90) for i in range(6)]
+    members = [(f'batch/image_{i}.webp', webp_bytes(color)) for i, color in enumerate(colors)]
+    members.insert(2, ('batch/manifest.json', b'{"count": 6}'))
+    members.append(('batch/broken.webp', b'not a webp'))
+    source = OneWayStream(make_tar(members))
+    target = OneWayStream()
+
+    records = list(convert_tar_stream(source, target, jobs=jobs, max_pending=2, buffer_bytes=1))
+
+    assert [record.path for record in records] == [name for name, _ in members if name.endswith('.webp')]
+    assert [record.ok for record in records] == [True] * 6 + [False]
+    assert 'batch/broken.webp' in records[-1].error
+
+    with tarfile.open(fileobj=io.BytesIO(bytes(target.written))) as archive:
+        names = archive.getnames()
+        assert names == ['batch/image_0.png', 'batch/image_1.png', 'batch/manifest.json',
+                         'batch/image_2.png', 'batch/image_3.png', 'batch/image_4.png', 'batch/image_5.png']
+        assert archive.extractfile('batch/manifest.json').read() == b'{"count": 6}'
+        member = archive.getmember('batch/image_3.png')
+        assert member.mtime == 1_700_000_000
+        with Image.open(archive.extractfile(member)) as img:
+            img.load()
+            assert img.getpixel((0, 0)) == colors[3]
+
+
+def test_stdin_to_stdout_cli():
+    result = subprocess.run([sys.executable, os.path.join(SCRIPT_DIR, 'webp2png.py'), '-'],
+                            input=webp_bytes(), capture_output=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.startswith(b'\x89PNG\r\n\x1a\n')
+    assert b'stdin.webp' in result.stderr
+
+
+def test_tar_file_to_tar_file_cli():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source = os.path.join(temp_dir, 'input.tar')
+        target = os.path.join(temp_dir, 'output.tar')
+        with open(source, 'wb') as f:
+            f.write(make_tar([('one.webp', webp_bytes()), ('two.webp', webp_bytes((0, 0, 0)))]))
+
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, 'webp_to_png_converter.py'), source,
+             '--tar', '-o', target, '-j', '1'],
+            capture_output=True, text=True, timeout=120)
+
+        assert result.returncode == 0, result.stdout + result.stderr
+        with tarfile.open(target) as archive:
+            assert archive.getnames() == ['one.png', 'two.png']
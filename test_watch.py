@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты отслеживания папки (--watch)
+"""
+
+import os
+import time
+import tempfile
+import threading
+from functools import partial
+
+import pytest
+from PIL import Image
+
+from batch import convert_file
+from watch import Debouncer, InotifyWatcher, PollingWatcher, iter_arrivals, open_watcher
+import conversion
+
+
+def inotify_available():
+    try:
+        watcher = InotifyWatcher(tempfile.gettempdir())
+    except (OSError, AttributeError):
+        return False
+    watcher.close()
+    return True
+
+
+def write_webp(path, color=(10, 120, 200)):
+    Image.new('RGB', (24, 16), color).save(path, 'WEBP')
+
+
+def png_path(path):
+    return os.path.splitext(path)[0] + '.png'
+
+
+def wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def collect(watcher, timeout=5.0):
+    """Собирает изменения, пока они приходят"""
+    changes = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        batch = watcher.changes(0.2)
+        changes.extend(batch)
+        if changes and not batch:
+            break
+    return changes
+
+
+def test_debouncer_waits_until_file_is_stable():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'growing.webp')
+        with open(path, 'wb') as f:
+            f.write(b'x' * 10)
+        debouncer = Debouncer(debounce=1.0)
+        debouncer.touch(path, now=100.0)
+
+        assert list(debouncer.pop_ready(now=100.5)) == []
+        # Файл дописан до истечения срока: срок откладывается
+        with open(path, 'ab') as f:
+            f.write(b'y' * 10)
+        assert list(debouncer.pop_ready(now=101.0)) == []
+        assert debouncer.timeout(now=101.0) == pytest.approx(1.0)
+        assert list(debouncer.pop_ready(now=102.0)) == [path]
+        assert len(debouncer) == 0
+
+        # Файл, открытый на запись и не закрытый, ждет дольше
+        debouncer.touch(path, complete=False, now=200.0)
+        assert list(debouncer.pop_ready(now=201.0)) == []
+        debouncer.touch(path, complete=True, now=201.0)
+        assert list(debouncer.pop_ready(now=202.0)) == [path]
+
+
+def test_polling_watcher_reports_only_new_files():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_webp(os.path.join(temp_dir, 'old.webp'))
+        watcher = PollingWatcher(temp_dir, interval=0.05)
+        subdir = os.path.join(temp_dir, 'incoming')
+        os.mkdir(subdir)
+        new_file = os.path.join(subdir, 'new.webp')
+        write_webp(new_file)
+        with open(os.path.join(temp_dir, 'notes.txt'), 'w') as f:
+            f.write('не WebP')
+
+        assert collect(watcher) == [(new_file, True)]
+
+
+@pytest.mark.skipif(not inotify_available(), reason='inotify недоступен')
+def test_inotify_watcher_reports_closed_and_moved_files():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        watcher = InotifyWatcher(temp_dir)
+        try:
+            written = os.path.join(temp_dir, 'written.webp')
+            write_webp(written)
+            partial_path = os.path.join(temp_dir, 'moved.webp.part')
+            write_webp(partial_path)
+            moved = os.path.join(temp_dir, 'moved.webp')
+            os.rename(partial_path, moved)
+            subdir = os.path.join(temp_dir, 'sub')
+            os.mkdir(subdir)
+            nested = os.path.join(subdir, 'nested.webp')
+            write_webp(nested)
+
+            changes = collect(watcher)
+        finally:
+            watcher.close()
+        complete = {path for path, done in changes if done}
+        assert {written, moved, nested} <= complete
+        assert all(path.endswith('.webp') for path, _ in changes)
+
+
+@pytest.mark.parametrize('polling', [True, False])
+def test_iter_arrivals_converts_new_files_in_pool(polling):
+    if not polling and not inotify_available():
+        pytest.skip('inotify недоступен')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        watcher = open_watcher(temp_dir, poll_interval=0.05, polling=polling)
+        paths = [os.path.join(temp_dir, f'image_{i}.webp') for i in range(3)]
+        for i, path in enumerate(paths):
+            write_webp(path, (i * 70, 30, 30))
+
+        arrivals = iter_arrivals(watcher, partial(convert_file, conversion.convert_webp_to_png),
+                                 jobs=2, debounce=0.1, max_pending=1)
+        records = []
+        for path, record in arrivals:
+            records.append(record)
+            if len(records) == len(paths):
+                break
+        arrivals.close()
+
+        assert sorted(record.path for record in records) == paths
+        assert all(record.ok for record in records)
+        assert all(os.path.exists(png_path(path)) for path in paths)
+
+
+def test_watch_directory_converts_existing_and_new_files():
+    with tempfile.TemporaryDirectory() as temp_dir:
+        existing = os.path.join(temp_dir, 'existing.webp')
+        write_webp(existing)
+        stop_event = threading.Event()
+        result = {}
+
+        def run():
+            result['counts'] = conversion.watch_directory(
+                temp_dir, delete_original=True, jobs=1, debounce=0.1, poll_interval=0.05,
+                polling=True, stop_event=stop_event)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        try:
+            assert wait_for(lambda: os.path.exists(png_path(existing)))
+            arrived = os.path.join(temp_dir, 'arrived.webp')
+            write_webp(arrived, (200, 10, 10))
+            assert wait_for(lambda: os.path.exists(png_path(arrived)) and not os.path.exists(arrived))
+        finally:
+            stop_event.set()
+            thread.join(timeout=15)
+
+        assert not thread.is_alive()
+        assert result['counts'] == (2, 2)
+        assert not os.path.exists(existing)
+
+
+def test_watch_directory_rejects_conflicting_options_before_watching(monkeypatch):
+    def open_watcher_fails(*args, **kwargs):
+        raise AssertionError('наблюдатель не должен открываться')
+
+    monkeypatch.setattr('watch.open_watcher', open_watcher_fails)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        existing = os.path.join(temp_dir, 'existing.webp')
+        write_webp(existing)
+
+        result = conversion.watch_directory(
+            temp_dir, jobs=1, polling=True, directory_options={'distributed': True, 'use_cache': True})
+
+        assert result is None
+        assert not os.path.exists(png_path(existing))
@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Отслеживание папки: конвертация WebP файлов по мере появления
+
+Вместо периодического обхода всего дерева изменения берутся из inotify
+(Linux, через ctypes без сторонних пакетов). Если inotify недоступен или
+папка лежит на сетевом диске, где события от других машин не приходят,
+используется опрос: раз в poll_interval проверяется только время изменения
+директорий, а перечитываются лишь изменившиеся.
+
+Файл конвертируется, когда запись в него завершена: после закрытия или
+переименования (inotify) и если его размер и время изменения не менялись
+debounce секунд. Новые файлы подаются в пул процессов через ограниченную
+очередь: пока пул занят, события не читаются и копятся в ядре, поэтому
+поток новых файлов не расходует память конвертера.
+"""
+
+import os
+import time
+import heapq
+import collections
+
+from discovery import is_webp_name, iter_webp_files
+from resize import primary_output_path
+
+# Сколько секунд файл должен оставаться неизменным после последнего события
+DEFAULT_DEBOUNCE = 0.5
+# Период опроса директорий, если inotify недоступен
+DEFAULT_POLL_INTERVAL = 1.0
+# Файл, открытый на запись и не закрытый (например, при зависшем копировании),
+# считается записанным только после стольких секунд без изменений
+STALLED_WRITE_TIMEOUT = 30.0
+# Время изменения директории на FAT и SMB хранится с точностью до 2 секунд:
+# директории, изменившиеся недавно, перечитываются при каждом опросе
+MTIME_GRANULARITY = 2.0
+# Как часто проверяется stop_event и завершенные задачи пула
+STOP_CHECK_INTERVAL = 0.2
+RESULT_CHECK_INTERVAL = 0.05
+
+# Константы inotify из <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_ONLYDIR
+INOTIFY_READ_SIZE = 64 * 1024
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_up_to_date(input_path, sizes=None, extension='.png'):
+    """Проверяет, что исходного файла уже нет или его выходной файл не старше исходника"""
+    try:
+        source_mtime = os.stat(input_path).st_mtime_ns
+    except OSError:
+        return True  # Файл удален, например, после конвертации с --delete
+    output_path = primary_output_path(input_path, sizes, extension)
+    for path in (output_path, f"{os.path.splitext(output_path)[0]}_0000.png"):
+        try:
+            if os.stat(path).st_mtime_ns >= source_mtime:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+class Debouncer:
+    """
+    Откладывает файлы, пока запись в них не завершится
+
+    Args:
+        debounce (float): Сколько секунд файл должен оставаться неизменным
+    """
+
+    def __init__(self, debounce=DEFAULT_DEBOUNCE):
+        self.debounce = debounce
+        self._entries = {}  # путь -> (срок, подпись файла, файл открыт на запись)
+        self._heap = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _schedule(self, path, deadline, signature, writing):
+        self._entries[path] = (deadline, signature, writing)
+        heapq.heappush(self._heap, (deadline, path))
+
+    def touch(self, path, complete=True, now=None):
+        """
+        Учитывает событие файла
+
+        Args:
+            path (str): Путь к файлу
+            complete (bool): Запись завершена (файл закрыт или переименован);
+                False - файл создан или изменяется
+            now (float, optional): Текущее время time.monotonic()
+        """
+        now = time.monotonic() if now is None else now
+        signature = _file_signature(path)
+        if signature is None:
+            self._entries.pop(path, None)
+            return
+        # Повторная запись в уже закрытый файл снова откладывает его до закрытия
+        writing = not complete
+        self._schedule(path, now + (STALLED_WRITE_TIMEOUT if writing else self.debounce), signature, writing)
+
+    def timeout(self, now=None):
+        """Секунды до ближайшего срока или None, если файлов нет"""
+        while self._heap:
+            deadline, path = self._heap[0]
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == deadline:
+                now = time.monotonic() if now is None else now
+                return max(0.0, deadline - now)
+            heapq.heappop(self._heap)  # Устаревший срок: файл уже тронут заново
+        return None
+
+    def pop_ready(self, now=None):
+        """
+        Выдает файлы, которые не изменялись debounce секунд
+
+        Yields:
+            str: Путь к файлу, готовому к конвертации
+        """
+        now = time.monotonic() if now is None else now
+        while self._heap and self._heap[0][0] <= now:
+            deadline, path = heapq.heappop(self._heap)
+            entry = self._entries.get(path)
+            if entry is None or entry[0] != deadline:
+                continue
+            _, signature, writing = entry
+            current = _file_signature(path)
+            if current is None:
+                del self._entries[path]
+            elif current != signature:
+                self._schedule(path, now + (STALLED_WRITE_TIMEOUT if writing else self.debounce), current, writing)
+            else:
+                del self._entries[path]
+                yield path
+
+
+class PollingWatcher:
+    """
+    Отслеживание опросом: сравнение времени изменения директорий со снимком
+
+    Добавление, удаление и переименование файла меняют время изменения его
+    директории, поэтому за опрос выполняется по одному stat на директорию,
+    а содержимое перечитывается только у изменившихся.
+
+    Args:
+        directory (str): Корень отслеживаемого дерева
+        interval (float): Период опроса в секундах
+    """
+
+    name = 'опрос'
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self._dirs = {}  # директория -> (время изменения, имена WebP файлов)
+        self._next_poll = time.monotonic() + interval
+        list(self._scan(directory))
+
+    def _scan(self, directory):
+        """Перечитывает директорию и выдает новые WebP файлы, включая новые поддиректории"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                mtime = os.stat(current).st_mtime
+                with os.scandir(current) as entries:
+                    names = set()
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if entry.path not in self._dirs:
+                                    stack.append(entry.path)
+                            elif is_webp_name(entry.name) and entry.is_file():
+                                names.add(entry.name)
+                        except OSError:
+                            continue
+            except OSError:
+                self._dirs.pop(current, None)
+                continue
+            known = self._dirs.get(current, (None, set()))[1]
+            self._dirs[current] = (mtime, names)
+            for name in names - known:
+                yield os.path.join(current, name)
+
+    def changes(self, timeout=None):
+        """
+        Ждет до timeout секунд и возвращает изменения
+
+        Returns:
+            list: Пары (путь к WebP файлу, запись завершена)
+        """
+        now = time.monotonic()
+        if now < self._next_poll:
+            wait = self._next_poll - now
+            if timeout is not None and timeout < wait:
+                time.sleep(timeout)
+                return []
+            time.sleep(wait)
+        self._next_poll = time.monotonic() + self.interval
+
+        changed = []
+        recent = time.time() - MTIME_GRANULARITY
+        for directory, (mtime, _) in list(self._dirs.items()):
+            try:
+                current = os.stat(directory).st_mtime
+            except OSError:
+                del self._dirs[directory]
+                continue
+            if current != mtime or current >= recent:
+                changed.extend((path, True) for path in self._scan(directory))
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Отслеживание через inotify (Linux)
+
+    Каждая директория дерева получает свой watch; новые директории
+    добавляются по событиям, а уже лежащие в них файлы выдаются сразу,
+    так как могли появиться до установки watch.
+
+    Args:
+        directory (str): Корень отслеживаемого дерева
+
+    Raises:
+        OSError: inotify недоступен или исчерпан лимит fs.inotify.max_user_watches
+    """
+
+    name = 'inotify'
+
+    def __init__(self, directory):
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify недоступен")
+        self._libc = libc
+        self._ctypes = ctypes
+        self.root = directory
+        self._watches = {}  # дескриптор watch -> директория
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        try:
+            list(self._add_tree(directory))
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def _add_watch(self, directory):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            errno = self._ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self._watches[wd] = directory
+
+    def _add_tree(self, directory):
+        """Добавляет watch на директорию с поддиректориями и выдает лежащие в ней WebP файлы"""
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            try:
+                self._add_watch(current)
+            except FileNotFoundError:
+                continue
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                stack.append(entry.path)
+                            elif is_webp_name(entry.name) and entry.is_file():
+                                yield entry.path
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+
+    def changes(self, timeout=None):
+        """
+        Ждет событий до timeout секунд
+
+        Returns:
+            list: Пары (путь к WebP файлу, запись завершена)
+        """
+        import select
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, INOTIFY_READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        import struct
+
+        changed = []
+        offset = 0
+        header_size = struct.calcsize('iIII')
+        while offset + header_size <= len(data):
+            wd, mask, _, length = struct.unpack_from('iIII', data, offset)
+            name = data[offset + header_size:offset + header_size + length].rstrip(b'\0')
+            offset += header_size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Очередь ядра переполнилась и события потеряны: один раз перечитываем дерево
+                changed.extend((path, True) for path in iter_webp_files(self.root))
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    changed.extend((file_path, True) for file_path in self._add_tree(path))
+            elif is_webp_name(path):
+                changed.append((path, bool(mask & (IN_CLOSE_WRITE | IN_MOVED_TO))))
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def _ignore_interrupt():
+    """Ctrl+C останавливает отслеживание в основном процессе, рабочие дописывают начатые файлы"""
+    import signal
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def open_watcher(directory, poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """
+    Начинает отслеживание дерева: inotify, если доступен, иначе опрос
+
+    События, произошедшие после вызова, не теряются, поэтому наблюдатель
+    открывается до конвертации уже лежащих в папке файлов.
+
+    Args:
+        directory (str): Корень дерева
+        poll_interval (float): Период опроса, если inotify недоступен
+        polling (bool): Всегда использовать опрос (сетевые диски)
+    """
+    if not polling and hasattr(os, 'O_CLOEXEC'):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️ inotify недоступен ({e}), папка отслеживается опросом")
+    return PollingWatcher(directory, poll_interval)
+
+
+def iter_arrivals(watcher, convert_func, jobs=None, debounce=DEFAULT_DEBOUNCE,
+                  stop_event=None, max_pending=None, sizes=None, **kwargs):
+    """
+    Конвертирует новые файлы по мере появления
+
+    Args:
+        watcher: Наблюдатель из open_watcher (закрывается по завершении)
+        convert_func (callable): Функция конвертации одного файла, объявленная на уровне модуля
+        jobs (int, optional): Количество процессов (по умолчанию число ядер CPU).
+            При jobs=1 файлы конвертируются в текущем процессе
+        debounce (float): Сколько секунд файл должен оставаться неизменным
+        stop_event (threading.Event, optional): Остановить отслеживание
+        max_pending (int, optional): Ограничение очереди задач пула
+            (по умолчанию jobs * PENDING_PER_JOB)
+        sizes (list, optional): Размеры результата (нужны для проверки, сконвертирован ли файл)
+        **kwargs: Дополнительные параметры для convert_func
+
+    Yields:
+        tuple: (путь к файлу, результат convert_func) в порядке завершения
+    """
+    from parallel import default_jobs, PENDING_PER_JOB
+    from encoders import get_encoder
+
+    extension = get_encoder(kwargs.get('output_format')).extension
+    if jobs is None:
+        jobs = default_jobs()
+    if max_pending is None:
+        max_pending = jobs * PENDING_PER_JOB
+    if sizes is not None:
+        kwargs['sizes'] = sizes
+
+    debouncer = Debouncer(debounce)
+    ready = collections.deque()
+    pending = {}
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=_ignore_interrupt)
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if len(pending) < max_pending:
+                timeout = debouncer.timeout()
+                timeout = STOP_CHECK_INTERVAL if timeout is None else min(timeout, STOP_CHECK_INTERVAL)
+                if pending:
+                    timeout = min(timeout, RESULT_CHECK_INTERVAL)
+                for path, complete in watcher.changes(timeout):
+                    debouncer.touch(path, complete)
+                for path in debouncer.pop_ready():
+                    if not is_up_to_date(path, sizes, extension):
+                        ready.append(path)
+            else:
+                # Пул занят: события не читаются, пока не освободится место
+                from concurrent.futures import wait, FIRST_COMPLETED
+
+                wait(pending, timeout=STOP_CHECK_INTERVAL, return_when=FIRST_COMPLETED)
+
+            while ready and len(pending) < max_pending:
+                path = ready.popleft()
+                if executor is None:
+                    yield path, convert_func(path, **kwargs)
+                else:
+                    pending[executor.submit(convert_func, path, **kwargs)] = path
+
+            for future in [future for future in pending if future.done()]:
+                path = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"❌ Ошибка в рабочем процессе для {path}: {e}")
+                    result = False
+                yield path, result
+
+        # Остановка: дожидаемся уже поданных файлов, новые не берем
+        from concurrent.futures import as_completed
+
+        for future in as_completed(list(pending)):
+            path = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка в рабочем процессе для {path}: {e}")
+                result = False
+            yield path, result
+    finally:
+        watcher.close()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
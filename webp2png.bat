@@ -45,25 +45,6 @@ if not exist "%script_path%" (
     exit /b 1
 )
 
-python --version >nul 2>&1
-if errorlevel 1 (
-    echo [ERROR] Ошибка: Python не установлен или не добавлен в PATH
-    echo Установите Python с сайта https://python.org
-    timeout /t 5 >nul
-    exit /b 1
-)
-
-python -c "import PIL" >nul 2>&1
-if errorlevel 1 (
-    echo [WARN] Устанавливаем библиотеку Pillow...
-    pip install Pillow
-    if errorlevel 1 (
-        echo [ERROR] Ошибка: Не удалось установить Pillow
-        timeout /t 5 >nul
-        exit /b 1
-    )
-)
-
 echo [INFO] Запуск конвертера WebP в PNG...
 echo [INFO] Выбранный путь: %selected_path%
 if "%delete_original%"=="true" (
@@ -72,7 +53,9 @@ if "%delete_original%"=="true" (
 echo.
 
 REM Формируем команду для Python скрипта
-set "python_cmd=python "%script_path%""
+REM --use-service: если запущен converter_service.py, путь передается ему,
+REM иначе конвертация выполняется в этом процессе
+set "python_cmd=python "%script_path%" --use-service"
 if "%delete_original%"=="true" (
     set "python_cmd=%python_cmd% --delete"
 )
@@ -80,6 +63,27 @@ set "python_cmd=%python_cmd% "%selected_path%""
 
 REM Выполняем команду
 %python_cmd%
+REM Python не проверяется заранее: cmd возвращает 9009, если команда не найдена
+if errorlevel 9009 (
+    echo [ERROR] Ошибка: Python не установлен или не добавлен в PATH
+    echo Установите Python с сайта https://python.org
+    timeout /t 5 >nul
+    exit /b 1
+)
+if errorlevel 1 (
+    REM Pillow проверяется только после неудачной конвертации, а не при каждом запуске
+    python -c "import PIL" >nul 2>&1
+    if errorlevel 1 (
+        echo [WARN] Устанавливаем библиотеку Pillow...
+        pip install Pillow
+        if errorlevel 1 (
+            echo [ERROR] Ошибка: Не удалось установить Pillow
+            timeout /t 5 >nul
+            exit /b 1
+        )
+        %python_cmd%
+    )
+)
 
 echo.
 echo [OK] Готово! Окно закроется автоматически через 3 секунды...
@@ -6,86 +6,40 @@
 
 import sys
 import os
-from PIL import Image
-import argparse
+# Pillow, argparse и модули пакетной обработки импортируются там, где нужны:
+# запуск для одного файла не должен платить за импорт того, что не используется
 
-def convert_webp_to_png(input_path, output_path=None, delete_original=False):
-    """
-    Конвертирует WebP файл в PNG формат
-    
-    Args:
-        input_path (str): Путь к входному WebP файлу
-        output_path (str, optional): Путь для выходного PNG файла
-        delete_original (bool): Удалить исходный файл после конвертации
-    """
-    try:
-        with Image.open(input_path) as img:
-            if output_path is None:
-                base_name = os.path.splitext(input_path)[0]
-                output_path = f"{base_name}.png"
-            
-            if img.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            img.save(output_path, 'PNG', optimize=True)
-            print(f"[OK] Успешно конвертировано: {input_path} -> {output_path}")
-            
-            # Удаляем исходный файл если требуется
-            if delete_original:
-                try:
-                    os.remove(input_path)
-                    print(f"🗑️  Исходный файл удален: {input_path}")
-                except Exception as e:
-                    print(f"⚠️  Не удалось удалить исходный файл {input_path}: {str(e)}")
-            
-            return True
-            
-    except Exception as e:
-        print(f"[ERROR] Ошибка при конвертации {input_path}: {str(e)}")
-        return False
+# Функции движка (conversion.py), доступные и из этого модуля
+ENGINE_NAMES = ('convert_webp_to_png', 'process_directory', 'watch_directory')
+
+def __getattr__(name):
+    # Движок импортируется при первом обращении, а не при запуске скрипта
+    if name in ENGINE_NAMES:
+        import conversion
+        
+        return getattr(conversion, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def process_directory(directory_path, delete_original=False):
+def report_missing_pillow():
     """
-    Обрабатывает все WebP файлы в директории
+    После неудачной конвертации подсказывает, если причина в отсутствии Pillow
     
-    Args:
-        directory_path (str): Путь к директории
-        delete_original (bool): Удалить исходные файлы после конвертации
+    Зависимости не проверяются при каждом запуске, только когда что-то пошло не так.
     """
-    if not os.path.isdir(directory_path):
-        print(f"❌ Ошибка: {directory_path} не является директорией")
-        return False
-    
-    webp_files = []
-    for root, dirs, files in os.walk(directory_path):
-        for file in files:
-            if file.lower().endswith('.webp'):
-                webp_files.append(os.path.join(root, file))
-    
-    if not webp_files:
-        print(f"📁 В директории {directory_path} не найдено WebP файлов")
-        return True
-    
-    print(f"[INFO] Найдено {len(webp_files)} WebP файлов для конвертации")
-    print()
-    
-    success_count = 0
-    for webp_file in webp_files:
-        if convert_webp_to_png(webp_file, delete_original=delete_original):
-            success_count += 1
-        print()
-    
-    print(f"[INFO] Результат: {success_count}/{len(webp_files)} файлов успешно конвертировано")
-    return success_count == len(webp_files)
+    from dependencies import pillow_missing
+    
+    if pillow_missing():
+        print("❌ Ошибка: Библиотека Pillow не установлена. Установите: pip install Pillow")
 
 def main():
+    import argparse
+    from png_presets import PNG_PRESETS, DEFAULT_PNG_SPEED, ZLIB_STRATEGIES
+    from encoders import ENCODERS, DEFAULT_FORMAT
+    from animation import ANIMATION_MODES, DEFAULT_ANIMATION_MODE
+    from banded_png import DEFAULT_LOW_MEMORY_PIXELS
+    from resize import parse_max_size, parse_scale
+    from dedup import DEDUP_MODES, DEFAULT_DEDUP_MODE
+    
     parser = argparse.ArgumentParser(
         description='Конвертер WebP файлов в PNG формат',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -94,16 +48,208 @@ def main():
   %(prog)s file.webp                    # Конвертировать один файл
   %(prog)s file.webp --delete          # Конвертировать и удалить исходный
   %(prog)s folder/ --delete            # Конвертировать все WebP в папке
+  %(prog)s folder/ --jobs 4            # Конвертировать папку в 4 процесса
+  %(prog)s folder/ --cache             # Пропустить уже сконвертированные файлы
+  %(prog)s folder/ --png-speed fastest # Быстрое сжатие PNG
+  %(prog)s folder/ --format jpeg       # JPEG вместо PNG
+  %(prog)s folder/ --profile           # Показать время по этапам
+  %(prog)s file.webp --keep-alpha      # Сохранить прозрачность
   %(prog)s folder/ --output output.png # Указать выходной файл
+  %(prog)s spool/ --watch             # Конвертировать новые файлы по мере появления
+  %(prog)s folder/ --scan            # Опись папки и оценка времени без конвертации
+  %(prog)s - < in.webp > out.png       # Из stdin в stdout
+  %(prog)s - --tar < in.tar > out.tar  # tar архив WebP в tar архив PNG
+  %(prog)s --check-deps                # Проверить наличие Pillow
         """
     )
     
-    parser.add_argument('input', help='Путь к WebP файлу или папке')
-    parser.add_argument('-o', '--output', help='Путь для выходного PNG файла')
+    parser.add_argument('input', nargs='?', help='Путь к WebP файлу или папке, - для чтения из stdin')
+    parser.add_argument('-o', '--output', help='Путь для выходного PNG файла, - для записи в stdout')
     parser.add_argument('-d', '--delete', action='store_true', 
                        help='Удалить исходные WebP файлы после конвертации')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                       help='Количество параллельных процессов для папки (по умолчанию число ядер CPU, 1 - последовательно)')
+    parser.add_argument('--memory-limit', metavar='MB',
+                       help='Не запускать новый файл, если оценка памяти для файлов в работе (по размеру из заголовка WebP) превысит MB мегабайт; auto - половина свободной памяти. Файлы запускаются от больших к меньшим')
+    parser.add_argument('--auto-jobs', action='store_true',
+                       help='Подбирать число одновременно конвертируемых файлов (от 1 до --jobs) по замеренной скорости')
+    parser.add_argument('--cache', action='store_true',
+                       help='Пропускать файлы, не изменившиеся с прошлого запуска (манифест в корне папки)')
+    parser.add_argument('--cache-hash', action='store_true',
+                       help='Дополнительно сверять содержимое файлов по хэшу')
+    parser.add_argument('--rebuild-cache', action='store_true',
+                       help='Сбросить кэш и сконвертировать все файлы заново')
+    parser.add_argument('--format', choices=sorted(ENCODERS), default=DEFAULT_FORMAT,
+                       help='Выходной формат: png (по умолчанию), jpeg, webp (без потерь) или tiff; APNG, --smallest и запись полосами - только для png, из анимации в другие форматы сохраняется первый кадр')
+    parser.add_argument('--png-speed', choices=sorted(PNG_PRESETS), default=DEFAULT_PNG_SPEED,
+                       help='Пресет сжатия выходного формата: fastest - быстро, balanced - компромисс, smallest - минимальный размер (по умолчанию)')
+    parser.add_argument('--compress-level', type=int, choices=range(10), metavar='0-9',
+                       help='Явный уровень сжатия zlib, переопределяет пресет')
+    parser.add_argument('--compress-strategy', choices=sorted(ZLIB_STRATEGIES),
+                       help='Стратегия сжатия zlib')
+    parser.add_argument('--smallest', action='store_true',
+                       help='Перебрать способы кодирования (уровни и стратегии zlib, палитра, оттенки серого, 1 бит) и сохранить наименьший PNG; найденный способ кэшируется по хэшу содержимого')
+    parser.add_argument('--smallest-cache', metavar='DIR',
+                       help='Каталог кэша --smallest (по умолчанию ~/.cache/webp2png/smallest)')
+    parser.add_argument('--keep-alpha', action='store_true',
+                       help='Сохранить прозрачность (RGBA PNG) вместо наложения на фон')
+    parser.add_argument('--background', default='white',
+                       help='Цвет фона для изображений с прозрачностью: имя или #RRGGBB (по умолчанию white)')
+    parser.add_argument('--dedup', action='store_true',
+                       help='Конвертировать одинаковые по содержимому файлы папки один раз, остальные PNG создать жесткими ссылками')
+    parser.add_argument('--dedup-mode', choices=DEDUP_MODES, default=DEFAULT_DEDUP_MODE,
+                       help='Как создавать PNG для дубликатов: link - жесткие ссылки (по умолчанию, при невозможности - копии), copy - копии')
+    parser.add_argument('--output-dir', metavar='DIR',
+                       help='Писать PNG в DIR (лучше на другом диске), повторяя структуру папок; директории создаются заранее')
+    parser.add_argument('--staging-dir', metavar='DIR',
+                       help='Для --output-dir: писать PNG сначала в DIR на быстром локальном диске и переносить в --output-dir в фоне')
+    parser.add_argument('--overlap-io', action='store_true',
+                       help='Читать и записывать файлы в отдельных потоках параллельно с конвертацией (для сетевых дисков)')
+    parser.add_argument('--io-threads', type=int, default=4,
+                       help='Количество потоков чтения и записи для --overlap-io (по умолчанию %(default)s)')
+    parser.add_argument('--io-buffer', type=int, default=256, metavar='MB',
+                       help='Максимальный объем прочитанных и еще не записанных данных для --overlap-io (по умолчанию %(default)s)')
+    parser.add_argument('--distributed', action='store_true',
+                       help='Распределенный режим: несколько узлов обрабатывают одну папку на общем диске, разбирая файлы через аренду')
+    parser.add_argument('--node-id',
+                       help='Идентификатор узла для --distributed (по умолчанию имя хоста и PID)')
+    parser.add_argument('--lease-ttl', type=float, default=120, metavar='SECONDS',
+                       help='Через сколько секунд без продления аренда упавшего узла забирается другими (по умолчанию %(default)g)')
+    parser.add_argument('--journal', action='store_true',
+                       help='Вести журнал обработки папки, чтобы прерванный запуск можно было продолжить с --resume')
+    parser.add_argument('--resume', action='store_true',
+                       help='Продолжить прерванный запуск по журналу: сконвертированные файлы не обрабатываются повторно')
+    parser.add_argument('--animation', choices=ANIMATION_MODES, default=DEFAULT_ANIMATION_MODE,
+                       help='Анимированные WebP: apng - в APNG (по умолчанию), frames - в отдельные PNG кадры, first - только первый кадр')
+    parser.add_argument('--low-memory', action='store_true',
+                       help='Всегда писать PNG полосами строк для минимального потребления памяти')
+    parser.add_argument('--low-memory-threshold', type=float, default=DEFAULT_LOW_MEMORY_PIXELS / 1e6,
+                       metavar='MP',
+                       help='Автоматически включать экономию памяти для изображений от MP мегапикселей (по умолчанию %(default)g)')
+    parser.add_argument('--max-size', action='append', type=parse_max_size, metavar='WxH',
+                       help='Уменьшить изображение, вписав в WxH (N - в квадрат NxN) с сохранением пропорций; можно указать несколько раз - все размеры получаются из одного декодирования и сохраняются как name_WxH.png')
+    parser.add_argument('--scale', action='append', type=parse_scale, metavar='F',
+                       help='Уменьшить изображение в F раз (0.5 или 50%%); можно указать несколько раз и сочетать с --max-size')
+    parser.add_argument('--profile', action='store_true',
+                       help='Замерить время этапов конвертации (чтение, декодирование, преобразование, сжатие, запись, удаление)')
+    parser.add_argument('--profile-trace', metavar='FILE',
+                       help='Сохранить замеры по каждому файлу в JSON или CSV (по расширению), включает --profile')
+    parser.add_argument('--tar', action='store_true',
+                       help='Вход - tar архив WebP (файл или - для stdin), выход - tar архив PNG (-o, по умолчанию stdout); элементы конвертируются по одному без временных файлов')
+    parser.add_argument('--watch', action='store_true',
+                       help='После конвертации папки отслеживать ее и конвертировать новые WebP файлы по мере появления (до Ctrl+C)')
+    parser.add_argument('--debounce', type=float, metavar='SECONDS',
+                       help='Сколько секунд новый файл должен оставаться неизменным перед конвертацией в --watch (по умолчанию 0.5)')
+    parser.add_argument('--poll-interval', type=float, metavar='SECONDS',
+                       help='Период опроса папки в --watch, если inotify недоступен (по умолчанию 1)')
+    parser.add_argument('--watch-poll', action='store_true',
+                       help='Отслеживать папку опросом вместо inotify (сетевые диски, где события от других машин не приходят)')
+    parser.add_argument('--use-service', action='store_true',
+                       help='Передать конвертацию запущенному сервису (converter_service.py), иначе конвертировать самостоятельно')
+    parser.add_argument('--scan', action='store_true',
+                       help='Не конвертировать, а составить опись: количество WebP, мегапиксели, анимация, прозрачность, поврежденные файлы и оценка времени конвертации (читаются только заголовки)')
+    parser.add_argument('--calibration', metavar='FILE',
+                       help='Скорость для оценки времени --scan: результаты benchmark.py run --json или трасса --profile-trace')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                       help='Не печатать строку на каждый файл: только ошибки, строка прогресса и итог')
+    parser.add_argument('--json', action='store_true',
+                       help='Вывести итог в JSON в stdout (остальные сообщения - в stderr), включает --quiet')
+    parser.add_argument('--check-deps', action='store_true',
+                       help='Проверить наличие Pillow и поддержку WebP и выйти')
     
     args = parser.parse_args()
+    if args.check_deps:
+        from dependencies import check_dependencies
+        return 0 if check_dependencies(install=False) else 1
+    if args.input is None:
+        parser.error('не указан путь к WebP файлу или папке')
+    if args.scan:
+        from conversion import scan_input
+        
+        return scan_input(args)
+    if args.memory_limit is not None:
+        from scheduling import parse_memory_limit
+        
+        try:
+            args.memory_limit = parse_memory_limit(args.memory_limit)
+        except ValueError as e:
+            parser.error(f'--memory-limit: {e}')
+    
+    from encoders import save_options
+    from image_ops import parse_color
+    from profiling import BatchProfile
+    
+    profile = BatchProfile() if args.profile or args.profile_trace else None
+    try:
+        background = parse_color(args.background)
+    except ValueError:
+        print(f"❌ Ошибка: Неизвестный цвет фона {args.background}")
+        return 1
+    
+    try:
+        png_options = save_options(args.format, args.png_speed, args.compress_level, args.compress_strategy)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.smallest and args.format != 'png':
+        parser.error('--smallest ищет наименьший PNG и работает только с --format png')
+    
+    # Параметры конвертации, общие для одного файла и папки
+    convert_options = {
+        'png_options': png_options,
+        'keep_alpha': args.keep_alpha,
+        'background': background,
+        'animation': args.animation,
+        'low_memory_pixels': 0 if args.low_memory else int(args.low_memory_threshold * 1e6),
+        'sizes': (args.max_size or []) + (args.scale or []) or None,
+        'smallest': None,
+        'output_format': args.format,
+    }
+    if args.smallest:
+        from png_search import search_options
+        from parallel import default_jobs
+        from discovery import is_webp_name
+        
+        # Потоки перебора делят ядра с процессами пакета, один файл получает все ядра
+        single = not args.tar and (args.input == '-' or (os.path.isfile(args.input) and is_webp_name(args.input)))
+        convert_options['smallest'] = search_options(args.smallest_cache, 1 if single else args.jobs or default_jobs())
+    
+    writes_stdout = args.output == '-' or (args.output is None and (args.input == '-' or args.tar))
+    if args.json and writes_stdout:
+        parser.error('--json выводит итог в stdout, поэтому результат нужно записать в файл (-o)')
+    
+    report = None
+    if args.quiet or args.json:
+        from batch import BatchReport
+        
+        report = BatchReport()
+    if not args.json:
+        return convert_input(args, convert_options, profile, report)
+    
+    # stdout занимает итог в JSON, все остальные сообщения идут в stderr
+    import contextlib
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        exit_code = convert_input(args, convert_options, profile, report)
+    print(report.to_json())
+    return exit_code
+
+def convert_input(args, convert_options, profile=None, report=None):
+    """
+    Конвертирует файл или папку из аргументов командной строки
+    
+    Returns:
+        int: Код возврата
+    """
+    from discovery import is_webp_name
+    from conversion import (convert_webp_to_png, process_directory, watch_directory,
+                            convert_via_service, convert_stream_input)
+    
+    if args.output_dir and (args.tar or '-' in (args.input, args.output) or args.watch or args.use_service):
+        print("❌ Ошибка: --output-dir несовместим с --tar, stdin/stdout, --watch и --use-service")
+        return 1
+    if args.tar or '-' in (args.input, args.output):
+        # Путь '-' - stdin/stdout
+        return convert_stream_input(args, convert_options, report)
     
     if not os.path.exists(args.input):
         print(f"❌ Ошибка: Путь {args.input} не существует")
@@ -111,17 +257,96 @@ def main():
     
     if os.path.isfile(args.input):
         # Обработка одного файла
-        if not args.input.lower().endswith('.webp'):
-            print(f"❌ Ошибка: {args.input} не является WebP файлом")
+        if not is_webp_name(args.input):
+            from archives import archive_format
+            
+            if archive_format(args.input) is not None:
+                if args.output_dir:
+                    print("❌ Ошибка: архив конвертируется в архив (-o), --output-dir не применяется")
+                    return 1
+                return convert_stream_input(args, convert_options, report)
+            print(f"❌ Ошибка: {args.input} не является WebP файлом или архивом")
+            return 1
+        if args.watch:
+            print("[ERROR] --watch отслеживает папку, а не отдельный файл")
             return 1
         
-        success = convert_webp_to_png(args.input, args.output, args.delete)
+        if args.use_service:
+            result = convert_via_service(args, convert_options, report)
+            if result is not None:
+                return 0 if result[0] == result[1] else 1
+        
+        output_path = args.output
+        if args.output_dir:
+            if args.output:
+                print("❌ Ошибка: укажите либо --output, либо --output-dir")
+                return 1
+            from encoders import get_encoder
+            
+            os.makedirs(args.output_dir, exist_ok=True)
+            output_path = os.path.join(args.output_dir, os.path.splitext(os.path.basename(args.input))[0] + get_encoder(args.format).extension)
+        
+        if report is not None:
+            from batch import convert_file
+            
+            record = convert_file(convert_webp_to_png, args.input, output_path=output_path,
+                                  delete_original=args.delete, **convert_options)
+            report.add(record)
+            report.close()
+            success, timings = record.ok, record.timings
+        else:
+            from profiling import NULL_PROFILER, StageProfiler
+            
+            profiler = StageProfiler() if profile is not None else NULL_PROFILER
+            success = convert_webp_to_png(args.input, output_path, args.delete,
+                                          profiler=profiler, **convert_options)
+            timings = profiler.timings
+        if profile is not None:
+            profile.add(args.input, timings)
+            profile.print_report(args.profile_trace)
+        if not success:
+            report_missing_pillow()
         return 0 if success else 1
     
     elif os.path.isdir(args.input):
         # Обработка директории
-        success = process_directory(args.input, args.delete)
-        return 0 if success else 1
+        # Параметры, которые имеют смысл только для папки
+        batch_options = {
+            'dedup': args.dedup_mode if args.dedup else None,
+            'overlap_io': args.overlap_io,
+            'io_threads': args.io_threads,
+            'io_buffer_bytes': args.io_buffer * 1024 * 1024,
+            'distributed': args.distributed,
+            'node_id': args.node_id,
+            'lease_ttl': args.lease_ttl,
+            'journal': args.journal,
+            'resume': args.resume,
+            'memory_budget': args.memory_limit,
+            'auto_jobs': args.auto_jobs,
+            'output_dir': args.output_dir,
+            'staging_dir': args.staging_dir,
+        }
+        result = convert_via_service(args, convert_options, report) if args.use_service and not args.watch else None
+        if result is None and args.watch:
+            directory_options = dict(batch_options, use_cache=args.cache, cache_hash=args.cache_hash,
+                                     rebuild_cache=args.rebuild_cache, profile=profile)
+            result = watch_directory(args.input, args.delete, args.jobs, args.debounce,
+                                     args.poll_interval, args.watch_poll, report=report,
+                                     directory_options=directory_options, **convert_options)
+        elif result is None:
+            result = process_directory(args.input, args.delete, args.jobs,
+                                       args.cache, args.cache_hash, args.rebuild_cache,
+                                       profile=profile, report=report, **batch_options, **convert_options)
+        if profile is not None:
+            profile.print_report(args.profile_trace)
+        if result is None:
+            return 1
+        
+        success_count, total_count = result
+        print(f"[INFO] Результат: {success_count}/{total_count} файлов успешно конвертировано")
+        if success_count < total_count:
+            report_missing_pillow()
+        return 0 if success_count == total_count else 1
     
     else:
         print(f"❌ Ошибка: {args.input} не является файлом или директорией")
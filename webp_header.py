@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Чтение размеров WebP из заголовка RIFF без декодирования
+
+Image.open для WebP не ленив: Pillow читает файл целиком и создает
+демультиплексор libwebp. Размер изображения при этом записан в первых
+десятках байт файла, поэтому для оценки стоимости конвертации достаточно
+прочитать первый чанк (VP8, VP8L или VP8X). Для расширенного формата (VP8X)
+сжатие и количество кадров уточняются по заголовкам следующих чанков.
+"""
+
+import struct
+
+# RIFF заголовок (12 байт), заголовок чанка (8 байт) и начало его данных
+HEADER_BYTES = 30
+
+
+class WebPHeader:
+    """
+    Сведения из заголовка WebP
+
+    Attributes:
+        width (int): Ширина (для анимации - ширина холста)
+        height (int): Высота
+        alpha (bool): Есть альфа-канал
+        animated (bool): Файл содержит анимацию
+        lossless (bool): Сжатие без потерь (VP8L); для VP8X известно после read_extended
+        extended (bool): Расширенный формат (VP8X): прозрачность, метаданные или анимация
+        frames (int): Количество кадров (считается только при read_webp_header(with_frames=True))
+        declared_size (int): Размер файла по заголовку RIFF
+    """
+
+    __slots__ = ('width', 'height', 'alpha', 'animated', 'lossless', 'extended', 'frames', 'declared_size')
+
+    def __init__(self, width, height, alpha=False, animated=False, lossless=False, extended=False,
+                 declared_size=None):
+        self.width = width
+        self.height = height
+        self.alpha = alpha
+        self.animated = animated
+        self.lossless = lossless
+        self.extended = extended
+        self.frames = 1
+        self.declared_size = declared_size
+
+    @property
+    def pixels(self):
+        return self.width * self.height
+
+    def __repr__(self):
+        return f"WebPHeader({self.width}x{self.height}, alpha={self.alpha}, animated={self.animated})"
+
+
+def parse_webp_header(data):
+    """
+    Разбирает начало WebP файла
+
+    Args:
+        data (bytes): Не меньше HEADER_BYTES первых байт файла
+
+    Returns:
+        WebPHeader: Размер и признаки изображения
+
+    Raises:
+        ValueError: Данные не являются WebP или заголовок поврежден
+    """
+    if len(data) < HEADER_BYTES or data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        raise ValueError("не является WebP файлом")
+    fourcc = data[12:16]
+    chunk = data[20:]
+    header = _parse_first_chunk(fourcc, chunk)
+    header.declared_size = 8 + struct.unpack('<I', data[4:8])[0]
+    return header
+
+
+def _parse_first_chunk(fourcc, chunk):
+
+    if fourcc == b'VP8X':
+        flags = chunk[0]
+        width = 1 + int.from_bytes(chunk[4:7], 'little')
+        height = 1 + int.from_bytes(chunk[7:10], 'little')
+        return WebPHeader(width, height, alpha=bool(flags & 0x10), animated=bool(flags & 0x02), extended=True)
+
+    if fourcc == b'VP8L':
+        if chunk[0] != 0x2f:
+            raise ValueError("поврежден заголовок VP8L")
+        bits = struct.unpack('<I', chunk[1:5])[0]
+        width = 1 + (bits & 0x3fff)
+        height = 1 + ((bits >> 14) & 0x3fff)
+        return WebPHeader(width, height, alpha=bool((bits >> 28) & 1), lossless=True)
+
+    if fourcc == b'VP8 ':
+        if chunk[3:6] != b'\x9d\x01\x2a':
+            raise ValueError("поврежден заголовок VP8")
+        width, height = struct.unpack('<HH', chunk[6:10])
+        return WebPHeader(width & 0x3fff, height & 0x3fff)
+
+    raise ValueError(f"неизвестный чанк {fourcc!r}")
+
+
+def read_extended(f, header, with_frames=False):
+    """
+    Уточняет заголовок расширенного WebP (VP8X) по заголовкам следующих чанков
+
+    VP8X хранит только размер холста и флаги. Сжатие определяется по первому
+    чанку изображения (VP8L - без потерь, VP8 - с потерями): он идет после
+    ICCP, ANIM, EXIF и ALPH, а у анимации - внутри первого кадра ANMF.
+    Данные чанков пропускаются перемоткой, поэтому время не зависит от
+    размера кадров.
+
+    Args:
+        f: Файл WebP, открытый в двоичном режиме с поддержкой перемотки
+        header (WebPHeader): Заголовок из parse_webp_header, дополняется на месте
+        with_frames (bool): Посчитать кадры анимации (чанки ANMF) до конца файла
+
+    Returns:
+        WebPHeader: Тот же заголовок
+    """
+    frames = 0
+    found = False
+    f.seek(12)
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            break
+        fourcc = chunk_header[:4]
+        size = struct.unpack('<I', chunk_header[4:])[0]
+        if fourcc == b'ANMF':
+            frames += 1
+            if not found:
+                # Вложенные чанки первого кадра идут после 16 байт заголовка кадра
+                f.seek(16, 1)
+                continue
+        elif fourcc in (b'VP8L', b'VP8 ') and not found:
+            found = True
+            header.lossless = fourcc == b'VP8L'
+            if not with_frames:
+                break
+        # Данные чанка выравниваются до четного размера
+        f.seek(size + (size & 1), 1)
+    if with_frames and header.animated:
+        header.frames = frames
+    return header
+
+
+def read_webp_header(path, with_frames=False):
+    """
+    Читает размер WebP файла из первых HEADER_BYTES байт
+
+    Args:
+        path (str): Путь к файлу
+        with_frames (bool): Для анимации посчитать кадры по заголовкам чанков
+            (для VP8X заголовки чанков читаются в любом случае, чтобы узнать сжатие)
+
+    Raises:
+        OSError: Файл не удалось прочитать
+        ValueError: Файл не является WebP
+    """
+    with open(path, 'rb') as f:
+        header = parse_webp_header(f.read(HEADER_BYTES))
+        if header.extended:
+            read_extended(f, header, with_frames)
+    return header